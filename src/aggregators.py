@@ -0,0 +1,217 @@
+import math
+import hashlib
+import sessionization as sessionize
+
+
+HLL_PRECISION = 10                      # 2 ** 10 registers, a standard error of about 3%
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_SPARSE_LIMIT = HLL_REGISTERS // 8   # number of distinct values kept exactly before the registers are used
+
+
+class HyperLogLog(object):
+    """
+        Estimates the number of distinct values in bounded memory. The values are kept in a set until there are more
+        than HLL_SPARSE_LIMIT of them (most sessions request a few documents only), then they are counted by
+        HLL_REGISTERS one byte registers. The hash is the first 8 bytes of the MD5 digest, so the estimate does not
+        depend on the hash seed of the process and the output is reproducible.
+    """
+    __slots__ = ('values', 'registers')
+
+    def __init__(self):
+        self.values = set()
+        self.registers = None
+
+    def add(self, value):
+        if self.registers is None:
+            self.values.add(value)
+            if len(self.values) > HLL_SPARSE_LIMIT:
+                self.registers = bytearray(HLL_REGISTERS)
+                for value in self.values:
+                    self.add_to_registers(value)
+                self.values = None
+        else:
+            self.add_to_registers(value)
+
+    def add_to_registers(self, value):
+        hashed = int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+        index = hashed >> (64 - HLL_PRECISION)
+        rest = hashed & ((1 << (64 - HLL_PRECISION)) - 1)
+        rank = 64 - HLL_PRECISION - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        """
+        :return: the number of distinct values added, exact while they are kept in a set
+        """
+        if self.registers is None:
+            return len(self.values)
+        alpha = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+        estimate = alpha * HLL_REGISTERS * HLL_REGISTERS / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * HLL_REGISTERS and zeros:
+            estimate = HLL_REGISTERS * math.log(HLL_REGISTERS / zeros)
+        return int(round(estimate))
+
+
+def get_cik(values):
+    return values[0]
+
+
+def get_document(values):
+    return '%s|%s|%s' % values[:3]
+
+
+class DistinctCount(object):
+    """
+        Number of distinct values of a field in a session, counted exactly with a set or approximately with a
+        HyperLogLog.
+    """
+
+    def __init__(self, name, get_value, approximate=False):
+        self.name = name
+        self.get_value = get_value
+        self.approximate = approximate
+
+    def new(self):
+        return HyperLogLog() if self.approximate else set()
+
+    def add(self, state, values):
+        state.add(self.get_value(values))
+        return state
+
+    def format(self, state):
+        return '%d' % (state.count() if self.approximate else len(state))
+
+
+class SumSize(object):
+    """
+        Total size in bytes of the documents requested in a session; an empty, malformed or infinite size (float also
+        reads 'inf' and 'nan') counts as zero, and so does a size which would make the total overflow to infinity.
+    """
+    name = 'sum_size'
+
+    def new(self):
+        return 0
+
+    def add(self, state, values):
+        try:
+            size = float(values[3])
+        except ValueError:
+            return state
+        total = state + size
+        return total if math.isfinite(total) else state
+
+    def format(self, state):
+        return '%d' % state
+
+
+class TopCiks(object):
+    """
+        The k most requested CIKs of a session with their number of requests, written as 'cik:count' separated by
+        semicolons, the most requested first and ties broken by the first requested.
+    """
+
+    def __init__(self, k):
+        self.name = 'top_ciks:%d' % k
+        self.k = k
+
+    def new(self):
+        return {}
+
+    def add(self, state, values):
+        # cik -> [number of requests, order of first request]
+        cik_count = state.get(values[0])
+        if cik_count is None:
+            state[values[0]] = [1, len(state)]
+        else:
+            cik_count[0] += 1
+        return state
+
+    def format(self, state):
+        ranked = sorted(state.items(), key=lambda r: (-r[1][0], r[1][1]))[:self.k]
+        return ';'.join('%s:%d' % (cik, cik_count[0]) for cik, cik_count in ranked)
+
+
+AGGREGATORS = {
+    'distinct_documents': lambda: DistinctCount('distinct_documents', get_document),
+    'distinct_documents_hll': lambda: DistinctCount('distinct_documents_hll', get_document, True),
+    'distinct_ciks': lambda: DistinctCount('distinct_ciks', get_cik),
+    'distinct_ciks_hll': lambda: DistinctCount('distinct_ciks_hll', get_cik, True),
+    'sum_size': SumSize,
+}
+
+
+def create_aggregator(spec):
+    """
+        Creates an aggregator from its name, or 'top_ciks:k' for the k most requested CIKs.
+
+    :param spec: name of the aggregator
+    :return: an aggregator object with new, add and format methods
+    """
+    name, _, argument = spec.partition(':')
+    if name == 'top_ciks':
+        try:
+            k = int(argument) if argument else 3
+        except ValueError:
+            raise ValueError('top_ciks needs an integer, e.g. top_ciks:3')
+        if k < 1:
+            raise ValueError('top_ciks needs at least one CIK.')
+        return TopCiks(k)
+    if name not in AGGREGATORS or argument:
+        raise ValueError('Unknown aggregate: %s (choose from %s, top_ciks:k)' % (spec, ', '.join(sorted(AGGREGATORS))))
+    return AGGREGATORS[name]()
+
+
+class AggregatedSession(sessionize.Session):
+    """
+        A Session which also carries the state of each aggregator of SessionAggregators. Each SessionAggregators
+        makes its own subclass with the aggregators as class attribute, so the sessions only pay for one more slot.
+    """
+    __slots__ = ('aggregates',)
+    has_aggregates = True
+    aggregators = ()
+
+    def __init__(self, start, end, count, counter):
+        sessionize.Session.__init__(self, start, end, count, counter)
+        self.aggregates = [aggregator.new() for aggregator in self.aggregators]
+
+    def format_aggregates(self):
+        """
+        :return: the extra output columns of the session, each one starting with a comma
+        """
+        return ''.join(',' + aggregator.format(state) for aggregator, state in zip(self.aggregators, self.aggregates))
+
+
+class SessionAggregators(object):
+    """
+        Computes aggregates of the requests of each session in the same pass over the input as the sessions
+        themselves, and writes them as extra output columns after the number of requested documents.
+        process_data_stream reads the requests along with their values (see sessionization.read_requests with fields
+        as value_fields), i.e. their cik, accession, extention and size, and adds them to the session with
+        add_request of this class.
+    """
+
+    def __init__(self, specs):
+        """
+        :param specs: list of aggregator names (see create_aggregator), in the order of their output columns
+        """
+        self.aggregators = [create_aggregator(spec) for spec in specs]
+        self.fields = ['size'] if any(isinstance(a, SumSize) for a in self.aggregators) else []
+        self.session_class = type('AggregatedSession', (AggregatedSession,),
+                                  {'__slots__': (), 'aggregators': tuple(self.aggregators)})
+
+    def add_request(self, ip, date_time, counter, values, inactivity_interval, request_dict, expiration_dict,
+                    expiration_heap):
+        """
+            Same as sessionization.add_request, and adds the values of the request to the aggregates of its session.
+
+        :param values: the cik, accession, extention and size of the request (see sessionization.read_requests with
+                       the fields of this object as value_fields)
+        """
+        sessionize.add_request(ip, date_time, counter, inactivity_interval, request_dict, expiration_dict,
+                               expiration_heap, self.session_class)
+        session_info = request_dict[ip]
+        aggregates = session_info.aggregates
+        for i, aggregator in enumerate(self.aggregators):
+            aggregates[i] = aggregator.add(aggregates[i], values)
@@ -0,0 +1,382 @@
+import numpy as np
+import sessionization as sessionize
+
+
+INVALID_TIME = np.iinfo(np.int64).min     # time of a record with a malformed date or time before it is filled in
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)     # odd multiplier which mixes the 8 byte words of an ip
+IP_END = b'\xff'                           # byte after each ip, which never occurs in UTF-8
+MAX_IP_BYTES = 64                         # longest ip stored as is in the fixed width byte strings of extract_ips
+NEW_LINE, COMMA, DASH, COLON = b'\n,-:'
+DATE_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9]     # positions of the digits in YYYY-MM-DD
+TIME_DIGITS = [0, 1, 3, 4, 6, 7]           # positions of the digits in hh:mm:ss
+# bytes which str.strip may remove from the ends of an ip: ASCII white space, and any byte of a non ASCII character
+STRIPPED_BYTES = np.zeros(256, dtype=bool)
+STRIPPED_BYTES[[9, 10, 11, 12, 13, 28, 29, 30, 31, 32] + list(range(128, 256))] = True
+
+
+def field_bounds(lines, index):
+    """
+        Returns the positions in the block where a field of each line begins and ends.
+
+    :param lines: a tuple (commas, line_starts, line_ends, first_commas, comma_counts) of NumPy arrays where commas
+                  are the positions of the commas in the block and first_commas and comma_counts the index in commas
+                  of the first comma of each line and the number of its commas
+    :param index: index of the field in a line
+    :return: a tuple of NumPy arrays (begins, ends)
+    """
+    commas, line_starts, line_ends, first_commas, comma_counts = lines
+    begins = line_starts if index == 0 else commas[first_commas + index - 1] + 1
+    if not len(commas):
+        return begins, line_ends
+    ends = np.where(comma_counts > index, commas[np.minimum(first_commas + index, len(commas) - 1)], line_ends)
+    return begins, ends
+
+
+def gather(buffer, begins, width):
+    """
+        Returns the width bytes of buffer from each position of begins.
+
+    :param buffer: a NumPy array of bytes
+    :param begins: a NumPy array of positions in buffer
+    :param width: number of bytes from each position
+    :return: a 2D NumPy array of bytes with one row per position
+    """
+    return buffer[begins[:, None] + np.arange(width)]
+
+
+def parse_date_times(buffer, date_bounds, time_bounds):
+    """
+        Converts the date and time fields of the lines of a block to seconds since epoch like
+        sessionization.parse_timestamp. Well-formed fields are converted with vector operations, only the date part
+        is converted once per distinct date, and all other forms go through sessionization.parse_timestamp.
+
+    :param buffer: the block as a NumPy array of UTF-8 bytes
+    :param date_bounds: a tuple of NumPy arrays (begins, ends) of the date field of each line
+    :param time_bounds: a tuple of NumPy arrays (begins, ends) of the time field of each line
+    :return: a NumPy array of seconds since epoch, INVALID_TIME for a malformed date or time
+    """
+    (date_begins, date_ends), (time_begins, time_ends) = date_bounds, time_bounds
+    date_times = np.full(len(date_begins), INVALID_TIME, dtype=np.int64)
+    well_formed = (date_ends - date_begins == 10) & (time_ends - time_begins == 8)
+    candidates = np.flatnonzero(well_formed)
+    dates = gather(buffer, date_begins[candidates], 10)
+    times = gather(buffer, time_begins[candidates], 8)
+    date_digits = dates[:, DATE_DIGITS] - ord('0')      # bytes below '0' wrap around to more than 9
+    time_digits = (times[:, TIME_DIGITS] - ord('0')).astype(np.int64)
+    formed = ((date_digits < 10).all(axis=1) & (dates[:, 4] == DASH) & (dates[:, 7] == DASH) &
+              (time_digits < 10).all(axis=1) & (times[:, 2] == COLON) & (times[:, 5] == COLON))
+    well_formed[candidates[~formed]] = False
+    candidates, date_digits, time_digits = candidates[formed], date_digits[formed], time_digits[formed]
+
+    hours = time_digits[:, 0] * 10 + time_digits[:, 1]
+    minutes = time_digits[:, 2] * 10 + time_digits[:, 3]
+    seconds = time_digits[:, 4] * 10 + time_digits[:, 5]
+    date_codes = date_digits.astype(np.int64) @ (10 ** np.arange(7, -1, -1))     # YYYYMMDD as an integer
+    unique_codes, date_indices = np.unique(date_codes, return_inverse=True)
+    day_offsets = np.empty(len(unique_codes), dtype=np.int64)
+    for i, code in enumerate(unique_codes.tolist()):
+        try:
+            day_offsets[i] = sessionize.parse_timestamp('%04d-%02d-%02d' % (code // 10000, code // 100 % 100,
+                                                                            code % 100), '00:00:00')
+        except ValueError:
+            day_offsets[i] = INVALID_TIME
+    day_offsets = day_offsets[date_indices.reshape(-1)]
+    in_range = (hours <= 23) & (minutes <= 59) & (seconds <= 59) & (day_offsets != INVALID_TIME)
+    date_times[candidates[in_range]] = (day_offsets + hours * 3600 + minutes * 60 + seconds)[in_range]
+
+    for i in np.flatnonzero(~well_formed).tolist():
+        try:
+            date_times[i] = sessionize.parse_timestamp(buffer[date_begins[i]:date_ends[i]].tobytes().decode('utf-8'),
+                                                       buffer[time_begins[i]:time_ends[i]].tobytes().decode('utf-8'))
+        except ValueError:
+            pass
+    return date_times
+
+
+def extract_ips(buffer, ip_bounds, valid, long_ips):
+    """
+        Returns the stripped ip of each valid line of a block as a NumPy array of fixed width byte strings, built with
+        vector operations. An ip which may have white space at one of its ends is stripped by str.strip, and the lines
+        whose ip is blank are marked as not valid. Each ip is followed by IP_END, so that the NUL bytes which pad a
+        fixed width byte string can not be confused with the end of an ip. The strings are at most MAX_IP_BYTES + 1
+        bytes wide, whatever the length of the first field of a corrupt record: a longer ip is replaced by a key made
+        of its number between two IP_END bytes, which can not be the bytes of an ip.
+
+    :param buffer: the block as a NumPy array of UTF-8 bytes
+    :param ip_bounds: a tuple of NumPy arrays (begins, ends) of the ip field of each line
+    :param valid: a NumPy bool array of the lines, updated in place with False for the lines whose ip is blank
+    :param long_ips: a dictionary with the ips longer than MAX_IP_BYTES as the key and their key as value, updated
+                     with the new ones of the block
+    :return: a NumPy bytes array with the UTF-8 encoded ip followed by IP_END of each line
+    """
+    begins, ends = ip_bounds
+    lengths = ends - begins
+    valid &= lengths > 0
+    offsets = np.arange(min(int(lengths.max()), MAX_IP_BYTES) + 1)
+    ip_bytes = np.where(offsets < lengths[:, None], buffer[np.minimum(begins[:, None] + offsets, len(buffer) - 1)],
+                        np.where(offsets == lengths[:, None], ord(IP_END), 0))
+    ip_bytes = np.ascontiguousarray(ip_bytes, dtype=np.uint8).view('S%d' % len(offsets)).reshape(-1)
+
+    rows = np.flatnonzero(valid)
+    for i in rows[STRIPPED_BYTES[buffer[begins[rows]]] | STRIPPED_BYTES[buffer[ends[rows] - 1]] |
+                  (lengths[rows] > MAX_IP_BYTES)].tolist():
+        ip = buffer[begins[i]:ends[i]].tobytes().decode('utf-8').strip()
+        encoded_ip = ip.encode('utf-8')
+        if len(encoded_ip) > MAX_IP_BYTES:
+            encoded_ip = long_ips.setdefault(ip, IP_END + b'%d' % len(long_ips))
+        ip_bytes[i] = encoded_ip + IP_END
+        valid[i] = bool(ip)
+    return ip_bytes
+
+
+def factorize_ips(ip_bytes, long_ips):
+    """
+        Factorizes the ips of all the requests to integer ids in order of first appearance. The ips are hashed to 64
+        bit integers, whose sort is much faster than the sort of byte strings, and they are only sorted as byte
+        strings if two distinct ips have the same hash.
+
+    :param ip_bytes: a NumPy bytes array with the UTF-8 encoded ip of each request in the order of the stream, see
+                     extract_ips
+    :param long_ips: a dictionary with the ips longer than MAX_IP_BYTES as the key and their key in ip_bytes as value
+    :return: a tuple (ips, ip_ids) where ips is the list of distinct ips indexed by their id and ip_ids a NumPy array
+             with the id of the ip of each request
+    """
+    width = ip_bytes.dtype.itemsize
+    words = np.zeros((len(ip_bytes), -(-width // 8) * 8), dtype=np.uint8)
+    words[:, :width] = ip_bytes.view(np.uint8).reshape(-1, width)
+    words = words.view(np.uint64)
+    hashes = words[:, 0].copy()
+    for i in range(1, words.shape[1]):
+        hashes *= HASH_MULTIPLIER
+        hashes ^= words[:, i]
+    _, first_requests, ip_indices = np.unique(hashes, return_index=True, return_inverse=True)
+    ip_indices = ip_indices.reshape(-1)
+    if not (words == words[first_requests[ip_indices]]).all():
+        _, first_requests, ip_indices = np.unique(ip_bytes, return_index=True, return_inverse=True)
+        ip_indices = ip_indices.reshape(-1)
+
+    order = np.argsort(first_requests)
+    ids = np.empty(len(order), dtype=np.int64)
+    ids[order] = np.arange(len(order))
+    long_ip_keys = {key + IP_END: ip for ip, key in long_ips.items()}
+    return ([long_ip_keys[ip] if ip.startswith(IP_END) else ip[:-1].decode('utf-8')
+             for ip in ip_bytes[first_requests[order]].tolist()], ids[ip_indices])
+
+
+def parse_block(block, req_fields, latest_date_time, counter, long_ips):
+    """
+        Parses the records of a block of input into NumPy columns at once, with the same validation, malformed time
+        fallback and counters as sessionization.read_requests. The block is encoded to UTF-8 bytes and the lines and
+        fields are found from the positions of the new lines and commas, so that no Python object is created per
+        record: a malformed time takes the time of the last request before it, and a counter restarts from zero
+        wherever the time increases.
+
+    :param block: lines of input
+    :param req_fields: a dictionary with name of required fields as the key and their index as value
+    :param latest_date_time: time of the last request before the block, None if there is none
+    :param counter: counter of the last request before the block
+    :param long_ips: the ips longer than MAX_IP_BYTES seen so far, see extract_ips
+    :return: a tuple (ip_bytes, date_times, counters, latest_date_time, counter) where the first three are NumPy
+             arrays with one entry per valid request of the block (ip_bytes holds the UTF-8 encoded ips, see
+             extract_ips) and the last two are the time and counter of its last request
+    """
+    indices = [req_fields[key] for key in sessionize.REQUIRED_FIELDS]
+    max_split = max(indices) + 1
+    buffer = np.frombuffer(block.encode('utf-8'), dtype=np.uint8)
+    line_ends = np.append(np.flatnonzero(buffer == NEW_LINE), len(buffer))
+    line_starts = np.append(0, line_ends[:-1] + 1)
+    commas = np.flatnonzero(buffer == COMMA)
+    first_commas = np.searchsorted(commas, line_starts)
+    comma_counts = np.searchsorted(commas, line_ends) - first_commas
+    complete = comma_counts >= max_split - 1         # the lines with all the required fields
+    lines = (commas, line_starts[complete], line_ends[complete], first_commas[complete], comma_counts[complete])
+    empty = np.zeros(0, dtype=np.int64)
+    if not complete.any():
+        return np.zeros(0, dtype='S1'), empty, empty, latest_date_time, counter
+
+    date_times = parse_date_times(buffer, field_bounds(lines, indices[1]), field_bounds(lines, indices[2]))
+    valid = np.ones(len(date_times), dtype=bool)
+    ip_bytes = extract_ips(buffer, field_bounds(lines, indices[0]), valid, long_ips)
+    # the records with a malformed time are only invalid while no time is known yet
+    malformed = date_times == INVALID_TIME
+    if latest_date_time is None:
+        valid &= np.logical_or.accumulate(valid & ~malformed)
+    if not valid.all():
+        ip_bytes, date_times, malformed = ip_bytes[valid], date_times[valid], malformed[valid]
+    if not len(date_times):
+        return ip_bytes, empty, empty, latest_date_time, counter
+
+    positions = np.arange(len(date_times))
+    if malformed.any():
+        # index of the last well-formed time at or before each request, -1 for the time before the block
+        last_valid = np.maximum.accumulate(np.where(malformed, -1, positions))
+        date_times = np.where(last_valid < 0, latest_date_time if latest_date_time is not None else 0,
+                              date_times[last_valid])
+
+    restarts = np.empty(len(date_times), dtype=bool)
+    restarts[0] = latest_date_time is None or date_times[0] > latest_date_time
+    np.greater(date_times[1:], date_times[:-1], out=restarts[1:])
+    last_restart = np.maximum.accumulate(np.where(restarts, positions, -1))
+    counters = positions - last_restart
+    counters[last_restart < 0] += counter
+
+    return ip_bytes, date_times, counters, int(date_times[-1]), int(counters[-1])
+
+
+def load_requests(input_handle, req_fields, block_size=sessionize.BLOCK_SIZE):
+    """
+        Reads all the valid requests of input_handle (after its header) into NumPy arrays, one block of input at a time
+        (see parse_block), and factorizes their ips to integer ids in order of first appearance at the end (see
+        factorize_ips). No Python object is kept per request.
+
+    :param input_handle: file handle for the input file (or a multi_file_input.InputFiles), positioned after the
+                         header
+    :param req_fields: a dictionary with name of required fields as the key and their index as value
+    :param block_size: number of characters of input parsed at once
+    :return: a tuple (ips, ip_ids, date_times, counters) where ips is the list of distinct ips indexed by their id
+             and the other three are NumPy arrays with one entry per request in the order of the stream
+    """
+    if hasattr(input_handle, 'read_file_blocks'):
+        # several input files read as one stream, the order of the fields can change from one file to the next
+        blocks = input_handle.read_file_blocks(req_fields, block_size)
+    else:
+        blocks = ((block, offset, req_fields) for block, offset in sessionize.read_blocks(input_handle, block_size))
+
+    latest_date_time = None
+    counter = 0
+    long_ips = {}
+    columns = [[np.zeros(0, dtype='S1')], [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]]
+    for block, _, block_req_fields in blocks:
+        ip_bytes, date_times, counters, latest_date_time, counter = parse_block(block, block_req_fields,
+                                                                                latest_date_time, counter, long_ips)
+        for column, values in zip(columns, (ip_bytes, date_times, counters)):
+            column.append(values)
+
+    ip_bytes, date_times, counters = (np.concatenate(column) for column in columns)
+    ips, ip_ids = factorize_ips(ip_bytes, long_ips)
+    return ips, ip_ids, date_times, counters
+
+
+def sort_requests_by_ip(ip_ids, date_times):
+    """
+        Stable sorts the requests by ip, which keeps the order of the stream for the requests of each ip. The result
+        only depends on the requests, so it can be shared by the computations of several inactivity intervals.
+
+    :param ip_ids: NumPy array of ip ids of the requests in the order of the stream
+    :param date_times: NumPy array of times of the requests in seconds since epoch
+    :return: a tuple of NumPy arrays (order, sorted ip_ids, sorted date_times) where order is the sorting permutation
+    """
+    order = np.argsort(ip_ids, kind='stable')
+    return order, ip_ids[order], date_times[order]
+
+
+def compute_sessions(ip_ids, date_times, counters, inactivity_interval, sorted_requests=None):
+    """
+        Computes the sessions of the requests and returns them in the order of the streaming output: first the
+        sessions which expire before the latest time of the stream, ordered by expiration time, start time and counter,
+        then the sessions still open at the end of the stream ordered by start time and counter.
+        The requests are stable sorted by ip (see sort_requests_by_ip) and a new session starts wherever the ip changes
+        or the time since the previous request is more than the inactivity interval.
+
+    :param ip_ids: NumPy array of ip ids of the requests in the order of the stream
+    :param date_times: NumPy array of times of the requests in seconds since epoch
+    :param counters: NumPy array of the per second counters of the requests
+    :param inactivity_interval: inactivity interval in seconds after which a session is considered as expired
+    :param sorted_requests: the result of sort_requests_by_ip for these requests, computed if None
+    :return: a tuple of NumPy arrays (ip_ids, start date_times, end date_times, number of docs requested) of the
+             sessions in output order
+    """
+    if len(ip_ids) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty
+
+    if sorted_requests is None:
+        sorted_requests = sort_requests_by_ip(ip_ids, date_times)
+    order, sorted_ids, sorted_times = sorted_requests
+
+    breaks = np.empty(len(order), dtype=bool)
+    breaks[0] = True
+    np.not_equal(sorted_ids[1:], sorted_ids[:-1], out=breaks[1:])
+    breaks[1:] |= np.diff(sorted_times) > inactivity_interval
+    first_requests = np.flatnonzero(breaks)
+    last_requests = np.append(first_requests[1:], len(order)) - 1
+
+    session_ids = sorted_ids[first_requests]
+    starts = sorted_times[first_requests]
+    ends = sorted_times[last_requests]
+    counts = np.add.reduceat(np.ones(len(order), dtype=np.int64), first_requests)
+    session_counters = counters[order[first_requests]]
+
+    # a session is written when its expiration time is passed by a later request of the stream, otherwise it is
+    # written at the end of the stream (the times are widened first since they may be stored in 32 bits)
+    expiration_times = ends.astype(np.int64) + inactivity_interval
+    expiration_times[expiration_times >= date_times.max()] = np.iinfo(np.int64).max
+    output_order = np.lexsort((session_counters, starts, expiration_times))
+
+    return session_ids[output_order], starts[output_order], ends[output_order], counts[output_order]
+
+
+def write_sessions(output_handle, ips, sessions):
+    """
+        Writes the sessions computed by compute_sessions in the output format of sessionization.format_session_record.
+
+    :param output_handle: file handle for the output file
+    :param ips: list of the distinct ips indexed by their id
+    :param sessions: a tuple of NumPy arrays (ip_ids, start date_times, end date_times, number of docs requested)
+    """
+    session_ids, starts, ends, counts = sessions
+    output_buffer = sessionize.OutputBuffer(output_handle)
+    format_timestamp = sessionize.format_timestamp
+    for ip_id, start, end, count in zip(session_ids.tolist(), starts.tolist(), ends.tolist(), counts.tolist()):
+        output_buffer.write('%s,%s,%s,%d,%d\n' % (ips[ip_id], format_timestamp(start), format_timestamp(end),
+                                                  end - start + 1, count))
+    output_buffer.flush()
+
+
+def write_sessions_sweep(ips, ip_ids, date_times, counters, inactivity_intervals, output_handles):
+    """
+        Computes and writes the sessions of the requests for several inactivity intervals. The requests are sorted by
+        ip only once for all the intervals.
+
+    :param ips: list of the distinct ips indexed by their id
+    :param ip_ids: NumPy array of ip ids of the requests in the order of the stream
+    :param date_times: NumPy array of times of the requests in seconds since epoch
+    :param counters: NumPy array of the per second counters of the requests
+    :param inactivity_intervals: list of inactivity intervals in seconds
+    :param output_handles: list of file handles for the output files, one per inactivity interval
+    """
+    sorted_requests = sort_requests_by_ip(ip_ids, date_times) if len(ip_ids) else None
+    for inactivity_interval, output_handle in zip(inactivity_intervals, output_handles):
+        write_sessions(output_handle, ips,
+                       compute_sessions(ip_ids, date_times, counters, inactivity_interval, sorted_requests))
+
+
+def process_data_file(input_handle, inactivity_handle, output_handle):
+    """
+        Same as sessionization.process_data_stream for a complete log file: it loads the whole file into NumPy arrays
+        and computes all sessions at once, which is faster for offline runs since the sessions are computed with vector
+        operations. The output is byte-identical to the streaming output for a chronological input.
+
+    :param input_handle: file handle for the input file.
+    :param inactivity_handle: file handle for the inactivity interval file.
+    :param output_handle: file handle for the output file
+    """
+    inactivity_interval = sessionize.get_inactivity_interval(inactivity_handle)
+    req_fields = sessionize.get_order_of_required_fields(input_handle)
+
+    ips, ip_ids, date_times, counters = load_requests(input_handle, req_fields)
+    write_sessions(output_handle, ips, compute_sessions(ip_ids, date_times, counters, inactivity_interval))
+
+
+def process_data_file_sweep(input_handle, inactivity_intervals, output_handles):
+    """
+        Same as process_data_file for several inactivity intervals: the log is loaded once and the sessions of each
+        interval are written to its own output.
+
+    :param input_handle: file handle for the input file.
+    :param inactivity_intervals: list of inactivity intervals in seconds
+    :param output_handles: list of file handles for the output files, one per inactivity interval
+    """
+    req_fields = sessionize.get_order_of_required_fields(input_handle)
+    ips, ip_ids, date_times, counters = load_requests(input_handle, req_fields)
+    write_sessions_sweep(ips, ip_ids, date_times, counters, inactivity_intervals, output_handles)
@@ -0,0 +1,362 @@
+import os
+import sys
+import json
+import time
+import queue
+import random
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime
+from io import StringIO
+from itertools import accumulate
+import sessionization as sessionize
+
+try:
+    import resource
+except ImportError:  # not available on Windows, peak RSS is then not reported
+    resource = None
+
+
+EDGAR_FIELDS = ['ip', 'date', 'time', 'zone', 'cik', 'accession', 'extention', 'code', 'size', 'idx', 'norefer',
+                'noagent', 'find', 'crawler', 'browser']
+EXTENTIONS = ['-index.htm', '-index.html', '.txt', '-xbrl.zip', 'v385454_20fa.htm', '.htm']
+ENGINES = ['stream', 'parallel', 'batch', 'pipeline', 'cache']
+POLL_INTERVAL = 1.0     # seconds between two checks that a benchmark child process is still alive
+
+
+def get_column_order(column_order, seed=0):
+    """
+        Returns the list of EDGAR field names in the order they should appear in a generated log.
+
+    :param column_order: 'standard' for the order of the EDGAR log files, 'shuffled' for a random permutation of it
+                         (derived from seed), or a comma separated list of all the field names
+    :param seed: seed of the random permutation used for 'shuffled'
+    :return: a list of field names
+    """
+    if column_order == 'standard':
+        return list(EDGAR_FIELDS)
+    if column_order == 'shuffled':
+        fields = list(EDGAR_FIELDS)
+        random.Random(seed).shuffle(fields)
+        return fields
+
+    fields = column_order.split(',')
+    if sorted(fields) != sorted(EDGAR_FIELDS):
+        raise ValueError('Column order should contain each of these fields once: ' + ','.join(EDGAR_FIELDS))
+    return fields
+
+
+def generate_log(output_handle, lines, distinct_ips=10000, zipf_exponent=1.1, start='2017-06-30 00:00:00',
+                 requests_per_second=20.0, gap_rate=0.0, max_gap=3600, malformed_rate=0.0, column_order='standard',
+                 seed=0):
+    """
+        Writes a synthetic log in the EDGAR log file format (header first). Ips are drawn from distinct_ips anonymized
+        ips with Zipf-skewed request rates, so a few ips make most of the requests as in real logs. Time advances by
+        one second after requests_per_second records on average and, with probability gap_rate per record, jumps
+        ahead by up to max_gap seconds. A malformed_rate share of records gets a malformed date or time, an empty ip
+        or too few fields. The same arguments always generate the same log.
+
+    :param output_handle: file handle the log is written to
+    :param lines: number of records (not counting the header)
+    :param distinct_ips: number of distinct ips
+    :param zipf_exponent: exponent s of the Zipf distribution, the ip of rank k is drawn with weight 1 / k ** s
+    :param start: date and time of the first record as 'YYYY-MM-DD hh:mm:ss'
+    :param requests_per_second: average number of records per second
+    :param gap_rate: probability of a gap of time after a record
+    :param max_gap: maximum length of a gap of time in seconds
+    :param malformed_rate: share of malformed records
+    :param column_order: see get_column_order
+    :param seed: seed of the random generator
+    """
+    rand = random.Random(seed)
+    fields = get_column_order(column_order, seed)
+    output_handle.write(','.join(fields) + '\n')
+
+    ips = ['%d.%d.%d.%s' % (rand.randint(1, 223), rand.randint(0, 255), rand.randint(0, 255),
+                            ''.join(rand.choice('abcdefghij') for _ in range(3))) for _ in range(distinct_ips)]
+    cum_weights = list(accumulate(1.0 / rank ** zipf_exponent for rank in range(1, distinct_ips + 1)))
+    date_time = sessionize.parse_timestamp(start[:10], start[11:])
+    advance_rate = 1.0 / requests_per_second
+    record = dict.fromkeys(EDGAR_FIELDS, '0.0')
+
+    for ip in rand.choices(ips, cum_weights=cum_weights, k=lines):
+        if rand.random() < advance_rate:
+            date_time += 1
+        if gap_rate and rand.random() < gap_rate:
+            date_time += rand.randint(1, max_gap)
+        record['ip'] = ip
+        record['date'], record['time'] = sessionize.format_timestamp(date_time).split(' ')
+        record['cik'] = '%d.0' % rand.randint(1000, 1700000)
+        record['accession'] = '%010d-%02d-%06d' % (rand.randint(1, 1700000), rand.randint(0, 17),
+                                                   rand.randint(0, 999999))
+        record['extention'] = rand.choice(EXTENTIONS)
+        record['code'] = rand.choice(('200.0', '200.0', '200.0', '301.0', '404.0'))
+        record['size'] = '%d.0' % rand.randint(100, 100000)
+        record['crawler'] = '1.0' if rand.random() < 0.05 else '0.0'
+        record['browser'] = ''
+        values = [record[field] for field in fields]
+        if malformed_rate and rand.random() < malformed_rate:
+            kind = rand.randint(0, 3)
+            if kind == 0:
+                values[fields.index('date')] = '2017-13-45'
+            elif kind == 1:
+                values[fields.index('time')] = '25:61'
+            elif kind == 2:
+                values[fields.index('ip')] = ' '
+            else:
+                values = values[:2]
+        output_handle.write(','.join(values) + '\n')
+
+
+def run_engine(engine, input_path, inactivity_interval, output_path, workers):
+    """
+        Runs one sessionization engine on a log file and measures it. It is meant to be run in a fresh process so that
+        the peak RSS belongs to that run only. The 'cache' engine sessionizes a columnar cache of the log (see
+        columnar_cache), which is built beforehand and timed on its own.
+
+    :param engine: one of ENGINES
+    :param input_path: path of the log file
+    :param inactivity_interval: inactivity interval in seconds
+    :param output_path: path of the output file
+    :param workers: number of worker processes of the 'parallel' engine
+    :return: a dictionary with 'parse_seconds' (reading and validating the records only), 'seconds' (the whole run),
+             'peak_rss_kb', 'children_peak_rss_kb' (the largest worker process, if any) and 'output_sha1', and
+             'cache_seconds' (building the cache) for the 'cache' engine
+    """
+    inactivity_handle = StringIO('%d\n' % inactivity_interval)
+
+    # phase 1: reading and validating the records, which every engine has to do
+    start_time = time.perf_counter()
+    with open(input_path, 'r') as input_handle:
+        req_fields = sessionize.get_order_of_required_fields(input_handle)
+        for _ in sessionize.read_requests(input_handle, req_fields):
+            pass
+    parse_seconds = time.perf_counter() - start_time
+
+    result = {}
+    cache_dir = None
+    if engine == 'cache':
+        import columnar_cache
+        cache_dir = tempfile.mkdtemp(prefix='sessionization_cache_')
+        start_time = time.perf_counter()
+        with open(input_path, 'r') as input_handle:
+            columnar_cache.write_cache(input_handle, cache_dir)
+        result['cache_seconds'] = time.perf_counter() - start_time
+
+    # phase 2: the whole run of the engine
+    try:
+        start_time = time.perf_counter()
+        with open(input_path, 'r') as input_handle, open(output_path, 'w') as output_handle:
+            if engine == 'stream':
+                sessionize.process_data_stream(input_handle, inactivity_handle, output_handle)
+            elif engine == 'parallel':
+                import parallel_sessionization
+                parallel_sessionization.process_data_stream_parallel(input_handle, inactivity_handle, output_handle,
+                                                                     workers)
+            elif engine == 'batch':
+                import batch_sessionization
+                batch_sessionization.process_data_file(input_handle, inactivity_handle, output_handle)
+            elif engine == 'pipeline':
+                import pipelined_sessionization
+                pipelined_sessionization.process_data_stream_pipelined(input_handle, inactivity_handle,
+                                                                       output_handle)
+            elif engine == 'cache':
+                columnar_cache.process_cache(cache_dir, [inactivity_interval], [output_handle])
+            else:
+                raise ValueError('Unknown engine: %s' % engine)
+        seconds = time.perf_counter() - start_time
+    finally:
+        if cache_dir is not None:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    with open(output_path, 'rb') as output_handle:
+        output_sha1 = hashlib.sha1(output_handle.read()).hexdigest()
+
+    result.update({'parse_seconds': parse_seconds,
+                   'seconds': seconds,
+                   'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+                   'children_peak_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss if resource else None,
+                   'output_sha1': output_sha1})
+    return result
+
+
+def _run_engine_in_child(result_queue, *args):
+    """
+        Target of the benchmark child processes: runs run_engine and puts its result (or the error) on result_queue.
+    """
+    try:
+        result_queue.put(run_engine(*args))
+    except Exception as e:
+        result_queue.put({'error': '%s: %s' % (type(e).__name__, e)})
+
+
+def wait_for_result(result_queue, process, timeout=None, poll_interval=POLL_INTERVAL):
+    """
+        Waits for the result of a benchmark child process. A child which dies without putting its result on
+        result_queue, e.g. one killed by the OOM killer on a large log, or which runs for longer than timeout seconds
+        (it is then terminated) gives an error result instead of a wait that never ends.
+
+    :param result_queue: queue the child puts its result on (see _run_engine_in_child)
+    :param process: the child process
+    :param timeout: maximum number of seconds of the run, None for no limit
+    :param poll_interval: seconds between two checks that the child is still alive
+    :return: the result of the child or a dictionary with an 'error'
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            return result_queue.get(timeout=poll_interval)
+        except queue.Empty:
+            pass
+        if not process.is_alive():
+            # the result may have reached the queue just before the child exited
+            try:
+                return result_queue.get(timeout=poll_interval)
+            except queue.Empty:
+                exitcode = process.exitcode
+                if exitcode is not None and exitcode < 0:
+                    return {'error': 'the process was killed by signal %d without a result' % -exitcode}
+                return {'error': 'the process exited with code %s without a result' % exitcode}
+        if deadline is not None and time.monotonic() > deadline:
+            process.terminate()
+            process.join()
+            return {'error': 'no result after %s seconds' % timeout}
+
+
+def run_benchmark(input_path, inactivity_intervals, engines, workers=2, repeat=1, timeout=None):
+    """
+        Runs every engine for every inactivity interval on the log file, each run in a fresh process.
+
+    :param input_path: path of the log file
+    :param inactivity_intervals: list of inactivity intervals in seconds
+    :param engines: list of engine names, see ENGINES
+    :param workers: number of worker processes of the 'parallel' engine
+    :param repeat: number of runs of each combination, the fastest one is reported
+    :param timeout: maximum number of seconds of a run, None for no limit (see wait_for_result)
+    :return: a list of dictionaries, one per engine and inactivity interval
+    """
+    with open(input_path, 'r') as input_handle:
+        lines = sum(1 for _ in input_handle) - 1
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory(prefix='sessionization_benchmark_') as temp_dir:
+        output_path = os.path.join(temp_dir, 'sessionization.txt')
+        for inactivity_interval in inactivity_intervals:
+            for engine in engines:
+                best = None
+                for _ in range(repeat):
+                    result_queue = context.Queue()
+                    process = context.Process(target=_run_engine_in_child,
+                                              args=(result_queue, engine, input_path, inactivity_interval,
+                                                    output_path, workers))
+                    process.start()
+                    result = wait_for_result(result_queue, process, timeout)
+                    process.join()
+                    if 'error' in result or best is None or result['seconds'] < best['seconds']:
+                        best = result
+                    if 'error' in result:
+                        break
+                best.update({'engine': engine, 'inactivity_interval': inactivity_interval, 'lines': lines})
+                if 'seconds' in best:
+                    best['lines_per_second'] = lines / best['seconds'] if best['seconds'] else None
+                results.append(best)
+
+    return results
+
+
+def get_git_commit():
+    """
+        Returns the commit hash of the working tree of this file, or None if it is not in a git repository.
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_arguments(argv):
+    """
+        Parses the command line arguments of the benchmark.
+
+    :param argv: list of command line arguments (without the program name)
+    :return: an argparse.Namespace
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks the sessionization engines on a synthetic EDGAR log.')
+    parser.add_argument('results_path', help='JSON file the results are written to')
+    parser.add_argument('-input', help='benchmark this log file instead of generating one')
+    parser.add_argument('-lines', type=int, default=1000000, help='number of generated records')
+    parser.add_argument('-ips', type=int, default=50000, help='number of distinct ips')
+    parser.add_argument('-zipf', type=float, default=1.1, help='Zipf exponent of the request rates of the ips')
+    parser.add_argument('-rate', type=float, default=20.0, help='average number of records per second')
+    parser.add_argument('-gap_rate', type=float, default=0.0001, help='probability of a gap of time after a record')
+    parser.add_argument('-max_gap', type=int, default=3600, help='maximum length of a gap of time in seconds')
+    parser.add_argument('-malformed', type=float, default=0.001, help='share of malformed records')
+    parser.add_argument('-columns', default='standard',
+                        help="'standard', 'shuffled' or a comma separated list of the EDGAR field names")
+    parser.add_argument('-seed', type=int, default=0, help='seed of the generated log')
+    parser.add_argument('-inactivity', default='2,60,1800',
+                        help='comma separated list of inactivity intervals in seconds')
+    parser.add_argument('-engines', default='stream,batch', help='comma separated list of: ' + ','.join(ENGINES))
+    parser.add_argument('-workers', type=int, default=2, help='number of worker processes of the parallel engine')
+    parser.add_argument('-repeat', type=int, default=1, help='number of runs of each combination, the fastest counts')
+    parser.add_argument('-timeout', type=float, help='maximum number of seconds of a run, a longer run is stopped and '
+                                                     'reported as failed')
+    args = parser.parse_args(argv)
+
+    args.inactivity = [int(value) for value in args.inactivity.split(',')]
+    args.engines = args.engines.split(',')
+    unknown_engines = set(args.engines) - set(ENGINES)
+    if unknown_engines:
+        parser.error('Unknown engines: ' + ','.join(sorted(unknown_engines)))
+
+    return args
+
+
+def main(argv):
+    """
+        Generates the synthetic log (unless -input is given), runs the benchmark and writes the results as JSON.
+    """
+    args = parse_arguments(argv)
+    config = {key: value for key, value in vars(args).items() if key != 'results_path'}
+
+    with tempfile.TemporaryDirectory(prefix='sessionization_log_') as temp_dir:
+        input_path = args.input
+        if input_path is None:
+            input_path = os.path.join(temp_dir, 'log.csv')
+            with open(input_path, 'w') as log_handle:
+                generate_log(log_handle, args.lines, args.ips, args.zipf, requests_per_second=args.rate,
+                             gap_rate=args.gap_rate, max_gap=args.max_gap, malformed_rate=args.malformed,
+                             column_order=args.columns, seed=args.seed)
+        results = run_benchmark(input_path, args.inactivity, args.engines, args.workers, args.repeat,
+                                args.timeout)
+
+    report = {'commit': get_git_commit(),
+              'date': datetime.now().isoformat(' ', 'seconds'),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'cpu_count': os.cpu_count(),
+              'config': config,
+              'results': results}
+    with open(args.results_path, 'w') as results_handle:
+        json.dump(report, results_handle, indent=2, sort_keys=True)
+        results_handle.write('\n')
+
+    for result in results:
+        if 'error' in result:
+            print('%-8s %6ds  failed: %s' % (result['engine'], result['inactivity_interval'], result['error']))
+        else:
+            print('%-8s %6ds  %10.0f lines/s  %8.2fs (parse %.2fs)  peak RSS %s KB%s' %
+                  (result['engine'], result['inactivity_interval'], result['lines_per_second'] or 0,
+                   result['seconds'], result['parse_seconds'], result['peak_rss_kb'],
+                   '  (cache build %.2fs)' % result['cache_seconds'] if 'cache_seconds' in result else ''))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
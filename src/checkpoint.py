@@ -0,0 +1,148 @@
+import os
+import time
+import heapq
+import struct
+from array import array
+import sessionization as sessionize
+
+
+CHECKPOINT_INTERVAL = 300       # default number of seconds between two snapshots
+MAGIC = b'EDGARSES'
+VERSION = 1
+# magic, version, inactivity interval, input offset, output offset, has latest time, latest time, counter, number of
+# sessions, number of expiration buckets, number of bucket entries, length of the ip blob
+HEADER = struct.Struct('<8sIqqqqqqqqqq')
+
+
+class Checkpoint(object):
+    """
+        Periodically saves the state of a running process_data_stream (the open sessions, the expiration buckets and
+        the offsets of the input and output files) to a compact binary snapshot, and loads it back to resume the
+        stream where it was left off. The snapshot is written to a temporary file which then replaces the previous
+        snapshot, so an interrupted save never leaves a broken snapshot behind.
+
+        Snapshot layout (little endian): HEADER, the index of each of REQUIRED_FIELDS in the records, the ips of the
+        open sessions joined by new lines, the start, end, count and counter columns of the sessions, the expiration
+        times of the buckets, the length of each bucket and the session index of each bucket entry.
+    """
+
+    def __init__(self, path, interval=CHECKPOINT_INTERVAL):
+        """
+        :param path: path of the snapshot file
+        :param interval: minimum number of seconds between two snapshots (see due)
+        """
+        self.path = path
+        self.interval = interval
+        self.last_save = time.time()
+
+    def due(self):
+        """
+        :return: True if interval seconds have passed since the last snapshot
+        """
+        return time.time() - self.last_save >= self.interval
+
+    def save(self, state, output_handle=None):
+        """
+            Writes a snapshot of state. output_handle is flushed and synced to disk first, so that the output offset
+            of the snapshot never points past the data actually written.
+
+        :param state: a dictionary with inactivity_interval, req_fields, input_offset, output_offset,
+                      latest_date_time, counter, request_dict and expiration_dict
+        :param output_handle: an optional file handle for the output file
+        """
+        if output_handle is not None:
+            output_handle.flush()
+            os.fsync(output_handle.fileno())
+
+        request_dict = state['request_dict']
+        ips = list(request_dict)
+        sessions = [request_dict[ip] for ip in ips]
+        ip_index = dict(zip(ips, range(len(ips))))
+
+        bucket_keys = array('q')
+        bucket_lengths = array('q')
+        bucket_entries = array('q')
+        for exp_time, bucket in state['expiration_dict'].items():
+            # an ip without an open session would be skipped by close_expired_sessions anyway
+            entries = [ip_index[ip] for ip in bucket if ip in ip_index]
+            bucket_keys.append(exp_time)
+            bucket_lengths.append(len(entries))
+            bucket_entries.extend(entries)
+
+        ip_blob = '\n'.join(ips).encode('utf-8')
+        latest_date_time = state['latest_date_time']
+        header = HEADER.pack(MAGIC, VERSION, state['inactivity_interval'], state['input_offset'],
+                             state['output_offset'], latest_date_time is not None, latest_date_time or 0,
+                             state['counter'], len(sessions), len(bucket_keys), len(bucket_entries), len(ip_blob))
+        req_fields = array('q', [state['req_fields'][key] for key in sessionize.REQUIRED_FIELDS])
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as snapshot_handle:
+            snapshot_handle.write(header)
+            snapshot_handle.write(req_fields.tobytes())
+            snapshot_handle.write(ip_blob)
+            for column in ('start', 'end', 'count', 'counter'):
+                snapshot_handle.write(array('q', [getattr(s, column) for s in sessions]).tobytes())
+            snapshot_handle.write(bucket_keys.tobytes())
+            snapshot_handle.write(bucket_lengths.tobytes())
+            snapshot_handle.write(bucket_entries.tobytes())
+            snapshot_handle.flush()
+            os.fsync(snapshot_handle.fileno())
+        os.replace(temp_path, self.path)
+        self.last_save = time.time()
+
+    def load(self):
+        """
+            Reads the snapshot written by save.
+
+        :return: the state dictionary passed to save, with an expiration_heap of the keys of expiration_dict added,
+                 or None if there is no snapshot
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, 'rb') as snapshot_handle:
+            data = snapshot_handle.read()
+        (magic, version, inactivity_interval, input_offset, output_offset, has_latest, latest_date_time, counter,
+         n_sessions, n_buckets, n_entries, ip_blob_size) = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a sessionization checkpoint.' % self.path)
+
+        position = HEADER.size
+
+        def read_column(length):
+            nonlocal position
+            column = array('q')
+            column.frombytes(data[position:position + 8 * length])
+            position += 8 * length
+            return column
+
+        req_fields = dict(zip(sessionize.REQUIRED_FIELDS, read_column(len(sessionize.REQUIRED_FIELDS))))
+        ips = data[position:position + ip_blob_size].decode('utf-8').split('\n') if n_sessions else []
+        position += ip_blob_size
+        starts, ends, counts, counters = (read_column(n_sessions) for _ in range(4))
+        bucket_keys, bucket_lengths, bucket_entries = (read_column(n_buckets), read_column(n_buckets),
+                                                       read_column(n_entries))
+
+        Session = sessionize.Session
+        request_dict = {ip: Session(start, end, count, session_counter)
+                        for ip, start, end, count, session_counter in zip(ips, starts, ends, counts, counters)}
+        expiration_dict = {}
+        first = 0
+        for exp_time, length in zip(bucket_keys, bucket_lengths):
+            expiration_dict[exp_time] = [ips[i] for i in bucket_entries[first:first + length]]
+            first += length
+        expiration_heap = list(expiration_dict)
+        heapq.heapify(expiration_heap)
+
+        return {'inactivity_interval': inactivity_interval, 'req_fields': req_fields, 'input_offset': input_offset,
+                'output_offset': output_offset, 'latest_date_time': latest_date_time if has_latest else None,
+                'counter': counter, 'request_dict': request_dict, 'expiration_dict': expiration_dict,
+                'expiration_heap': expiration_heap}
+
+    def remove(self):
+        """
+            Removes the snapshot, e.g. once the stream is completely processed.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
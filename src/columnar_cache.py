@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import argparse
+from array import array
+import numpy as np
+import sessionization as sessionize
+import batch_sessionization
+
+
+CACHE_VERSION = 1
+CACHE_FILE = 'cache.json'       # description of the cache, also marks a directory as a cache
+OPTIONAL_FIELDS = ['cik', 'accession']
+
+
+def write_values(path, values):
+    """
+        Writes a list of distinct strings, one per line, in the order of their id.
+    """
+    with open(path, 'w') as value_handle:
+        value_handle.writelines(value + '\n' for value in values)
+
+
+def read_values(path):
+    with open(path, 'r') as value_handle:
+        return value_handle.read().split('\n')[:-1]
+
+
+def is_cache(path):
+    """
+    :param path: a path given as input
+    :return: True if path is a directory written by write_cache
+    """
+    return os.path.isfile(os.path.join(path, CACHE_FILE))
+
+
+def write_cache(input_handle, cache_dir, fields=()):
+    """
+        Converts a log to a columnar cache, a directory of NumPy .npy files with one entry per valid request in the
+        order of the stream: the ip id (int32) in ip_ids.npy and the time in seconds since epoch (int32) in
+        date_times.npy, and for each of the optional fields ('cik', 'accession') its id (int32) in <field>_ids.npy.
+        The ips and the values of the optional fields are interned: each distinct string gets an id in order of first
+        appearance and is written once, on the line of its id, in ips.txt or <field>s.txt. The per-second counters are
+        not stored since they follow from the times (see load_cache).
+
+    :param input_handle: file handle for the input file (or a multi_file_input.InputFiles)
+    :param cache_dir: directory of the cache, created if it does not exist
+    :param fields: optional fields stored along the ips and times
+    :return: number of requests in the cache
+    """
+    fields = list(fields)
+    for field in fields:
+        if field not in OPTIONAL_FIELDS:
+            raise ValueError('Unknown cache field: %s (choose from %s)' % (field, ', '.join(OPTIONAL_FIELDS)))
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    req_fields = sessionize.get_order_of_required_fields(input_handle)
+    columns = {'ip': array('i'), 'date_time': array('i')}
+    indices = {'ip': {}}
+    for field in fields:
+        columns[field] = array('i')
+        indices[field] = {}
+
+    ip_index = indices['ip']
+    ip_ids, date_times = columns['ip'], columns['date_time']
+    # the values of a request are its cik, accession and extention (see sessionization.read_requests)
+    for ip, date_time, _, values in sessionize.read_requests(input_handle, req_fields, value_fields=[]):
+        ip_id = ip_index.get(ip)
+        if ip_id is None:
+            ip_id = ip_index[ip] = len(ip_index)
+        ip_ids.append(ip_id)
+        try:
+            date_times.append(date_time)
+        except OverflowError:
+            raise ValueError('The cache keeps times as 32 bit seconds since epoch: %s' %
+                             sessionize.format_timestamp(date_time))
+        for field in fields:
+            value = values[OPTIONAL_FIELDS.index(field)]
+            value_index = indices[field]
+            value_id = value_index.get(value)
+            if value_id is None:
+                value_id = value_index[value] = len(value_index)
+            columns[field].append(value_id)
+
+    np.save(os.path.join(cache_dir, 'ip_ids.npy'), np.frombuffer(ip_ids, dtype=np.int32))
+    np.save(os.path.join(cache_dir, 'date_times.npy'), np.frombuffer(date_times, dtype=np.int32))
+    write_values(os.path.join(cache_dir, 'ips.txt'), ip_index)
+    for field in fields:
+        np.save(os.path.join(cache_dir, '%s_ids.npy' % field), np.frombuffer(columns[field], dtype=np.int32))
+        write_values(os.path.join(cache_dir, '%ss.txt' % field), indices[field])
+    # the description is written last, so an interrupted conversion is not taken for a cache
+    with open(os.path.join(cache_dir, CACHE_FILE), 'w') as cache_handle:
+        json.dump({'version': CACHE_VERSION, 'requests': len(ip_ids), 'fields': fields}, cache_handle)
+    return len(ip_ids)
+
+
+def load_cache(cache_dir):
+    """
+        Opens a columnar cache written by write_cache. The columns are memory-mapped, so only the pages which are used
+        are read, and the per-second counters are computed the same way as sessionization.read_requests does: the
+        counter is set to zero when time increases and is increased by one otherwise.
+
+    :param cache_dir: directory of the cache
+    :return: a tuple (ips, ip_ids, date_times, counters) like batch_sessionization.load_requests
+    """
+    with open(os.path.join(cache_dir, CACHE_FILE), 'r') as cache_handle:
+        description = json.load(cache_handle)
+    if description['version'] != CACHE_VERSION:
+        raise ValueError('%s is a cache of version %s, not %d.' % (cache_dir, description['version'], CACHE_VERSION))
+    ips = read_values(os.path.join(cache_dir, 'ips.txt'))
+    ip_ids = np.load(os.path.join(cache_dir, 'ip_ids.npy'), mmap_mode='r')
+    date_times = np.load(os.path.join(cache_dir, 'date_times.npy'), mmap_mode='r')
+
+    resets = np.empty(len(date_times), dtype=bool)
+    resets[:1] = True
+    np.greater(date_times[1:], date_times[:-1], out=resets[1:])
+    positions = np.arange(len(date_times), dtype=np.int64)
+    counters = positions - np.maximum.accumulate(np.where(resets, positions, 0))
+    return ips, ip_ids, date_times, counters
+
+
+def process_cache(cache_dir, inactivity_intervals, output_handles):
+    """
+        Same as batch_sessionization.process_data_file for a columnar cache and one or several inactivity intervals:
+        the cache is loaded once and the requests are sorted by ip once, then the sessions of each interval are
+        computed and written to its own output.
+
+    :param cache_dir: directory of the cache
+    :param inactivity_intervals: list of inactivity intervals in seconds
+    :param output_handles: list of file handles for the output files, one per inactivity interval
+    """
+    ips, ip_ids, date_times, counters = load_cache(cache_dir)
+    batch_sessionization.write_sessions_sweep(ips, ip_ids, date_times, counters, inactivity_intervals,
+                                              output_handles)
+
+
+def parse_arguments(argv):
+    """
+        Parses the command line arguments.
+
+    :param argv: list of the command line arguments
+    :return: the parsed arguments
+    """
+    parser = argparse.ArgumentParser(description='Converts EDGAR log files to a columnar cache which '
+                                                 'sessionization.py reads in place of the log.')
+    parser.add_argument('input_paths', nargs='+', metavar='input_path',
+                        help='input log files, glob patterns or directories, read as one stream')
+    parser.add_argument('cache_dir', help='directory of the cache')
+    parser.add_argument('-fields', type=lambda value: value.split(','), default=[],
+                        help='comma separated optional fields kept in the cache: %s' % ', '.join(OPTIONAL_FIELDS))
+    args = parser.parse_args(argv)
+    for field in args.fields:
+        if field not in OPTIONAL_FIELDS:
+            parser.error('unknown field: %s (choose from %s)' % (field, ', '.join(OPTIONAL_FIELDS)))
+
+    from multi_file_input import expand_input_paths
+    args.input_paths = expand_input_paths(args.input_paths)
+    if not args.input_paths:
+        parser.error('no input file matches the input paths.')
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_arguments(sys.argv[1:])
+    if len(args.input_paths) > 1:
+        from multi_file_input import InputFiles
+        input_handle = InputFiles(args.input_paths)
+    else:
+        input_handle, = sessionize.open_files([(args.input_paths[0], 'r')])
+    requests = write_cache(input_handle, args.cache_dir, args.fields)
+    sessionize.close_files([input_handle])
+    print('--- %d requests written to %s ---' % (requests, args.cache_dir))
@@ -0,0 +1,201 @@
+import gzip
+import queue
+import zipfile
+import threading
+
+
+CHUNK_SIZE = 1 << 20        # number of decompressed bytes handed from the decompression thread to the reader at once
+QUEUE_SIZE = 8              # maximum number of decompressed chunks waiting for the reader
+MAGIC_BYTES = [(b'\x1f\x8b', 'gzip'), (b'PK\x03\x04', 'zip'), (b'\x28\xb5\x2f\xfd', 'zstd')]
+OUTPUT_EXTENSIONS = [('.gz', 'gzip'), ('.zst', 'zstd')]
+
+
+def detect_compression(path):
+    """
+        Detects the compression of a file from its first bytes.
+
+    :param path: path of the file
+    :return: 'gzip', 'zip', 'zstd' or None for an uncompressed file
+    """
+    with open(path, 'rb') as file_handle:
+        head = file_handle.read(4)
+    for magic, compression in MAGIC_BYTES:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def get_output_compression(path):
+    """
+        Returns the compression of an output file from the extension of its path.
+
+    :param path: path of the output file
+    :return: 'gzip', 'zstd' or None for an uncompressed output
+    """
+    for extension, compression in OUTPUT_EXTENSIONS:
+        if path.endswith(extension):
+            return compression
+    return None
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('zstd compressed files need the zstandard module.')
+    return zstandard
+
+
+def open_decompressed_stream(path, compression):
+    """
+        Opens a binary stream of the decompressed content of path. The log file of a zip archive is its only member
+        or, for an archive like the daily EDGAR archives which also holds other files, its first .csv member.
+
+    :param path: path of the compressed file
+    :param compression: 'gzip', 'zip' or 'zstd' (see detect_compression)
+    :return: a binary file-like object with read and close methods
+    """
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zip':
+        archive = zipfile.ZipFile(path)
+        names = archive.namelist()
+        csv_names = [name for name in names if name.lower().endswith('.csv')]
+        return archive.open(csv_names[0] if csv_names else names[0])
+    if compression == 'zstd':
+        zstandard = import_zstandard()
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    raise ValueError('Unknown compression: %s' % compression)
+
+
+class DecompressingReader(object):
+    """
+        A binary read-only handle of a compressed file. A background thread decompresses the file in chunks of
+        chunk_size bytes into a bounded queue, so decompression (zlib and zstd release the GIL) overlaps the parsing
+        of the previous chunks. tell returns the offset in the decompressed content and seek can only move forward,
+        which is enough for sessionization.read_blocks and for resuming from a checkpoint.
+    """
+
+    def __init__(self, path, compression, chunk_size=CHUNK_SIZE, queue_size=QUEUE_SIZE):
+        """
+        :param path: path of the compressed file
+        :param compression: 'gzip', 'zip' or 'zstd' (see detect_compression)
+        :param chunk_size: number of decompressed bytes read by the background thread at once
+        :param queue_size: maximum number of decompressed chunks waiting to be read
+        """
+        self.stream = open_decompressed_stream(path, compression)
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(queue_size)
+        self.buffer = b''
+        self.position = 0
+        self.finished = False
+        self.closed = False
+        self.thread = threading.Thread(target=self.decompress)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def decompress(self):
+        # runs in the background thread; an empty chunk marks the end of the stream and an exception is handed over
+        # to the reader
+        try:
+            while not self.closed:
+                chunk = self.stream.read(self.chunk_size)
+                self.chunks.put(chunk)
+                if not chunk:
+                    break
+        except Exception as error:
+            self.chunks.put(error)
+
+    def fill_buffer(self):
+        """
+            Appends the next decompressed chunk to the buffer.
+
+        :return: False at the end of the decompressed content
+        """
+        if self.finished:
+            return False
+        chunk = self.chunks.get()
+        if isinstance(chunk, Exception):
+            raise chunk
+        if not chunk:
+            self.finished = True
+            return False
+        self.buffer = self.buffer + chunk if self.buffer else chunk
+        return True
+
+    def read(self, size=-1):
+        """
+        :param size: maximum number of bytes to read, all the rest of the content if negative
+        :return: the next bytes of the decompressed content, empty at its end
+        """
+        if size < 0:
+            while self.fill_buffer():
+                pass
+            size = len(self.buffer)
+        elif not self.buffer and size:
+            self.fill_buffer()
+        data = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        self.position += len(data)
+        return data
+
+    def readline(self):
+        while b'\n' not in self.buffer and self.fill_buffer():
+            pass
+        end = self.buffer.find(b'\n') + 1
+        return self.read(end if end else len(self.buffer))
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset):
+        """
+            Moves forward to offset of the decompressed content by reading and dropping the bytes before it.
+
+        :param offset: offset in the decompressed content, not before the current position
+        """
+        if offset < self.position:
+            raise ValueError('A compressed input can only be seeked forward.')
+        while self.position < offset and self.read(min(offset - self.position, self.chunk_size)):
+            pass
+        return self.position
+
+    def close(self):
+        self.closed = True
+        while self.thread.is_alive():
+            try:
+                self.chunks.get(timeout=0.1)    # unblocks the background thread if the queue is full
+            except queue.Empty:
+                pass
+        self.stream.close()
+
+
+def open_input(path):
+    """
+        Opens an input file: a compressed file (detected by its magic bytes) is decompressed in the background by a
+        DecompressingReader, any other file is opened in binary mode.
+
+    :param path: path of the input file
+    :return: a binary file-like object
+    """
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, 'rb')
+    return DecompressingReader(path, compression)
+
+
+def open_output(path, mode='w'):
+    """
+        Opens an output file in text mode, compressed with gzip or zstd if path ends with .gz or .zst.
+
+    :param path: path of the output file
+    :param mode: 'w' or 'a'
+    :return: a text file-like object
+    """
+    compression = get_output_compression(path)
+    if compression == 'gzip':
+        return gzip.open(path, mode + 't')
+    if compression == 'zstd':
+        zstandard = import_zstandard()
+        return zstandard.open(path, mode + 't')
+    return open(path, mode)
@@ -0,0 +1,271 @@
+import os
+import sys
+import heapq
+import shutil
+import argparse
+import operator
+import tempfile
+import multiprocessing
+import sessionization as sessionize
+from multi_file_input import expand_input_paths, open_prefetched
+
+
+CHUNK_SIZE = 1 << 26        # number of characters of input sorted in memory at once by one process
+
+
+def run_line_key(line):
+    """
+        Returns the sort key of a line of a run file which has this form:
+           'date_time,line_number,input_line'
+        with the first two values as integers.
+
+    :param line: a line of a run file
+    :return: a tuple (date_time, line_number)
+    """
+    date_time, line_number, _ = line.split(',', 2)
+    return int(date_time), int(line_number)
+
+
+def sort_chunk(text, first_line_number, indices, run_path):
+    """
+        Sorts the records of a chunk of input by their time, stable on their order in the input, and writes them to
+        run_path prefixed by their sort key (see run_line_key). Records the session logic would skip (too few fields
+        or an empty ip) are left out. A record with a malformed date or time takes the time of the record before it,
+        as in sessionization.check_field_validity_and_cleanup; the ones at the start of the chunk do not know that
+        time yet and are returned instead of written.
+
+    :param text: lines of input, without the header
+    :param first_line_number: line number in the input of the first line of text
+    :param indices: indices of the ip, date and time fields in a record
+    :param run_path: path of the run file
+    :return: a tuple (leading_records, last_date_time) where leading_records is a list of (line_number, line)
+             tuples of the records with a malformed time before the first valid time of the chunk, and
+             last_date_time is the time of the last record of the chunk (None if there is none)
+    """
+    max_split = max(indices) + 1
+    get_fields = operator.itemgetter(*indices)
+    parse_timestamp = sessionize.parse_timestamp
+    records = []
+    leading_records = []
+    last_date_time = None
+    for line_number, line in enumerate(text.split('\n'), first_line_number):
+        all_fields = line.split(',', max_split)
+        if len(all_fields) < max_split:
+            continue
+        ip, d, t = get_fields(all_fields)
+        if not ip.strip():
+            continue
+        try:
+            last_date_time = parse_timestamp(d, t)
+        except ValueError:
+            if last_date_time is None:
+                leading_records.append((line_number, line))
+                continue
+        records.append((last_date_time, line_number, line))
+
+    records.sort(key=operator.itemgetter(0))    # stable, so records of the same time keep their input order
+    with open(run_path, 'w') as run_handle:
+        run_handle.writelines('%d,%d,%s\n' % record for record in records)
+    return leading_records, last_date_time
+
+
+def read_header(input_handle):
+    """
+        Reads the header of an input file opened by multi_file_input.open_prefetched, which is binary for a compressed
+        file, as text (see sessionization.get_order_of_required_fields).
+
+    :param input_handle: file handle for the input file
+    :return: the header line
+    """
+    header = input_handle.readline()
+    if isinstance(header, bytes):
+        header = sessionize.decode_block(header)
+    return header
+
+
+class SortedInput(object):
+    """
+        A read-only handle of log files whose records are sorted by time with a chunked external merge sort, for
+        logs too far out of order for reorder_buffer.ReorderBuffer. The input is cut into chunks of about CHUNK_SIZE
+        characters, which are sorted by a pool of worker processes into run files in a temporary directory, and the
+        runs are then k-way merged. Records of the same time keep their input order, so the per-second counters of
+        sessionization.read_requests give the same order of appearance as in the input. At most one chunk per worker
+        and the one being read are in memory at once.
+
+        readline returns the header and sessionization.read_blocks hands the reading of the records over to
+        read_blocks of this class, so a SortedInput can be used in place of an input file handle by all the
+        sessionization engines and the sorted log is never written as a whole.
+    """
+
+    def __init__(self, paths, workers=1, chunk_size=CHUNK_SIZE, temp_dir=None):
+        """
+        :param paths: list of paths of the log files, which should all have the same header
+        :param workers: number of processes sorting chunks; the chunks are sorted by this process if 1
+        :param chunk_size: number of characters of input sorted at once
+        :param temp_dir: directory of the temporary directory of the run files (the default temporary directory if
+                         None)
+        """
+        self.paths = paths
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.temp_dir = tempfile.mkdtemp(prefix='external_sort_', dir=temp_dir)
+        self.header = None
+        self.run_paths = []
+
+    def readline(self):
+        """
+            Reads the header of the first file.
+
+        :return: the header line
+        """
+        if self.header is None:
+            input_handle = open_prefetched(self.paths[0])
+            try:
+                self.header = read_header(input_handle)
+            finally:
+                input_handle.close()
+        return self.header
+
+    def read_chunks(self):
+        """
+            Reads all the files and generates chunks of lines of about chunk_size characters which do not span two
+            files.
+
+        :return: a generator of (text, first_line_number) tuples
+        :raises ValueError: if a file does not have the same header as the first one
+        """
+        line_number = 0
+        for path in self.paths:
+            # a compressed file is read through a compressed_files.DecompressingReader, which is closed explicitly
+            input_handle = open_prefetched(path)
+            try:
+                if read_header(input_handle).strip() != self.readline().strip():
+                    raise ValueError('All the input files should have the same header: %s' % path)
+                line_number += 1
+                blocks = []
+                size = 0
+                for block, _ in sessionize.read_blocks(input_handle, min(self.chunk_size, sessionize.BLOCK_SIZE)):
+                    blocks.append(block)
+                    size += len(block)
+                    if size >= self.chunk_size:
+                        text = ''.join(blocks)
+                        yield text, line_number
+                        line_number += text.count('\n') + 1
+                        blocks = []
+                        size = 0
+                if blocks:
+                    text = ''.join(blocks)
+                    yield text, line_number
+                    line_number += text.count('\n') + 1
+            finally:
+                input_handle.close()
+
+    def sort_runs(self):
+        """
+            Sorts the chunks of the input into run files. The records with a malformed time at the start of a chunk
+            get the time of the last record of the chunks before it and are written to one more run file.
+        """
+        header_fields = sessionize.extract_required_fields_order(self.readline(), sessionize.REQUIRED_FIELDS)
+        indices = header_fields[:3]     # ip, date and time
+
+        def run_path(i):
+            return os.path.join(self.temp_dir, 'run_%d.txt' % i)
+
+        results = []
+        if self.workers > 1:
+            pool = multiprocessing.Pool(self.workers)
+            try:
+                pending = []
+                for i, (text, first_line_number) in enumerate(self.read_chunks()):
+                    if len(pending) >= self.workers:
+                        results.append(pending.pop(0).get())
+                    pending.append(pool.apply_async(sort_chunk, (text, first_line_number, indices, run_path(i))))
+                results.extend(result.get() for result in pending)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for i, (text, first_line_number) in enumerate(self.read_chunks()):
+                results.append(sort_chunk(text, first_line_number, indices, run_path(i)))
+
+        self.run_paths = [run_path(i) for i in range(len(results))]
+        leading_records = []
+        last_date_time = None
+        for chunk_leading_records, chunk_last_date_time in results:
+            if last_date_time is not None:
+                leading_records.extend((last_date_time, line_number, line)
+                                       for line_number, line in chunk_leading_records)
+            if chunk_last_date_time is not None:
+                last_date_time = chunk_last_date_time
+        if leading_records:
+            leading_records.sort()
+            self.run_paths.append(run_path(len(results)))
+            with open(self.run_paths[-1], 'w') as run_handle:
+                run_handle.writelines('%d,%d,%s\n' % record for record in leading_records)
+
+    def read_blocks(self, block_size=sessionize.BLOCK_SIZE):
+        """
+            Sorts the input and generates the sorted records in blocks (see sessionization.read_blocks).
+
+        :param block_size: approximate number of characters of a block
+        :return: a generator of (block, None) tuples
+        """
+        self.sort_runs()
+        run_handles = [open(path, 'r') for path in self.run_paths]
+        try:
+            lines = []
+            size = 0
+            for line in heapq.merge(*run_handles, key=run_line_key):
+                line = line.split(',', 2)[2]
+                lines.append(line)
+                size += len(line)
+                if size >= block_size:
+                    yield ''.join(lines), None
+                    lines = []
+                    size = 0
+            if lines:
+                yield ''.join(lines), None
+        finally:
+            sessionize.close_files(run_handles)
+
+    def close(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+def parse_arguments(argv):
+    """
+        Parses the command line arguments.
+
+    :param argv: list of the command line arguments
+    :return: the parsed arguments
+    """
+    parser = argparse.ArgumentParser(description='Sorts EDGAR log files by time with an external merge sort.')
+    parser.add_argument('input_paths', nargs='+', metavar='input_path',
+                        help='input log files, glob patterns or directories, all with the same header')
+    parser.add_argument('output_path', help='output file for the sorted log (compressed if it ends with .gz or .zst)')
+    parser.add_argument('-workers', type=int, default=1, help='number of processes sorting chunks of the input')
+    parser.add_argument('-chunk_size', type=int, default=CHUNK_SIZE >> 20,
+                        help='size in MB of the chunks of input sorted in memory by each process')
+    parser.add_argument('-temp_dir', help='directory of the temporary run files')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('-workers should be at least 1.')
+    if args.chunk_size < 1:
+        parser.error('-chunk_size should be at least 1.')
+    args.input_paths = expand_input_paths(args.input_paths)
+    if not args.input_paths:
+        parser.error('no input file matches the input paths.')
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_arguments(sys.argv[1:])
+    sorted_input = SortedInput(args.input_paths, args.workers, args.chunk_size << 20, args.temp_dir)
+    try:
+        output_handle, = sessionize.open_files([(args.output_path, 'w')])
+        output_handle.write(sorted_input.readline())
+        for block, _ in sorted_input.read_blocks():
+            output_handle.write(block)
+        sessionize.close_files([output_handle])
+    finally:
+        sorted_input.close()
@@ -0,0 +1,126 @@
+import os
+import time
+import sessionization as sessionize
+
+
+POLL_INTERVAL = 1.0         # number of seconds to wait for new data at the end of the log file
+MAX_LATENCY = 1.0           # default maximum number of seconds a closed session waits in the output buffer
+
+
+class LogFollower(object):
+    """
+        A read-only handle of a growing log file, like 'tail -F': at the end of the file it waits for new records
+        instead of stopping, and when the log file is rotated (moved or removed and created again, or truncated) it
+        continues with the new file from its beginning, skipping its header if it repeats the header of the first
+        file. It can be passed to sessionization.process_data_stream as input_handle: the header is read with readline
+        and the records with read_blocks, which also generates an empty block every poll_interval seconds without new
+        data so that process_data_stream can expire sessions on the wall clock (see its max_latency parameter).
+    """
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL, idle_timeout=None, clock=time.time, sleep=time.sleep):
+        """
+        :param path: path of the log file
+        :param poll_interval: number of seconds to wait before checking for new data at the end of the file
+        :param idle_timeout: stop following after this many seconds without new data (None to follow forever)
+        :param clock: function returning the current time in seconds
+        :param sleep: function waiting for a number of seconds
+        """
+        self.path = path
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.handle = open(path, 'rb')
+        self.header = None
+
+    def close(self):
+        self.handle.close()
+
+    def wait(self, idle_since):
+        """
+            Waits poll_interval seconds for new data.
+
+        :param idle_since: the time at which the last data was read
+        :return: False if idle_timeout is passed, True otherwise
+        """
+        if self.idle_timeout is not None and self.clock() - idle_since >= self.idle_timeout:
+            return False
+        self.sleep(self.poll_interval)
+        return True
+
+    def is_rotated(self):
+        """
+            Checks whether path refers to another file than the one being read, or the file was truncated.
+
+        :return: True if the log file is rotated
+        """
+        try:
+            path_stat = os.stat(self.path)
+        except OSError:
+            return False    # moved away but not created yet, the old file might still get a few records
+        handle_stat = os.fstat(self.handle.fileno())
+        return path_stat.st_ino != handle_stat.st_ino or path_stat.st_size < self.handle.tell()
+
+    def reopen(self):
+        self.handle.close()
+        self.handle = open(self.path, 'rb')
+
+    def readline(self):
+        """
+            Reads the header of the log file, waiting until a complete line is written.
+
+        :return: the header decoded as UTF-8 (empty if idle_timeout is passed before a line is written)
+        """
+        line = b''
+        idle_since = self.clock()
+        while True:
+            line += self.handle.readline()
+            if line.endswith(b'\n'):
+                break
+            if not self.wait(idle_since):
+                break
+        self.header = line.rstrip(b'\r\n')
+        return sessionize.decode_block(line)
+
+    def read_blocks(self, block_size=sessionize.BLOCK_SIZE):
+        """
+            Generates the records of the log file after its header in blocks cut at line boundaries (see
+            sessionization.read_blocks). A line is only generated once its new line character is written, except for
+            the last line of a rotated file. An empty block is generated after each poll_interval without new data.
+
+        :param block_size: number of bytes read at once
+        :return: a generator of (block, None) tuples
+        """
+        remainder = b''
+        at_start = False        # True until the first line of a rotated file is checked for a header
+        idle_since = self.clock()
+
+        while True:
+            data = self.handle.read(block_size)
+            if data:
+                idle_since = self.clock()
+                data = remainder + data
+                if at_start:
+                    end = data.find(b'\n') + 1
+                    if end == 0:
+                        remainder = data
+                        continue
+                    if data[:end].rstrip(b'\r\n') == self.header:
+                        data = data[end:]
+                    at_start = False
+                end = data.rfind(b'\n') + 1
+                remainder = data[end:]
+                if end:
+                    yield sessionize.decode_block(data[:end]), None
+            elif self.is_rotated():
+                if remainder and not at_start:
+                    yield sessionize.decode_block(remainder), None
+                remainder = b''
+                at_start = True
+                self.reopen()
+            elif self.wait(idle_since):
+                yield '', None
+            else:
+                if remainder and not at_start:
+                    yield sessionize.decode_block(remainder), None
+                return
@@ -0,0 +1,320 @@
+import json
+import zlib
+import heapq
+from array import array
+from operator import itemgetter
+from itertools import chain
+from collections import Counter
+import sessionization as sessionize
+
+
+TOP_K = 10                  # number of heaviest values of each field in a report
+CAPACITY_FACTOR = 10        # a Space-Saving summary monitors CAPACITY_FACTOR times more values than it reports
+SKETCH_WIDTH = 1 << 14      # counters per row of the Count-Min Sketch, an error of about 2e-4 of all requests
+SKETCH_DEPTH = 4            # rows of the Count-Min Sketch, the error bound fails with probability about 2%
+SKETCH_PENDING = 1 << 16    # distinct values a Count-Min Sketch counts exactly before it hashes them into its rows
+MIN_FLAGGED_REQUESTS = 10   # a session needs at least this number of requests to be flagged by its rate
+FIELDS = ['ip', 'cik', 'accession']
+SIGNALS = ['crawler', 'noagent']    # fields of the EDGAR logs set to 1 for a self-declared crawler and no user agent
+UNSET_VALUES = frozenset(['', '0', '0.0'])
+
+
+class CountMinSketch(object):
+    """
+        Estimates the number of occurrences of any value in fixed memory: each value is counted in one counter per
+        row chosen by a hash of the value, and its estimate is the smallest of its counters, which is never less than
+        its true count. The rows are indexed by double hashing of the CRC-32 and Adler-32 checksums of the value, so the
+        estimates do not depend on the hash seed of the process.
+        The counts added a block at a time are summed exactly until SKETCH_PENDING distinct values are pending, so a
+        value which occurs in many blocks, like the ip of a long session, is only hashed once for all of them.
+    """
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.counters = [array('q', bytes(8 * width)) for _ in range(depth)]
+        self.total = 0
+        self.pending = Counter()    # value -> count not added to the rows yet
+
+    def indices(self, value):
+        data = value.encode('utf-8')
+        first = zlib.crc32(data)
+        second = zlib.adler32(data) | 1
+        return [(first + i * second) % self.width for i in range(self.depth)]
+
+    def add(self, value, count=1):
+        """
+            Adds count occurrences of value.
+
+        :return: the estimated number of occurrences of value, including these
+        """
+        estimate = None
+        for row, index in zip(self.counters, self.indices(value)):
+            row[index] += count
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        self.total += count
+        return estimate + self.pending.get(value, 0)
+
+    def add_counts(self, counts):
+        """
+            Adds the counts of the values of a block of the stream.
+
+        :param counts: a collections.Counter of the values of the block
+        """
+        self.pending.update(counts)
+        self.total += sum(counts.values())
+        if len(self.pending) >= SKETCH_PENDING:
+            self.flush()
+
+    def flush(self):
+        """
+            Adds the pending counts to the rows, with the indices of each value computed inline (see indices).
+        """
+        width = self.width
+        counters = self.counters
+        for value, count in self.pending.items():
+            data = value.encode('utf-8')
+            index = zlib.crc32(data)
+            step = zlib.adler32(data) | 1
+            for row in counters:
+                row[index % width] += count
+                index += step
+        self.pending = Counter()
+
+    def estimate(self, value):
+        return (min(row[index] for row, index in zip(self.counters, self.indices(value))) +
+                self.pending.get(value, 0))
+
+
+class SpaceSaving(object):
+    """
+        Finds the most frequent values of a stream by monitoring at most capacity of them (the Space-Saving
+        algorithm): a value which is not monitored replaces the monitored value with the smallest count and takes over
+        its count, which is kept as the error of the new value. Every value occurring more than 1 / capacity of the
+        time is monitored, and its count overestimates its true count by at most its error.
+        The smallest count is found with a min-heap whose entries are only updated when they reach its top.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}        # value -> [count, error]
+        self.heap = []          # (count, value) entries, the count may be out of date
+
+    def smallest(self):
+        """
+        :return: the smallest count of the monitored values, after updating the heap entries which are out of date
+        """
+        while True:
+            smallest, value = self.heap[0]
+            current = self.counts[value][0]
+            if current == smallest:
+                return smallest
+            heapq.heapreplace(self.heap, (current, value))
+
+    def add(self, value, count=1):
+        monitored = self.counts.get(value)
+        if monitored is not None:
+            monitored[0] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[value] = [count, 0]
+            heapq.heappush(self.heap, (count, value))
+            return
+        smallest = self.smallest()
+        del self.counts[self.heap[0][1]]
+        self.counts[value] = [smallest + count, smallest]
+        heapq.heapreplace(self.heap, (smallest + count, value))
+
+    def add_counts(self, counts):
+        """
+            Adds the counts of the values of a block of the stream. The monitored values are counted first. A value
+            which is not monitored occurred at most as many times as the smallest count before the block, so it is
+            only admitted, in the place of the value with the smallest count, while that bound plus its count in the
+            block is larger than the current smallest count: below that, admitting it and evicting it again would not
+            change what the summary guarantees. The values are tried from the most frequent in the block, so the
+            admissions stop at the first value which fails, and a block whose largest count can not pass is dropped
+            after one comparison.
+
+        :param counts: a collections.Counter of the values of the block
+        """
+        monitored = self.counts
+        capacity = self.capacity
+        bound = self.smallest() if len(monitored) >= capacity else 0
+        for value in monitored.keys() & counts.keys():
+            monitored[value][0] += counts[value]
+        largest = max(counts.values())
+        if len(monitored) >= capacity and bound + largest <= self.heap[0][0]:
+            return
+        # in the order of counts.most_common(), but only the repeated values are sorted: the values which occur once,
+        # usually most of them, follow in the order of their first occurrence
+        ordered = counts.items()
+        if largest > 1:
+            ordered = chain(sorted([item for item in ordered if item[1] > 1], key=itemgetter(1), reverse=True),
+                            (item for item in ordered if item[1] == 1))
+        for value, count in ordered:
+            if value in monitored:
+                continue
+            if len(monitored) < capacity:
+                monitored[value] = [count, 0]
+                heapq.heappush(self.heap, (count, value))
+                continue
+            smallest = self.smallest()
+            if bound + count <= smallest:
+                break
+            del monitored[self.heap[0][1]]
+            monitored[value] = [smallest + count, smallest]
+            heapq.heapreplace(self.heap, (smallest + count, value))
+
+    def top(self, k):
+        """
+        :param k: number of values
+        :return: a list of [value, count, error] lists of the k most frequent values, the most frequent first and ties
+                 broken by value
+        """
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1][0], item[0]))[:k]
+        return [[value, count, error] for value, (count, error) in ranked]
+
+
+class HeavyHitters(object):
+    """
+        Finds the heaviest ips, CIKs and accessions of the stream and the sessions which are likely crawlers, in the
+        same pass as the sessions and in bounded memory. sessionization.read_requests hands the requests of each block
+        of input over to add_requests of this class, which counts their values with a Counter and adds the counts to a
+        Space-Saving summary per field (see SpaceSaving.add_counts) and to a Count-Min Sketch of the ips (see
+        CountMinSketch), so the summaries are updated once per distinct value of a block and not per request.
+        With signals, the SIGNALS fields of the log, when its header has them, tell the requests of clients which
+        declare themselves a crawler or send no user agent; their numbers are in the reports.
+        At the end of every block the sessions of the ips of the block are checked, and a session with at least
+        MIN_FLAGGED_REQUESTS requests whose number of requests per second of its duration is at least rate_threshold,
+        or which sent a request with one of the signals in the block, is written once as a JSON line
+        {"flagged_session": {...}} with the reasons it is flagged. A report of the top k values of each field is
+        written as a JSON line every report_interval seconds of log time and at the end of the stream.
+    """
+
+    def __init__(self, report_handle=None, k=TOP_K, rate_threshold=None, report_interval=3600, signals=False):
+        """
+        :param report_handle: an optional file handle the reports and the flagged sessions are written to
+        :param k: number of values of each field in a report
+        :param rate_threshold: requests per second from which a session is flagged, None to flag no session
+        :param report_interval: seconds of log time between two reports written while the stream is processed, None
+                                to only write the final report
+        :param signals: True to also read the SIGNALS fields, which makes the records longer to split
+        """
+        self.report_handle = report_handle
+        self.k = k
+        self.rate_threshold = rate_threshold
+        self.report_interval = report_interval
+        self.fields = list(SIGNALS) if signals else []  # value fields read along with the requests
+        self.signal_indices = []        # (signal, index of its value in the values of a request)
+        self.summaries = {field: SpaceSaving(k * CAPACITY_FACTOR) for field in FIELDS}
+        self.ip_sketch = CountMinSketch()
+        self.requests = 0
+        self.signal_requests = dict.fromkeys(SIGNALS, 0)
+        self.flagged = {}           # ip -> start of its flagged session
+        self.flagged_sessions = 0
+        self.request_dict = {}
+        self.latest_date_time = None
+        self.next_report = None
+
+    def track(self, request_dict, value_fields=()):
+        """
+            Keeps a reference to the open sessions of the stream, whose rates are checked.
+
+        :param request_dict: the open sessions
+        :param value_fields: the value fields the requests are read with, which include the fields of this object
+        """
+        self.request_dict = request_dict
+        # the values of a request start with its cik, accession and extention
+        self.signal_indices = [(signal, 3 + list(value_fields).index(signal)) for signal in SIGNALS
+                               if signal in value_fields]
+
+    def add_requests(self, requests):
+        """
+            Counts the values of the requests of a block, checks the sessions of its ips and writes a report when one
+            is due. sessionization.read_requests calls it once the requests of the block are added to the sessions.
+
+        :param requests: list of (ip, date_time, counter, values) tuples, see sessionization.read_requests
+        """
+        if not requests:
+            return
+        self.requests += len(requests)
+        ip_counts = Counter(map(itemgetter(0), requests))
+        values = list(map(itemgetter(3), requests))
+        cik_counts = Counter(map(itemgetter(0), values))
+        accession_counts = Counter(map(itemgetter(1), values))
+        for field, counts in zip(FIELDS, (ip_counts, cik_counts, accession_counts)):
+            self.summaries[field].add_counts(counts)
+        self.ip_sketch.add_counts(ip_counts)
+
+        signals = {}                # ip -> signals of its requests in the block
+        for signal, index in self.signal_indices:
+            # a field without the signal is empty or 0
+            signal_ips = [request[0] for request in requests if request[3][index] not in UNSET_VALUES]
+            self.signal_requests[signal] += len(signal_ips)
+            for ip in set(signal_ips):
+                signals.setdefault(ip, []).append(signal)
+        if self.rate_threshold is not None:
+            for ip in ip_counts:
+                self.check_session(ip, signals.get(ip, []))
+
+        latest_date_time = self.latest_date_time = requests[-1][1]
+        if self.report_interval is not None:
+            if self.next_report is None:
+                self.next_report = latest_date_time + self.report_interval
+            elif latest_date_time >= self.next_report:
+                self.write_report()
+                self.next_report = latest_date_time + self.report_interval
+
+    def check_session(self, ip, signals):
+        """
+            Flags the open session of ip if its request rate is at least rate_threshold or it sent requests with some
+            of the signals, and it is not flagged yet.
+
+        :param ip: an ip of the block
+        :param signals: the signals of the requests of ip in the block
+        """
+        session_info = self.request_dict.get(ip)
+        if session_info is None or session_info.count < MIN_FLAGGED_REQUESTS:
+            return
+        rate = session_info.count / (session_info.end - session_info.start + 1)
+        reasons = (['rate'] if rate >= self.rate_threshold else []) + signals
+        if not reasons or self.flagged.get(ip) == session_info.start:
+            return
+        self.flagged[ip] = session_info.start
+        self.flagged_sessions += 1
+        self.write({'flagged_session': {'ip': ip, 'start': sessionize.format_timestamp(session_info.start),
+                                        'end': sessionize.format_timestamp(session_info.end),
+                                        'requests': session_info.count, 'rate': round(rate, 3),
+                                        'ip_requests': self.ip_sketch.estimate(ip), 'reasons': reasons}})
+
+    def report(self):
+        """
+        :return: a dictionary with the number of requests, of requests with each of the signals and of flagged
+                 sessions so far and the top k [value, count, error] of each field (see SpaceSaving.top)
+        """
+        report = {'time': (sessionize.format_timestamp(self.latest_date_time)
+                           if self.latest_date_time is not None else None),
+                  'requests': self.requests, 'flagged_sessions': self.flagged_sessions}
+        for signal in SIGNALS:
+            report['%s_requests' % signal] = self.signal_requests[signal]
+        for field in FIELDS:
+            report['top_%ss' % field] = self.summaries[field].top(self.k)
+        return report
+
+    def write(self, line):
+        if self.report_handle is not None:
+            self.report_handle.write(json.dumps(line, sort_keys=True) + '\n')
+
+    def write_report(self):
+        """
+            Writes the report as a JSON line to report_handle, if there is one, and forgets the flagged sessions which
+            are closed.
+        """
+        self.write(self.report())
+        if self.report_handle is not None:
+            self.report_handle.flush()
+        for ip, start in list(self.flagged.items()):
+            session_info = self.request_dict.get(ip)
+            if session_info is None or session_info.start != start:
+                del self.flagged[ip]
@@ -0,0 +1,144 @@
+import json
+import time
+
+
+STAGES = ['read', 'parse', 'validate', 'expiry', 'output']
+REJECTION_REASONS = ['short_record', 'empty_ip', 'bad_date_time']
+
+
+class TimedOutput(object):
+    """
+        A write-only wrapper of an output file handle which adds the time spent in its write calls, and the number of
+        lines written, to a StreamStats.
+    """
+    __slots__ = ('output_handle', 'stats')
+
+    def __init__(self, output_handle, stats):
+        self.output_handle = output_handle
+        self.stats = stats
+
+    def write(self, text):
+        start = time.perf_counter()
+        self.output_handle.write(text)
+        self.stats.seconds['output'] += time.perf_counter() - start
+        self.stats.sessions_written += text.count('\n')
+
+
+class StreamStats(object):
+    """
+        Per stage timings and counters of a run of sessionization.process_data_stream. The stages are
+           read: reading and decoding the blocks of input,
+           parse: splitting the records into their fields,
+           validate: checking and converting the fields (see check_field_validity_and_cleanup),
+           expiry: closing and formatting the expired sessions (see write_closed_sessions), without the time of
+                   output,
+           output: the write calls of the output file.
+        sessionization.read_requests parses and validates the records one block at a time and hands each block over
+        to add_block, so that the clock is read a few times per block and not per record, and when no StreamStats is
+        passed to process_data_stream nothing of this is run at all.
+        A report (see report) can be written as a JSON line every interval seconds and at the end of the stream.
+    """
+
+    def __init__(self, stats_handle=None, interval=None):
+        """
+        :param stats_handle: an optional file handle the reports are written to as JSON lines
+        :param interval: number of seconds between two reports written while the stream is processed, None to only
+                         write the final report
+        """
+        self.stats_handle = stats_handle
+        self.interval = interval
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.rejected = dict.fromkeys(REJECTION_REASONS, 0)
+        self.lines_read = 0
+        self.requests = 0
+        self.sessions_written = 0
+        self.peak_open_sessions = 0
+        self.request_dict = {}
+        self.expiration_dict = {}
+        self.start_time = self.last_report = time.time()
+        self.expiry_start = None
+
+    def track(self, request_dict, expiration_dict):
+        """
+            Sets the session store whose size is reported.
+
+        :param request_dict: the dictionary of open sessions
+        :param expiration_dict: the dictionary of expiration buckets
+        """
+        self.request_dict = request_dict
+        self.expiration_dict = expiration_dict
+
+    def time_output(self, output_handle):
+        """
+        :param output_handle: file handle for the output file
+        :return: a TimedOutput of output_handle
+        """
+        return TimedOutput(output_handle, self)
+
+    def start_expiry(self):
+        if len(self.request_dict) > self.peak_open_sessions:
+            self.peak_open_sessions = len(self.request_dict)
+        self.expiry_start = (time.perf_counter(), self.seconds['output'])
+
+    def stop_expiry(self):
+        start, output_seconds = self.expiry_start
+        self.seconds['expiry'] += time.perf_counter() - start - (self.seconds['output'] - output_seconds)
+
+    def time_reads(self, blocks):
+        """
+            Adds the time spent in reading each block of input to the read stage.
+
+        :param blocks: a generator of (block, offset) tuples, see sessionization.read_blocks
+        :return: a generator of the same tuples
+        """
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            block = next(blocks, None)
+            self.seconds['read'] += clock() - start
+            if block is None:
+                return
+            yield block
+
+    def add_block(self, lines, rejected, requests, parse_seconds, validate_seconds):
+        """
+            Counts the records of a block of input and the time spent in parsing and validating them, called by
+            sessionization.read_requests, and writes a report when one is due.
+
+        :param lines: the lines of the block
+        :param rejected: the ips of the records which were rejected by the validation
+        :param requests: the valid requests of the block
+        :param parse_seconds: time spent in splitting the lines into their fields
+        :param validate_seconds: time spent in checking and converting the fields
+        """
+        lines_read = len(lines) - lines.count('')
+        self.lines_read += lines_read
+        self.requests += len(requests)
+        self.rejected['short_record'] += lines_read - len(rejected) - len(requests)
+        empty_ips = sum(1 for ip in rejected if not ip.strip())
+        self.rejected['empty_ip'] += empty_ips
+        self.rejected['bad_date_time'] += len(rejected) - empty_ips
+        self.seconds['parse'] += parse_seconds
+        self.seconds['validate'] += validate_seconds
+        if self.interval is not None and time.time() - self.last_report >= self.interval:
+            self.write_report()
+
+    def report(self):
+        """
+        :return: a dictionary of the timings and counters so far
+        """
+        now = time.time()
+        return {'time': now, 'elapsed': now - self.start_time, 'lines_read': self.lines_read,
+                'requests': self.requests, 'rejected': dict(self.rejected), 'sessions_written': self.sessions_written,
+                'open_sessions': len(self.request_dict), 'expiration_buckets': len(self.expiration_dict),
+                'peak_open_sessions': max(self.peak_open_sessions, len(self.request_dict)),
+                'seconds': dict(self.seconds)}
+
+    def write_report(self):
+        """
+            Writes the report as a JSON line to stats_handle, if there is one.
+        """
+        self.last_report = time.time()
+        if self.stats_handle is not None:
+            self.stats_handle.write(json.dumps(self.report(), sort_keys=True) + '\n')
+            self.stats_handle.flush()
@@ -0,0 +1,154 @@
+import os
+import glob
+from concurrent.futures import ThreadPoolExecutor
+import compressed_files
+import sessionization as sessionize
+
+
+def expand_input_paths(patterns):
+    """
+        Expands the input paths given on the command line: a glob pattern is replaced by the sorted paths matching it
+        and a directory by the sorted paths of the files in it. Daily EDGAR logs (log20170630.csv, ...) sort in
+        chronological order.
+
+    :param patterns: list of paths, glob patterns or directories
+    :return: list of file paths
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(sorted(path for path in glob.glob(os.path.join(pattern, '*')) if os.path.isfile(path)))
+        elif glob.has_magic(pattern):
+            paths.extend(sorted(glob.glob(pattern)))
+        else:
+            paths.append(pattern)
+    return paths
+
+
+def open_prefetched(path):
+    """
+        Opens an input file and starts reading it in the background: a compressed file starts its decompression
+        thread (see compressed_files.DecompressingReader), for a plain file the kernel is asked to read it ahead.
+
+    :param path: path of the input file
+    :return: a file handle
+    """
+    if compressed_files.detect_compression(path) is not None:
+        return compressed_files.open_input(path)
+    input_handle = open(path, 'r')
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(input_handle.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+    return input_handle
+
+
+class InputFiles(object):
+    """
+        A read-only handle of a list of chronologically ordered log files which are read as one continuous stream,
+        so that sessions continue across the boundary of two files. Each file has its own header, which is detected
+        again at the start of the file. While a file is read the next one is opened and prefetched by a background
+        thread.
+
+        readline returns the header of the first file, and sessionization.read_requests hands the reading of the
+        records over to read_requests of this class, so an InputFiles can be used in place of an input file handle by
+        all the sessionization engines.
+    """
+
+    def __init__(self, paths):
+        """
+        :param paths: list of paths of the log files in chronological order
+        """
+        self.paths = paths
+        self.executor = ThreadPoolExecutor(1)
+        self.next_file = self.executor.submit(open_prefetched, paths[0]) if paths else None
+        self.next_index = 0
+        self.input_handle = None
+        self.header_read = False
+
+    def open_next_file(self):
+        """
+            Closes the current file, switches to the next file and starts prefetching the one after it.
+
+        :return: False if there is no next file
+        """
+        if self.input_handle is not None:
+            self.input_handle.close()
+            self.input_handle = None
+        if self.next_file is None:
+            return False
+        self.input_handle = self.next_file.result()
+        self.next_index += 1
+        self.next_file = (self.executor.submit(open_prefetched, self.paths[self.next_index])
+                          if self.next_index < len(self.paths) else None)
+        self.header_read = False
+        return True
+
+    def readline(self):
+        """
+            Reads the header of the first file.
+
+        :return: the header line (empty if there is no input file)
+        """
+        if self.input_handle is None and not self.open_next_file():
+            return ''
+        self.header_read = True
+        return self.input_handle.readline()
+
+    def read_requests(self, req_fields, latest_date_time=None, counter=0, on_block=None, stats=None,
+                      value_fields=None, on_requests=None):
+        """
+            Generates the valid requests of all the files (see sessionization.read_requests). The time and counter of
+            the last request of a file are carried over to the next one, and the order of the fields is read from the
+            header of each file.
+
+        :param req_fields: order of the required fields of the current file if its header is already read
+        :param latest_date_time: latest time seen before the current position
+        :param counter: counter of the last request seen before the current position
+        :param on_block: see sessionization.read_requests
+        :param stats: see sessionization.read_requests
+        :param value_fields: see sessionization.read_requests
+        :param on_requests: see sessionization.read_requests
+        :return: a generator of (ip, date_time, counter) tuples, or (ip, date_time, counter, values) tuples if
+                 value_fields is given
+        """
+        if self.input_handle is None and not self.open_next_file():
+            return
+        while True:
+            if not self.header_read:
+                req_fields = sessionize.get_order_of_required_fields(self.input_handle, value_fields or ())
+                self.header_read = True
+            for request in sessionize.read_requests(self.input_handle, req_fields, latest_date_time, counter,
+                                                    on_block, stats, value_fields, on_requests):
+                latest_date_time, counter = request[1], request[2]
+                yield request
+            if not self.open_next_file():
+                break
+
+    def read_file_blocks(self, req_fields, block_size=sessionize.BLOCK_SIZE):
+        """
+            Generates the blocks of all the files (see sessionization.read_blocks) along with the order of the required
+            fields of the file each block comes from, for a reader which splits the records itself in another thread
+            (see pipelined_sessionization.Pipeline). The header of each file is detected again at its start.
+
+        :param req_fields: order of the required fields of the current file if its header is already read
+        :param block_size: number of characters read at once
+        :return: a generator of (block, offset, req_fields) tuples
+        """
+        if self.input_handle is None and not self.open_next_file():
+            return
+        while True:
+            if not self.header_read:
+                req_fields = sessionize.get_order_of_required_fields(self.input_handle)
+                self.header_read = True
+            for block, offset in sessionize.read_blocks(self.input_handle, block_size):
+                yield block, offset, req_fields
+            if not self.open_next_file():
+                break
+
+    def close(self):
+        if self.input_handle is not None:
+            self.input_handle.close()
+            self.input_handle = None
+        if self.next_file is not None:
+            self.next_file.result().close()
+            self.next_file = None
+        self.executor.shutdown()
@@ -0,0 +1,252 @@
+import os
+import zlib
+import heapq
+import shutil
+import operator
+import tempfile
+import multiprocessing
+import sessionization as sessionize
+
+
+CHUNK_SIZE = 1 << 24        # number of characters of input parsed at once by a worker
+NEVER_EXPIRED = 2 ** 63     # expiration key of the sessions which are still open at the end of the stream
+
+
+def shard_line_key(line):
+    """
+        Returns the sort key of a line of a shard file which has this form:
+           'expiration_time,session_start_date_time,line_number,output_line'
+        with the first three values as integers.
+
+    :param line: a line of a shard file
+    :return: a tuple (expiration_time, session_start_date_time, line_number)
+    """
+    exp_time, start, line_number, _ = line.split(',', 3)
+    return int(exp_time), int(start), int(line_number)
+
+
+def shard_of(ip, workers):
+    """
+        Returns the shard of an ip, the same in every process whatever the hash seed of the process.
+
+    :param ip: ip of a request, stripped
+    :param workers: number of shards
+    :return: an integer between 0 and workers - 1
+    """
+    return zlib.crc32(ip.encode('utf-8')) % workers
+
+
+def read_chunks(input_handle, req_fields, chunk_size=CHUNK_SIZE):
+    """
+        Reads the input and generates chunks of lines of about chunk_size characters which do not span two files of
+        a multi_file_input.InputFiles, along with the order of the required fields of their file and the number of
+        their first line in the whole input. Nothing is parsed here.
+
+    :param input_handle: file handle for the input file (or a multi_file_input.InputFiles), positioned after the
+                         header
+    :param req_fields: a dictionary with name of required fields as the key and their index as value
+    :param chunk_size: number of characters of a chunk
+    :return: a generator of (text, first_line_number, req_fields) tuples
+    """
+    if hasattr(input_handle, 'read_file_blocks'):
+        blocks = input_handle.read_file_blocks(req_fields)
+    else:
+        blocks = ((block, offset, req_fields) for block, offset in sessionize.read_blocks(
+            input_handle, min(chunk_size, sessionize.BLOCK_SIZE)))
+    line_number = 0
+    chunk = []
+    size = 0
+    for block, _, block_req_fields in blocks:
+        if chunk and (size >= chunk_size or block_req_fields is not req_fields):
+            text = ''.join(chunk)
+            yield text, line_number, req_fields
+            line_number += text.count('\n') + 1
+            chunk = []
+            size = 0
+        req_fields = block_req_fields
+        chunk.append(block)
+        size += len(block)
+    if chunk:
+        yield ''.join(chunk), line_number, req_fields
+
+
+def parse_chunk(text, first_line_number, req_fields, workers, chunk_paths):
+    """
+        Parses and validates the records of a chunk of input and writes each valid request to the file of the shard
+        of its ip as a line 'line_number,date_time,ip', in input order. A record with a malformed date or time takes
+        the time of the record before it, as in sessionization.check_field_validity_and_cleanup; the ones at the start
+        of the chunk do not know that time yet and are written with an empty time, which sessionize_shard fills in
+        (see external_sort.sort_chunk).
+
+    :param text: lines of input
+    :param first_line_number: line number in the input of the first line of text
+    :param req_fields: a dictionary with name of required fields as the key and their index as value
+    :param workers: number of shards
+    :param chunk_paths: path of the file of each shard for this chunk
+    :return: a tuple (last_date_time, max_date_time) of the time of the last request of the chunk and the latest
+             time of the chunk (both None if it has no request with a valid time)
+    """
+    indices = [req_fields[key] for key in sessionize.REQUIRED_FIELDS]
+    max_split = max(indices) + 1
+    get_fields = operator.itemgetter(*indices[:3])     # ip, date and time
+    parse_timestamp = sessionize.parse_timestamp
+    shards = [[] for _ in range(workers)]
+    last_date_time = None
+    max_date_time = None
+    for line_number, line in enumerate(text.split('\n'), first_line_number):
+        all_fields = line.split(',', max_split)
+        if len(all_fields) < max_split:
+            continue
+        ip, d, t = get_fields(all_fields)
+        ip = ip.strip()
+        if not ip:
+            continue
+        try:
+            last_date_time = parse_timestamp(d, t)
+        except ValueError:
+            if last_date_time is None:
+                shards[shard_of(ip, workers)].append('%d,,%s\n' % (line_number, ip))
+                continue
+        if max_date_time is None or last_date_time > max_date_time:
+            max_date_time = last_date_time
+        shards[shard_of(ip, workers)].append('%d,%d,%s\n' % (line_number, last_date_time, ip))
+
+    for requests, chunk_path in zip(shards, chunk_paths):
+        with open(chunk_path, 'w') as chunk_handle:
+            chunk_handle.writelines(requests)
+    return last_date_time, max_date_time
+
+
+def sessionize_shard(chunk_paths, leading_date_times, last_date_time, inactivity_interval, shard_path):
+    """
+        Runs the session state machine on the requests of one shard, read from the file of the shard for each chunk
+        in input order, and writes the closed sessions to shard_path prefixed by their sort key (see shard_line_key),
+        ordered by that key. The line number of the first request of a session is its counter, so sessions which
+        start in the same second are ordered by their appearance in the input.
+
+    :param chunk_paths: paths of the files of this shard written by parse_chunk, in input order
+    :param leading_date_times: for each chunk, the time of the last request before it, which the requests at its
+                               start with a malformed time take (None if there is none, which drops them)
+    :param last_date_time: latest time of the whole stream, which decides whether a session still open at the end
+                           of this shard would have expired in the serial path or not
+    :param inactivity_interval: inactivity interval in seconds after which a session is considered as expired
+    :param shard_path: path of the shard file
+    """
+    request_dict = {}
+    expiration_dict = {}
+    expiration_heap = []
+    latest_date_time = None
+
+    with open(shard_path, 'w') as shard_handle:
+        for chunk_path, leading_date_time in zip(chunk_paths, leading_date_times):
+            with open(chunk_path, 'r') as chunk_handle:
+                for line in chunk_handle:
+                    line_number, date_time, ip = line[:-1].split(',', 2)
+                    if date_time:
+                        date_time = int(date_time)
+                    elif leading_date_time is not None:
+                        date_time = leading_date_time
+                    else:
+                        continue
+                    if latest_date_time is not None and date_time > latest_date_time:
+                        for exp_time, closed_ip, session_info in sessionize.close_expired_sessions(
+                                date_time - 1, inactivity_interval, request_dict, expiration_dict, expiration_heap):
+                            shard_handle.write('%d,%d,%d,%s' % (exp_time, session_info.start, session_info.counter,
+                                                                sessionize.format_session_record(closed_ip,
+                                                                                                 session_info)))
+                    latest_date_time = date_time
+                    sessionize.add_request(ip, date_time, int(line_number), inactivity_interval, request_dict,
+                                           expiration_dict, expiration_heap)
+
+        # the serial path closes every session whose expiration time is before the latest time of the stream, all the
+        # others are written at the end of the stream ordered by their start time and counter
+        remaining_sessions = []
+        for ip, session_info in sessionize.close_remaining_sessions(request_dict, expiration_dict, expiration_heap):
+            exp_time = session_info.end + inactivity_interval
+            if last_date_time is None or exp_time >= last_date_time:
+                exp_time = NEVER_EXPIRED
+            remaining_sessions.append(((exp_time, session_info.start, session_info.counter),
+                                       sessionize.format_session_record(ip, session_info)))
+        remaining_sessions.sort(key=lambda r: r[0])
+        for key, record in remaining_sessions:
+            shard_handle.write('%d,%d,%d,%s' % (key + (record,)))
+
+
+def merge_shard_files(shard_paths, output_handle):
+    """
+        k-way merges the shard files by their sort key and writes the output lines to output_handle.
+
+    :param shard_paths: list of paths of the shard files, each one ordered by its sort key
+    :param output_handle: file handle for the output file
+    """
+    shard_handles = [open(path, 'r') for path in shard_paths]
+    output_buffer = sessionize.OutputBuffer(output_handle)
+    try:
+        for line in heapq.merge(*shard_handles, key=shard_line_key):
+            output_buffer.write(line.split(',', 3)[3])
+        output_buffer.flush()
+    finally:
+        sessionize.close_files(shard_handles)
+
+
+def process_data_stream_parallel(input_handle, inactivity_handle, output_handle, workers, chunk_size=CHUNK_SIZE):
+    """
+        Same as sessionization.process_data_stream but the work is shared by a pool of workers processes in two
+        passes. This process only cuts the input into chunks of lines (see read_chunks). In the first pass the workers
+        parse and validate the chunks and partition their requests by a hash of their ip into one file per shard and
+        chunk (see parse_chunk); the malformed times at the start of a chunk are resolved afterwards from the time at
+        the end of the chunks before it. In the second pass each worker runs the session state machine on the requests
+        of one shard (see sessionize_shard), and the output of the workers is merged back into the order of the
+        serial path: expiration time, then start time, then the order of appearance in the input. The serial path
+        breaks the ties of a start time with the per-second counter, which gives the same order unless the time of
+        the records goes backwards within the stream.
+
+    :param input_handle: file handle for the input file.
+    :param inactivity_handle: file handle for the inactivity interval file.
+    :param output_handle: file handle for the output file
+    :param workers: number of worker processes and of shards
+    :param chunk_size: number of characters of input parsed at once by a worker
+    """
+    inactivity_interval = sessionize.get_inactivity_interval(inactivity_handle)
+    req_fields = sessionize.get_order_of_required_fields(input_handle)
+
+    temp_dir = tempfile.mkdtemp(prefix='sessionization_')
+    pool = multiprocessing.Pool(workers)
+    try:
+        def chunk_paths(i):
+            return [os.path.join(temp_dir, 'chunk_%d_shard_%d.txt' % (i, shard)) for shard in range(workers)]
+
+        # at most one chunk per worker is waiting to be parsed
+        results = []
+        pending = []
+        for i, (text, first_line_number, chunk_req_fields) in enumerate(read_chunks(input_handle, req_fields,
+                                                                                  chunk_size)):
+            if len(pending) >= workers:
+                results.append(pending.pop(0).get())
+            pending.append(pool.apply_async(parse_chunk, (text, first_line_number, chunk_req_fields, workers,
+                                                          chunk_paths(i))))
+        results.extend(result.get() for result in pending)
+
+        leading_date_times = []
+        last_date_time = None
+        max_date_time = None
+        for chunk_last_date_time, chunk_max_date_time in results:
+            leading_date_times.append(last_date_time)
+            if chunk_last_date_time is not None:
+                last_date_time = chunk_last_date_time
+            if chunk_max_date_time is not None and (max_date_time is None or chunk_max_date_time > max_date_time):
+                max_date_time = chunk_max_date_time
+
+        shard_paths = [os.path.join(temp_dir, 'shard_%d.txt' % shard) for shard in range(workers)]
+        shards = [pool.apply_async(sessionize_shard, ([chunk_paths(i)[shard] for i in range(len(results))],
+                                                      leading_date_times, max_date_time, inactivity_interval,
+                                                      shard_paths[shard]))
+                  for shard in range(workers)]
+        for shard in shards:
+            shard.get()
+
+        merge_shard_files(shard_paths, output_handle)
+    finally:
+        pool.terminate()
+        pool.join()
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,310 @@
+import time
+import queue
+import threading
+import sessionization as sessionize
+
+
+QUEUE_SIZE = 8              # maximum number of batches waiting between two stages before the earlier one blocks
+OUTPUT_BATCH_SIZE = 1000    # number of closed sessions handed to the write stage at once
+STAGES = ['read', 'parse', 'session', 'write']
+UNITS = {'read': 'characters', 'parse': 'requests', 'session': 'requests', 'write': 'sessions'}
+END = None                  # marks the end of the batches of a queue
+
+
+class StageQueue(object):
+    """
+        A bounded queue between two stages of a Pipeline. The depth of the queue is sampled at every put and the time
+        a stage waits on the queue, for room or for a batch, is added to its waiting time. An exception put in the
+        queue by a failing stage is raised again by get, so it reaches the end of the pipeline.
+    """
+
+    def __init__(self, pipeline, size):
+        self.pipeline = pipeline
+        self.queue = queue.Queue(size)
+        self.puts = 0
+        self.depth_sum = 0
+        self.peak_depth = 0
+
+    def put(self, batch, stage):
+        depth = self.queue.qsize()
+        self.puts += 1
+        self.depth_sum += depth
+        if depth > self.peak_depth:
+            self.peak_depth = depth
+        start = time.perf_counter()
+        self.queue.put(batch)
+        self.pipeline.waiting[stage] += time.perf_counter() - start
+
+    def get(self, stage):
+        start = time.perf_counter()
+        batch = self.queue.get()
+        self.pipeline.waiting[stage] += time.perf_counter() - start
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+    def drain(self):
+        """
+            Drops the waiting batches, which unblocks a stage waiting for room in the queue.
+        """
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+
+class Pipeline(object):
+    """
+        Runs the stages of sessionization.process_data_stream concurrently, each one in its own thread, connected by
+        bounded queues (see StageQueue), so a stage blocks when the next one falls behind and the memory stays bounded:
+           read: reads the blocks of input (see sessionization.read_blocks),
+           parse: splits, validates and converts the records of each block (see sessionization.read_requests) and
+                  hands them on as one batch per block,
+           session: runs the session state machine in the calling thread and hands the closed sessions on in batches
+                    of OUTPUT_BATCH_SIZE,
+           write: formats the sessions and writes them to the output file.
+        Every stage keeps the order of its input, so the output is the same as the output of process_data_stream. Most
+        of the work holds the GIL, so the gain comes from reading and writing a slow file system while the other
+        stages run.
+    """
+
+    def __init__(self, input_handle, output_handle, queue_size=QUEUE_SIZE):
+        """
+        :param input_handle: file handle for the input file, positioned after the header
+        :param output_handle: file handle for the output file
+        :param queue_size: maximum number of batches waiting in each queue
+        """
+        self.input_handle = input_handle
+        self.output_handle = output_handle
+        self.blocks = StageQueue(self, queue_size)
+        self.requests = StageQueue(self, queue_size)
+        self.sessions = StageQueue(self, queue_size)
+        self.items = dict.fromkeys(STAGES, 0)
+        self.waiting = dict.fromkeys(STAGES, 0.0)
+        self.elapsed = dict.fromkeys(STAGES, 0.0)
+        self.write_error = None
+        self.closed = False
+        self.threads = []
+        self.req_fields = None          # order of the required fields of the blocks being parsed
+        self.next_block = None          # first block of a file with another order of the fields, not parsed yet
+
+    def start(self, req_fields):
+        """
+            Starts the read, parse and write stages.
+
+        :param req_fields: a dictionary with name of required fields as the key and their index as value
+        """
+        self.start_time = time.perf_counter()
+        self.req_fields = req_fields
+        for target, args in [(self.read, (req_fields,)), (self.parse, ()), (self.write, ())]:
+            thread = threading.Thread(target=target, args=args)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stage_done(self, stage):
+        self.elapsed[stage] = time.perf_counter() - self.start_time
+
+    def read(self, req_fields):
+        # each block goes with the order of the required fields of its file, which a multi_file_input.InputFiles
+        # detects again at the start of each file
+        try:
+            if hasattr(self.input_handle, 'read_file_blocks'):
+                blocks = self.input_handle.read_file_blocks(req_fields)
+            else:
+                blocks = ((block, offset, req_fields) for block, offset in sessionize.read_blocks(self.input_handle))
+            for block, _, block_req_fields in blocks:
+                self.items['read'] += len(block)
+                self.blocks.put((block, block_req_fields), 'read')
+                if self.closed:
+                    break
+            self.blocks.put(END, 'read')
+        except Exception as error:
+            self.blocks.put(error, 'read')
+        finally:
+            self.stage_done('read')
+
+    def read_blocks(self, block_size=None):
+        # the input of the parse stage: sessionization.read_requests reads the pipeline like an input handle (see
+        # sessionization.read_blocks). The blocks end at the first block with another order of the fields, which is
+        # kept for the next call, and at the end of the input, where req_fields is set to None.
+        while True:
+            if self.next_block is None:
+                item = self.blocks.get('parse')
+                if item is END:
+                    self.req_fields = None
+                    return
+            else:
+                item, self.next_block = self.next_block, None
+            block, req_fields = item
+            if req_fields is not self.req_fields:
+                self.next_block = item
+                self.req_fields = req_fields
+                return
+            yield block, None
+
+    def parse(self):
+        batch = []
+        latest_date_time, counter = None, 0
+
+        def end_of_block(offset):
+            nonlocal batch, latest_date_time, counter
+            if batch:
+                _, latest_date_time, counter = batch[-1]
+                self.items['parse'] += len(batch)
+                self.requests.put(batch, 'parse')
+                batch = []
+
+        try:
+            # read_requests starts again, from the time and counter it reached, at each change of the order of the
+            # fields
+            while self.req_fields is not None and not self.closed:
+                for request in sessionize.read_requests(self, self.req_fields, latest_date_time, counter,
+                                                        on_block=end_of_block):
+                    batch.append(request)
+                    if self.closed:
+                        break
+                end_of_block(None)
+            self.requests.put(END, 'parse')
+        except Exception as error:
+            self.requests.put(error, 'parse')
+        finally:
+            self.stage_done('parse')
+
+    def stream_requests(self):
+        """
+            Generates the requests of the parse stage in the order of the stream, for the session stage.
+
+        :return: a generator of (ip, date_time, counter) tuples
+        """
+        while True:
+            batch = self.requests.get('session')
+            if batch is END:
+                return
+            self.items['session'] += len(batch)
+            yield from batch
+
+    def write_sessions(self, sessions):
+        """
+            Hands a batch of closed sessions from the session stage to the write stage.
+
+        :param sessions: a list of (ip, Session object) tuples in output order
+        """
+        self.sessions.put(sessions, 'session')
+
+    def write(self):
+        output_buffer = sessionize.OutputBuffer(self.output_handle)
+        while True:
+            sessions = self.sessions.get('write')
+            if sessions is END:
+                break
+            if self.write_error is not None:
+                continue    # the batches are still taken so the session stage does not block
+            try:
+                sessionize.write_sessions(output_buffer, sessions)
+                self.items['write'] += len(sessions)
+            except Exception as error:
+                self.write_error = error
+        if self.write_error is None:
+            try:
+                output_buffer.flush()
+            except Exception as error:
+                self.write_error = error
+        self.stage_done('write')
+
+    def finish(self):
+        """
+            Ends the pipeline once the session stage has handed on its last batch: waits for the write stage and
+            raises its error if it failed.
+        """
+        self.sessions.put(END, 'session')
+        self.stage_done('session')
+        for thread in self.threads:
+            thread.join()
+        if self.write_error is not None:
+            raise self.write_error
+
+    def close(self):
+        """
+            Stops all the stages, e.g. after the session stage failed.
+        """
+        self.closed = True
+        self.sessions.put(END, 'session')
+        while any(thread.is_alive() for thread in self.threads):
+            self.blocks.drain()
+            self.requests.drain()
+            time.sleep(0.01)
+
+    def report(self):
+        """
+        :return: a dictionary with an entry per stage: the number of items it processed ('items' in 'unit'), its
+                 throughput in items per second of its running time, the share of its running time it was waiting on
+                 a queue, and the mean and peak depth of its input queue (sampled when a batch is put in it)
+        """
+        report = {}
+        input_queues = {'parse': self.blocks, 'session': self.requests, 'write': self.sessions}
+        for stage in STAGES:
+            elapsed = self.elapsed[stage]
+            report[stage] = {'items': self.items[stage], 'unit': UNITS[stage],
+                             'items_per_second': self.items[stage] / elapsed if elapsed else 0.0,
+                             'waiting_share': self.waiting[stage] / elapsed if elapsed else 0.0}
+            if stage in input_queues:
+                stage_queue = input_queues[stage]
+                report[stage]['mean_queue_depth'] = stage_queue.depth_sum / max(stage_queue.puts, 1)
+                report[stage]['peak_queue_depth'] = stage_queue.peak_depth
+        return report
+
+
+def process_data_stream_pipelined(input_handle, inactivity_handle, output_handle, pipeline_stats=None,
+                                  session_store=None, reorder_buffer=None, queue_size=QUEUE_SIZE):
+    """
+        Same as sessionization.process_data_stream, with the reading, parsing, session and writing stages run
+        concurrently (see Pipeline). The output is the same.
+
+    :param input_handle: file handle for the input file.
+    :param inactivity_handle: file handle for the inactivity interval file.
+    :param output_handle: file handle for the output file
+    :param pipeline_stats: an optional dictionary which is filled with the report of the stages (see Pipeline.report)
+    :param session_store: see sessionization.process_data_stream
+    :param reorder_buffer: see sessionization.process_data_stream
+    :param queue_size: maximum number of batches waiting between two stages
+    """
+    inactivity_interval = sessionize.get_inactivity_interval(inactivity_handle)
+    req_fields = sessionize.get_order_of_required_fields(input_handle)
+    request_dict = session_store if session_store is not None else {}
+    expiration_dict = {}
+    expiration_heap = []
+    if hasattr(request_dict, 'track'):
+        request_dict.track(expiration_dict, inactivity_interval)
+    latest_date_time = None
+    close_expired_sessions = sessionize.close_expired_sessions
+    add_request = sessionize.add_request
+
+    pipeline = Pipeline(input_handle, output_handle, queue_size)
+    pipeline.start(req_fields)
+    try:
+        requests = pipeline.stream_requests()
+        if reorder_buffer is not None:
+            requests = reorder_buffer.reorder(requests)
+        closed_sessions = []
+        for ip, date_time, counter in requests:
+            if latest_date_time is not None and date_time > latest_date_time:
+                closed_sessions.extend((closed_ip, session_info) for _, closed_ip, session_info in
+                                       close_expired_sessions(date_time - 1, inactivity_interval, request_dict,
+                                                              expiration_dict, expiration_heap))
+                if len(closed_sessions) >= OUTPUT_BATCH_SIZE:
+                    pipeline.write_sessions(closed_sessions)
+                    closed_sessions = []
+            latest_date_time = date_time
+            add_request(ip, date_time, counter, inactivity_interval, request_dict, expiration_dict, expiration_heap)
+
+        closed_sessions.extend(sessionize.close_remaining_sessions(request_dict, expiration_dict, expiration_heap))
+        pipeline.write_sessions(closed_sessions)
+    except BaseException:
+        pipeline.close()
+        raise
+    pipeline.finish()
+
+    if pipeline_stats is not None:
+        pipeline_stats.update(pipeline.report())
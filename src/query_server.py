@@ -0,0 +1,174 @@
+import json
+import bisect
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import sessionization as sessionize
+
+
+DEFAULT_LIMIT = 100         # maximum number of sessions returned by a /sessions query unless a limit is given
+
+
+class IndexedSessionStore(dict):
+    """
+        A dictionary of open sessions (ip -> Session) with a secondary index of the ips by the start time of their
+        session, so the open sessions can be queried while the stream is processed (see QueryServer). The index is
+        updated when a session is added or removed, which happens once per session and not per request, under a lock
+        which the queries also hold while they read the index. The distinct start times are also kept in a sorted
+        list: the stream moves forward in time, so a new start time is mostly appended at its end, and one which
+        arrives out of order is inserted at its place by bisection, so a query never sorts the index.
+
+        process_data_stream keeps latest_date_time up to date, the log time against which the age of a session is
+        measured.
+    """
+
+    def __init__(self):
+        dict.__init__(self)
+        self.lock = threading.Lock()
+        self.starts = {}                # start time -> set of the ips of the sessions which started then
+        self.start_times = []           # the keys of starts in increasing order
+        self.latest_date_time = None
+
+    def index(self, ip, start):
+        bucket = self.starts.get(start)
+        if bucket is None:
+            self.starts[start] = {ip}
+            if not self.start_times or start > self.start_times[-1]:
+                self.start_times.append(start)
+            else:
+                bisect.insort(self.start_times, start)
+        else:
+            bucket.add(ip)
+
+    def unindex(self, ip, start):
+        bucket = self.starts[start]
+        bucket.discard(ip)
+        if not bucket:
+            del self.starts[start]
+            del self.start_times[bisect.bisect_left(self.start_times, start)]
+
+    def __setitem__(self, ip, session_info):
+        with self.lock:
+            previous = dict.get(self, ip)
+            if previous is not None:
+                self.unindex(ip, previous.start)
+            dict.__setitem__(self, ip, session_info)
+            self.index(ip, session_info.start)
+
+    def pop(self, ip, *default):
+        with self.lock:
+            if not dict.__contains__(self, ip) and default:
+                return default[0]
+            session_info = dict.pop(self, ip)
+            self.unindex(ip, session_info.start)
+            return session_info
+
+    def clear(self):
+        with self.lock:
+            dict.clear(self)
+            self.starts.clear()
+            del self.start_times[:]
+
+    def open_longer_than(self, seconds, limit=DEFAULT_LIMIT):
+        """
+            Finds the sessions which started more than seconds before latest_date_time, the oldest first.
+
+        :param seconds: minimum age of a session in seconds
+        :param limit: maximum number of sessions returned
+        :return: a list of (ip, session_info) tuples
+        """
+        if self.latest_date_time is None:
+            return []
+        before = self.latest_date_time - seconds
+        sessions = []
+        with self.lock:
+            for start in self.start_times:
+                if start >= before or len(sessions) >= limit:
+                    break
+                for ip in sorted(self.starts[start]):
+                    sessions.append((ip, dict.__getitem__(self, ip)))
+        return sessions[:limit]
+
+
+def format_session(ip, session_info):
+    """
+    :return: a dictionary of the fields of a session, as in the output file
+    """
+    return {'ip': ip, 'start': sessionize.format_timestamp(session_info.start),
+            'end': sessionize.format_timestamp(session_info.end),
+            'duration': session_info.end - session_info.start + 1, 'requests': session_info.count}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+        Answers the queries of a QueryServer with a JSON object:
+           /count: the number of open sessions,
+           /session?ip=X: the open session of ip X (404 if it has none),
+           /sessions?open_longer_than=N[&limit=M]: the open sessions which started more than N seconds ago, the
+                                                    oldest first.
+        Each answer also has the latest time of the stream as 'now'.
+    """
+
+    def do_GET(self):
+        store = self.server.session_store
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        latest_date_time = store.latest_date_time
+        answer = {'now': sessionize.format_timestamp(latest_date_time) if latest_date_time is not None else None}
+        status = 200
+        try:
+            if url.path == '/count':
+                answer['open_sessions'] = len(store)
+            elif url.path == '/session' and 'ip' in query:
+                ip = query['ip'][0]
+                session_info = dict.get(store, ip)
+                if session_info is None:
+                    status = 404
+                    answer['error'] = 'no open session of %s' % ip
+                else:
+                    answer['session'] = format_session(ip, session_info)
+            elif url.path == '/sessions' and 'open_longer_than' in query:
+                limit = int(query['limit'][0]) if 'limit' in query else DEFAULT_LIMIT
+                answer['sessions'] = [format_session(ip, session_info) for ip, session_info in
+                                      store.open_longer_than(int(query['open_longer_than'][0]), limit)]
+            else:
+                status = 404
+                answer['error'] = 'unknown query, use /count, /session?ip=X or /sessions?open_longer_than=N'
+        except ValueError as error:
+            status = 400
+            answer['error'] = str(error)
+
+        body = json.dumps(answer, sort_keys=True).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass    # the queries are not logged to standard error
+
+
+class QueryServer(object):
+    """
+        A local HTTP endpoint answering queries about the open sessions of an IndexedSessionStore (see QueryHandler)
+        from a background thread while the stream is processed.
+    """
+
+    def __init__(self, session_store, port=0, host='127.0.0.1'):
+        """
+        :param session_store: the IndexedSessionStore used as session store of process_data_stream
+        :param port: port of the endpoint, any free port if 0
+        :param host: address the endpoint listens on, only the local host by default
+        """
+        self.server = HTTPServer((host, port), QueryHandler)
+        self.server.session_store = session_store
+        self.address = self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
@@ -0,0 +1,63 @@
+import heapq
+
+
+class ReorderBuffer(object):
+    """
+        Puts slightly out of order requests, e.g. of logs merged from several front-end servers, back into time order
+        before they reach the session state machine, which needs a chronological stream. The requests are held in a
+        min-heap ordered by time and then by order of arrival, and released once the watermark, the latest time seen
+        minus lateness, has passed their time. A request older than a request already released is too late to be
+        used and is dropped.
+        The per-second counters are given again in the order of release, so the order of the requests of the same
+        second is their order in the input, and a chronological input goes through unchanged. The values a request
+        may carry after its counter (see sessionization.read_requests) are released along with it.
+    """
+
+    def __init__(self, lateness):
+        """
+        :param lateness: number of seconds a request can arrive after a later request without being dropped
+        """
+        self.lateness = lateness
+        self.late = 0               # requests which arrived after a later request
+        self.dropped = 0            # requests dropped since they were older than a released request
+        self.peak_buffered = 0      # maximum number of requests held at once
+
+    def reorder(self, requests):
+        """
+            Generates the requests in time order (see the class description).
+
+        :param requests: an iterable of (ip, date_time, counter) or (ip, date_time, counter, values) tuples, e.g.
+                         sessionization.read_requests
+        :return: a generator of tuples of the same form
+        """
+        heap = []
+        sequence = 0
+        latest_date_time = None     # latest time seen
+        released_date_time = None   # time of the last released request
+        counter = 0
+        for request in requests:
+            date_time = request[1]
+            if latest_date_time is None or date_time > latest_date_time:
+                latest_date_time = date_time
+            elif date_time < latest_date_time:
+                self.late += 1
+                if released_date_time is not None and date_time < released_date_time:
+                    self.dropped += 1
+                    continue
+            heapq.heappush(heap, (date_time, sequence, request))
+            sequence += 1
+            if len(heap) > self.peak_buffered:
+                self.peak_buffered = len(heap)
+
+            watermark = latest_date_time - self.lateness
+            while heap and heap[0][0] <= watermark:
+                released, _, request = heapq.heappop(heap)
+                counter = counter + 1 if released == released_date_time else 0
+                released_date_time = released
+                yield (request[0], released, counter) + request[3:]
+
+        while heap:
+            released, _, request = heapq.heappop(heap)
+            counter = counter + 1 if released == released_date_time else 0
+            released_date_time = released
+            yield (request[0], released, counter) + request[3:]
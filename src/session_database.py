@@ -0,0 +1,170 @@
+import os
+import sys
+import sqlite3
+import argparse
+
+
+DATABASE_EXTENSIONS = ('.sqlite', '.db')
+BATCH_ROWS = 100000         # number of sessions inserted in one transaction
+COLUMNS = ['ip', 'start', 'end', 'duration', 'requests', 'aggregates']
+
+
+def is_database_path(path):
+    """
+    :param path: path of an output file
+    :return: True if the sessions are written to an SQLite database (see SessionDatabase), from the extension of path
+    """
+    return path.endswith(DATABASE_EXTENSIONS)
+
+
+class SessionDatabase(object):
+    """
+        A write-only file-like object which stores the output lines of the sessions in the sessions table of an SQLite
+        database instead of a text file: one row per session with the columns of an output line (ip, start, end,
+        duration, requests) and, if the sessions have aggregates (see aggregators.SessionAggregators), their columns
+        as one text column (aggregates). The times keep the output format YYYY-MM-DD hh:mm:ss, which sorts in time
+        order. The rows are inserted in transactions of BATCH_ROWS rows, with the journal and the syncing turned off,
+        and the indexes on (ip, start) and on start are built once, when the database is closed, which is cheaper
+        than keeping them up to date on every insert. An interrupted run leaves an incomplete database, as it leaves
+        an incomplete output file.
+
+        sessionization.open_files opens an output path ending with .sqlite or .db as a SessionDatabase, so all the
+        sessionization engines can write to it.
+    """
+
+    def __init__(self, path, mode='w'):
+        """
+        :param path: path of the database
+        :param mode: 'w' to replace an existing database, 'a' to add the sessions to it
+        """
+        if mode == 'w' and os.path.exists(path):
+            os.remove(path)
+        try:
+            self.connection = sqlite3.connect(path, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode = OFF')
+            self.connection.execute('PRAGMA synchronous = OFF')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS sessions (ip TEXT, start TEXT, end TEXT, '
+                                    'duration INTEGER, requests INTEGER, aggregates TEXT)')
+        except sqlite3.Error as error:
+            # reported like a file which can not be opened (see sessionization.open_files)
+            raise OSError(str(error))
+        self.partial_line = ''
+        self.pending = []
+        self.rows = 0
+
+    def write(self, text):
+        """
+            Adds the output lines in text, which may end with an incomplete line that is completed by the next write.
+        """
+        lines = (self.partial_line + text).split('\n')
+        self.partial_line = lines.pop()
+        self.pending.extend(line.split(',', 5) for line in lines)
+        if len(self.pending) >= BATCH_ROWS:
+            self.insert_pending()
+
+    def insert_pending(self):
+        if not self.pending:
+            return
+        # the lines of one run all have the same number of columns, with or without the aggregates
+        columns = COLUMNS[:len(self.pending[0])]
+        self.connection.execute('BEGIN')
+        self.connection.executemany('INSERT INTO sessions (%s) VALUES (%s)' %
+                                    (', '.join(columns), ', '.join('?' * len(columns))), self.pending)
+        self.connection.execute('COMMIT')
+        self.rows += len(self.pending)
+        self.pending = []
+
+    def flush(self):
+        """
+            Inserts the pending sessions, so they can be read by another connection.
+        """
+        self.insert_pending()
+
+    def close(self):
+        """
+            Inserts the pending sessions, builds the indexes and closes the database.
+        """
+        if self.partial_line:
+            self.pending.append(self.partial_line.split(',', 5))
+            self.partial_line = ''
+        self.insert_pending()
+        self.connection.execute('CREATE INDEX IF NOT EXISTS sessions_ip ON sessions (ip, start)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS sessions_start ON sessions (start)')
+        self.connection.close()
+
+
+def query_sessions(path, ip=None, start_from=None, start_to=None, limit=None):
+    """
+        Finds the sessions of a database written by SessionDatabase, ordered by their start time. Times are compared
+        as strings, so a date (YYYY-MM-DD) can be given for its midnight.
+
+    :param path: path of the database
+    :param ip: only the sessions of this ip if given
+    :param start_from: only the sessions starting at or after this time (YYYY-MM-DD hh:mm:ss) if given
+    :param start_to: only the sessions starting before this time if given
+    :param limit: maximum number of sessions
+    :return: a list of (ip, start, end, duration, requests, aggregates) tuples, aggregates is None for sessions
+             without aggregates
+    """
+    conditions, parameters = [], []
+    for condition, value in [('ip = ?', ip), ('start >= ?', start_from), ('start < ?', start_to)]:
+        if value is not None:
+            conditions.append(condition)
+            parameters.append(value)
+    query = 'SELECT %s FROM sessions' % ', '.join(COLUMNS)
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY start'
+    if limit is not None:
+        query += ' LIMIT %d' % limit
+
+    if not os.path.isfile(path):
+        raise ValueError('%s is not a session database.' % path)
+    connection = sqlite3.connect('file:%s?mode=ro' % path, uri=True)
+    try:
+        return connection.execute(query, parameters).fetchall()
+    finally:
+        connection.close()
+
+
+def format_row(row):
+    """
+    :param row: a row of query_sessions
+    :return: the row as an output line, including the trailing new line character
+    """
+    ip, start, end, duration, requests, aggregates = row
+    if aggregates is None:
+        return '%s,%s,%s,%d,%d\n' % (ip, start, end, duration, requests)
+    return '%s,%s,%s,%d,%d,%s\n' % (ip, start, end, duration, requests, aggregates)
+
+
+def parse_arguments(argv):
+    """
+        Parses the command line arguments.
+
+    :param argv: list of the command line arguments
+    :return: the parsed arguments
+    """
+    parser = argparse.ArgumentParser(description='Prints the sessions of a session database written by '
+                                                 'sessionization.py (an output path ending with .sqlite or .db) as '
+                                                 'output lines, ordered by their start time.')
+    parser.add_argument('database_path', help='path of the session database')
+    parser.add_argument('-ip', help='only the sessions of this ip')
+    parser.add_argument('-start_from', help="only the sessions starting at or after this time ('YYYY-MM-DD' or "
+                                            "'YYYY-MM-DD hh:mm:ss')")
+    parser.add_argument('-start_to', help='only the sessions starting before this time')
+    parser.add_argument('-limit', type=int, help='maximum number of sessions printed')
+    args = parser.parse_args(argv)
+    if args.limit is not None and args.limit < 0:
+        parser.error('-limit should not be negative.')
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_arguments(sys.argv[1:])
+    try:
+        rows = query_sessions(args.database_path, args.ip, args.start_from, args.start_to, args.limit)
+    except (ValueError, sqlite3.DatabaseError) as error:
+        print('An error occurred while reading the session database: ', error)
+        sys.exit()
+    sys.stdout.writelines(format_row(row) for row in rows)
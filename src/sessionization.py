@@ -1,12 +1,92 @@
+import os
 import sys
 import time
-from datetime import timedelta
+import argparse
+import heapq
+import operator
+import compressed_files
+import session_database
+from datetime import date
 from datetime import datetime
+from itertools import repeat
+
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+DATE_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+REQUIRED_FIELDS = ['ip', 'date', 'time', 'cik', 'accession', 'extention']
+OPTIONAL_FIELDS = ['noagent', 'crawler']    # other fields which are only read if the header has them
+BLOCK_SIZE = 1 << 20                 # number of characters read from the input at once
+OUTPUT_BUFFER_SIZE = 1 << 14         # number of pending writes collected by an OutputBuffer before they are written
+TIMESTAMP_CACHE_SIZE = 1 << 16       # number of formatted timestamps kept by format_timestamp
+
+_date_offset_cache = {}              # date string -> seconds from epoch to the midnight of that date
+_last_timestamp = ['', '', None]     # the last (date string, time string, epoch seconds) converted by parse_timestamp
+_timestamp_strings = {}              # epoch seconds -> string formatted by format_timestamp
+
+
+class Session(object):
+    """
+        An open session of an ip. __slots__ keeps an instance down to four references (instead of a list and its
+        over-allocated item array), and start and end are int seconds since epoch which are shared with the other
+        sessions of the same second through the cache of parse_timestamp.
+    """
+    __slots__ = ('start', 'end', 'count', 'counter')
+    has_aggregates = False      # see aggregators.AggregatedSession
+
+    def __init__(self, start, end, count, counter):
+        """
+        :param start: start date_time of session in seconds since epoch
+        :param end: end date_time of session (time of its latest request) in seconds since epoch
+        :param count: number of docs requested in the session
+        :param counter: a unique counter that differentiates order of appearance of the sessions started at start
+        """
+        self.start = start
+        self.end = end
+        self.count = count
+        self.counter = counter
+
+    def __eq__(self, other):
+        return (isinstance(other, Session) and self.start == other.start and self.end == other.end and
+                self.count == other.count and self.counter == other.counter)
+
+    def __repr__(self):
+        return 'Session(%r, %r, %r, %r)' % (self.start, self.end, self.count, self.counter)
+
+
+class OutputBuffer(object):
+    """
+        Collects the strings written to it and writes them to output_handle in bulk with a single write call once
+        buffer_size strings are pending, and when flush is called.
+    """
+    __slots__ = ('output_handle', 'pending', 'buffer_size')
+
+    def __init__(self, output_handle, buffer_size=OUTPUT_BUFFER_SIZE):
+        """
+        :param output_handle: file handle the strings are finally written to
+        :param buffer_size: number of pending strings which triggers a write
+        """
+        self.output_handle = output_handle
+        self.pending = []
+        self.buffer_size = buffer_size
+
+    def write(self, text):
+        self.pending.append(text)
+        if len(self.pending) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.output_handle.write(''.join(self.pending))
+            self.pending = []
 
 
 def open_files(file_list):
     """
-        Opens all the files in the file list and return their handles.
+        Opens all the files in the file list and return their handles. A file opened for reading which is compressed
+        with gzip, zip or zstd (detected by its magic bytes) is decompressed in the background and its handle is in
+        binary mode, and a file opened for writing whose path ends with .gz or .zst is compressed (see the
+        compressed_files module). A file opened for writing whose path ends with .sqlite or .db is an SQLite database
+        of the sessions (see session_database.SessionDatabase).
     :param file_list: a list consisting a tuple for each file to be opened.
                       tuple has the form (file_path, file_opening_mode)
     :return: a tuple of file handles with the same order as the tuples in the file_list
@@ -15,7 +95,14 @@ def open_files(file_list):
     for file_item in file_list:
         file_path, opening_mode = file_item
         try:
-            f_handles += (open(file_path, opening_mode),)
+            if opening_mode in ('r', 'rb') and compressed_files.detect_compression(file_path) is not None:
+                f_handles += (compressed_files.open_input(file_path),)
+            elif opening_mode in ('w', 'a') and session_database.is_database_path(file_path):
+                f_handles += (session_database.SessionDatabase(file_path, opening_mode),)
+            elif opening_mode in ('w', 'a') and compressed_files.get_output_compression(file_path) is not None:
+                f_handles += (compressed_files.open_output(file_path, opening_mode),)
+            else:
+                f_handles += (open(file_path, opening_mode),)
         except OSError:
             print('An error occurred while opening file: ', file_path)
             sys.exit()
@@ -36,11 +123,69 @@ def close_files(file_handle_list):
             raise
 
 
+def parse_timestamp(d, t):
+    """
+        Converts a date string (YYYY-MM-DD) and a time string (hh:mm:ss) to integer seconds since 1970-01-01 00:00:00.
+        Records of a log file mostly share the same second with the record before them, so the last converted pair of
+        strings is cached. Well-formed fields are converted by slicing them at fixed offsets (the date part is memoized
+        per date string) and only other forms fall back to datetime.strptime, which keeps the accepted formats the same
+        as strptime with '%Y-%m-%d %H:%M:%S' format.
+
+    :param d: date as string with YYYY-MM-DD format
+    :param t: time as string with hh:mm:ss format
+    :return: seconds since epoch as int
+    :raises ValueError: if d or t are not in the right format
+    """
+    if t == _last_timestamp[1] and d == _last_timestamp[0]:
+        return _last_timestamp[2]
+
+    day_offset = _date_offset_cache.get(d)
+    if day_offset is None and len(d) == 10 and d[4] == '-' and d[7] == '-' and (d[:4] + d[5:7] + d[8:]).isdigit():
+        day_offset = (date(int(d[:4]), int(d[5:7]), int(d[8:])).toordinal() - EPOCH_ORDINAL) * 86400
+        _date_offset_cache[d] = day_offset
+
+    if (day_offset is not None and len(t) == 8 and t[2] == ':' and t[5] == ':'
+            and (t[:2] + t[3:5] + t[6:]).isdigit()):
+        hour, minute, second = int(t[:2]), int(t[3:5]), int(t[6:])
+        if hour > 23 or minute > 59 or second > 59:
+            raise ValueError('time data %r is out of range' % t)
+        seconds = day_offset + hour * 3600 + minute * 60 + second
+    else:
+        datetime_obj = datetime.strptime(d + ' ' + t, DATE_TIME_FORMAT)
+        seconds = ((datetime_obj.toordinal() - EPOCH_ORDINAL) * 86400 + datetime_obj.hour * 3600 +
+                   datetime_obj.minute * 60 + datetime_obj.second)
+
+    _last_timestamp[:] = [d, t, seconds]
+    return seconds
+
+
+def format_timestamp(seconds):
+    """
+        Converts seconds since 1970-01-01 00:00:00 to a string with YYYY-MM-DD hh:mm:ss format. Many sessions start or
+        end in the same second, so the formatted strings are cached (the cache is emptied when it grows beyond
+        TIMESTAMP_CACHE_SIZE entries, the output moves forward in time anyway).
+
+    :param seconds: seconds since epoch as int
+    :return: date and time as string
+    """
+    timestamp = _timestamp_strings.get(seconds)
+    if timestamp is None:
+        days, day_seconds = divmod(seconds, 86400)
+        minutes, second = divmod(day_seconds, 60)
+        hour, minute = divmod(minutes, 60)
+        timestamp = '%s %02d:%02d:%02d' % (date.fromordinal(days + EPOCH_ORDINAL).isoformat(), hour, minute, second)
+        if len(_timestamp_strings) >= TIMESTAMP_CACHE_SIZE:
+            _timestamp_strings.clear()
+        _timestamp_strings[seconds] = timestamp
+
+    return timestamp
+
+
 def check_field_validity_and_cleanup(ip, d, t, cik, accession, extention, last_date_time=None):
     """
         Returns a tuple (validity, fields). If any of the provided fields are malformed or incorrect, it returns False
         for validity and an empty list for fields. If all fields are valid it cleans up the
-        fields and returns them. It also converts d and t to a datetime object.
+        fields and returns them. It also converts d and t to seconds since epoch (see parse_timestamp).
         Cleanups include: striping white spaces from beginning and end of fields and returning the last_date_time in
         case the d or t are not in the right format and a last_date_time is provided.
 
@@ -50,8 +195,8 @@ def check_field_validity_and_cleanup(ip, d, t, cik, accession, extention, last_d
     :param cik: cik field of request as string
     :param accession: accession field of request as string
     :param extention: extention field of request as string
-    :param last_date_time: last_date_time seen from the data stream as datetime object
-    :return: a tuple in this form (is_valid, (ip, datetime_obj, cik, accession, extention))
+    :param last_date_time: last_date_time seen from the data stream as seconds since epoch
+    :return: a tuple in this form (is_valid, (ip, date_time, cik, accession, extention))
     """
 
     # white space stripping and checks
@@ -60,12 +205,12 @@ def check_field_validity_and_cleanup(ip, d, t, cik, accession, extention, last_d
         return False, ()
 
     try:
-        datetime_obj = datetime.strptime(d + ' ' + t, '%Y-%m-%d %H:%M:%S')
-    except:
+        date_time = parse_timestamp(d, t)
+    except ValueError:
         # if datetime is not in the right format but we know the latest time read from data stream, use that otherwise
         # mark the record as invalid
-        if last_date_time:
-            datetime_obj = last_date_time
+        if last_date_time is not None:
+            date_time = last_date_time
         else:
             return False, ()
 
@@ -74,7 +219,7 @@ def check_field_validity_and_cleanup(ip, d, t, cik, accession, extention, last_d
     extention = extention.strip()
 
     is_valid = True      # no field-check failed
-    return is_valid, (ip, datetime_obj, cik, accession, extention)
+    return is_valid, (ip, date_time, cik, accession, extention)
 
 
 def extract_required_fields(record_string, req_fields):
@@ -91,14 +236,71 @@ def extract_required_fields(record_string, req_fields):
     all_fields = record_string.split(',')
 
     try:
-        extracted_fields = (all_fields[req_fields[key]]
-                            for key in ['ip', 'date', 'time', 'cik', 'accession', 'extention'])
-    except: # if the record does not match header format a tuple with empty fields is returned which will be skipped
-        ('', '', '', '', '', '')
+        extracted_fields = tuple(all_fields[req_fields[key]] for key in REQUIRED_FIELDS)
+    except IndexError:  # if the record does not match header format a tuple with empty fields is returned which will
+                        # be skipped
+        extracted_fields = ('', '', '', '', '', '')
 
     return extracted_fields
 
 
+def read_blocks(input_handle, block_size=BLOCK_SIZE):
+    """
+        Reads input_handle in large blocks and generates them cut at line boundaries, i.e. every generated block but
+        the last one ends with a new line character. input_handle can be opened in text or binary mode; the blocks of a
+        binary handle are decoded as UTF-8 and come with the byte offset in the file of the end of the block, which is
+        where reading can be resumed (see the checkpoint module). A handle with its own read_blocks method, like
+        follow_sessionization.LogFollower, generates its blocks itself.
+
+    :param input_handle: file handle for the input file
+    :param block_size: number of characters (or bytes for a binary handle) read from input_handle at once
+    :return: a generator of (block, offset) tuples where offset is None for a text handle
+    """
+    if hasattr(input_handle, 'read_blocks'):
+        yield from input_handle.read_blocks(block_size)
+        return
+
+    remainder = input_handle.read(0)    # an empty string or bytes object, depending on the mode of input_handle
+    binary = isinstance(remainder, bytes)
+    new_line = b'\n' if binary else '\n'
+    offset = input_handle.tell() if binary else None
+
+    while True:
+        block = input_handle.read(block_size)
+        if not block:
+            break
+        block = remainder + block
+        end = block.rfind(new_line) + 1
+        remainder = block[end:]     # the last line might continue in the next block
+        if end == 0:
+            continue
+        if binary:
+            offset += end
+            yield decode_block(block[:end]), offset
+        else:
+            yield block[:end], None
+
+    if remainder:
+        if binary:
+            yield decode_block(remainder), offset + len(remainder)
+        else:
+            yield remainder, None
+
+
+def decode_block(block):
+    """
+        Decodes a block of a binary input handle read by read_blocks the same way a file opened in text mode would be
+        read: as UTF-8, with Windows new lines translated to '\\n'.
+
+    :param block: bytes ending at a line boundary
+    :return: the decoded string
+    """
+    text = block.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
 def extract_required_fields_order(header, required_fields):
     """
         Extract the all the required fields from the header which is the name of fields separated by comma
@@ -108,7 +310,7 @@ def extract_required_fields_order(header, required_fields):
     :param required_fields: a list containing name of required fields
     :return: a tuple including order of required fields in the header or a line of input data  (zero-indexed)
     """
-    all_fields = header.split(',')
+    all_fields = [field.strip() for field in header.split(',')]   # the last field name ends with a new line
     required_fields_order = ()
     for field in required_fields:
         for i, x in enumerate(all_fields):
@@ -121,53 +323,159 @@ def extract_required_fields_order(header, required_fields):
     return required_fields_order
 
 
-def write_closed_sessions(output_handle, date_time, previous_date_time, inactivity_interval, request_dict,
-                          expiration_dict):
+def format_session_record(ip, session_info):
     """
-        Checks the sessions which might have expired at date_time and if so writes them out to the output file.
-        The output form is:
+        Formats a session as an output line:
+           'ip,session_start_date_time,session_end_date_time,session_duration_in_seconds,number_of_requested_documents'
+        where date_time is written in this format: YYYY-MM-DD hh:mm:ss
+
+    :param ip: ip of the user as string
+    :param session_info: Session object of the session
+    :return: the output line including the trailing new line character
+    """
+    if not session_info.has_aggregates:
+        return '%s,%s,%s,%d,%d\n' % (ip, format_timestamp(session_info.start), format_timestamp(session_info.end),
+                                     session_info.end - session_info.start + 1, session_info.count)
+    # a session with aggregates (see aggregators.AggregatedSession) has extra columns
+    return '%s,%s,%s,%d,%d%s\n' % (ip, format_timestamp(session_info.start), format_timestamp(session_info.end),
+                                   session_info.end - session_info.start + 1, session_info.count,
+                                   session_info.format_aggregates())
+
+
+def add_request(ip, date_time, counter, inactivity_interval, request_dict, expiration_dict, expiration_heap,
+                new_session=Session):
+    """
+        Adds a document request to the session of ip (starting a new session if ip has no open session) and registers
+        the time at which that session might expire in expiration_dict and expiration_heap.
+
+    :param ip: ip of the user as string
+    :param date_time: time of request in seconds since epoch
+    :param counter: a unique counter showing order of appearance of the request among requests of the same date_time
+    :param inactivity_interval: inactivity interval in seconds after which a session is considered as expired
+    :param request_dict: a dictionary of open sessions, see write_closed_sessions
+    :param expiration_dict: a dictionary of potential expiration times, see write_closed_sessions
+    :param expiration_heap: a min-heap of the keys of expiration_dict
+    :param new_session: the class of a new session, Session or a subclass (see aggregators.AggregatedSession)
+    :return: None
+    """
+    session_info = request_dict.get(ip)
+    if session_info is None:
+        # add this ip (user) to request dictionary
+        request_dict[ip] = new_session(date_time, date_time, 1, counter)
+    elif session_info.end == date_time:
+        # another request of the same second, its potential expiration time is already registered
+        session_info.count += 1
+        return
+    else:
+        session_info.end = date_time     # update end date_time of session
+        session_info.count += 1          # increase number of docs requested by one
+    # update the expiration dictionary
+    exp_time = date_time + inactivity_interval
+    bucket = expiration_dict.get(exp_time)
+    if bucket is None:
+        expiration_dict[exp_time] = [ip]
+        heapq.heappush(expiration_heap, exp_time)
+    else:
+        bucket.append(ip)
+
+
+def close_expired_sessions(date_time, inactivity_interval, request_dict, expiration_dict, expiration_heap):
+    """
+        Removes the sessions which have expired at or before date_time from request_dict and generates them in the
+        output order, i.e. ordered by their expiration time, then by their start time and then by the unique counter.
+        Only the expiration times that actually have an entry in expiration_dict are visited (they are popped from
+        expiration_heap in ascending order), so a long gap of time between two requests costs nothing.
+
+    :param date_time: seconds since epoch indicating the latest expiration time to check
+    :param inactivity_interval: inactivity interval in seconds after which a session is considered as expired
+    :param request_dict: a dictionary of open sessions, see write_closed_sessions
+    :param expiration_dict: a dictionary of potential expiration times, see write_closed_sessions
+    :param expiration_heap: a min-heap of the keys of expiration_dict
+    :return: a generator of (expiration time, ip, session_info) tuples
+    """
+    # some of the sessions may be on disk, see spill_store.SpillingSessionStore
+    pop_expired = getattr(request_dict, 'pop_expired', None)
+    while expiration_heap and expiration_heap[0] <= date_time:
+        date_time_to_chck = heapq.heappop(expiration_heap)
+        if date_time_to_chck not in expiration_dict:
+            continue
+        # check which sessions with an ip in this bucket have expired and generate them
+        last_active_time = date_time_to_chck - inactivity_interval
+        if pop_expired is None:
+            expired_sessions = [(request_dict[ip], ip) for ip in expiration_dict.pop(date_time_to_chck)
+                                if ip in request_dict and request_dict[ip].end <= last_active_time]
+        else:
+            expired_sessions = pop_expired(expiration_dict.pop(date_time_to_chck), last_active_time)
+        if len(expired_sessions) > 1:
+            expired_sessions.sort(key=lambda r: (r[0].start, r[0].counter))
+        for session_info, ip in expired_sessions:
+            # skip an ip listed twice in the same bucket
+            if pop_expired is not None or request_dict.pop(ip, None) is session_info:
+                yield date_time_to_chck, ip, session_info
+
+
+def close_remaining_sessions(request_dict, expiration_dict, expiration_heap=None):
+    """
+        Removes all the sessions from request_dict and generates them ordered first by their start time and then by
+        the unique counter.
+
+    :param request_dict: a dictionary of open sessions, see write_closed_sessions
+    :param expiration_dict: a dictionary of potential expiration times, see write_closed_sessions
+    :param expiration_heap: a min-heap of the keys of expiration_dict, emptied along with expiration_dict if provided.
+    :return: a generator of (ip, session_info) tuples
+    """
+    if hasattr(request_dict, 'close_remaining_sessions'):
+        # some of the sessions are on disk, see spill_store.SpillingSessionStore
+        yield from request_dict.close_remaining_sessions()
+    else:
+        for ip in sorted(request_dict.keys(), key=lambda r: (request_dict[r].start, request_dict[r].counter)):
+            yield ip, request_dict.pop(ip)
+
+    expiration_dict.clear()
+    if expiration_heap is not None:
+        del expiration_heap[:]
+
+
+def write_sessions(output_handle, sessions):
+    """
+        Formats the sessions (see format_session_record) and writes them to the output file with a single write call.
+        Both write_closed_sessions and write_remaining_sessions write through this function.
+
+    :param output_handle: output file handle (or OutputBuffer)
+    :param sessions: an iterable of (ip, Session object) tuples in output order
+    :return: None
+    """
+    records = [format_session_record(ip, session_info) for ip, session_info in sessions]
+    if records:
+        output_handle.write(''.join(records))
+
+
+def write_closed_sessions(output_handle, date_time, inactivity_interval, request_dict, expiration_dict,
+                          expiration_heap):
+    """
+        Checks the sessions which might have expired at or before date_time and if so writes them out to the output
+        file (see close_expired_sessions). The output form is:
            'ip,session_start_date_time,session_end_date_time,session_duration_in_seconds,number_of_requested_documents'
         where date_time is written in this format: YYYY-MM-DD hh:mm:ss
 
     :param output_handle: output file handle
-    :param date_time: a datetime object indicating the expiration time to check
-    :param previous_date_time: a date_time before current date_time in the code in general
-                            previous_date_time <= date_time < current_date_time
+    :param date_time: seconds since epoch indicating the latest expiration time to check
     :param inactivity_interval: inactivity interval in seconds after which a session is considered as expired
-    :param request_dict: a dictionary containing all the documents request seen up to now with ip as key and
-                        [start date_time of session, end date_time of session, number of docs requested,
-                        a unique counter showing order of appearance in the same start date_time] as value
-    :param expiration_dict: a dictionary containing the sessions that might get expired at a specific datetime. The key
-                            is expiration datetime and the value is a set of ip address of sessions that might get
-                            expired at the time specified by key.
+    :param request_dict: a dictionary containing all the open sessions with ip as key and a Session object (start
+                        date_time of session, end date_time of session, number of docs requested, a unique counter
+                        showing order of appearance in the same start date_time) as value
+    :param expiration_dict: a dictionary containing the sessions that might get expired at a specific time. The key
+                            is expiration time in seconds since epoch and the value is a list of ip address of
+                            sessions that might get expired at the time specified by key.
+    :param expiration_heap: a min-heap (see heapq) of the keys of expiration_dict, i.e. the pending expiration times.
     :return: None
     """
-    i = 0
-    while True:
-        date_time_to_chck = previous_date_time + timedelta(seconds=i)   # this is to make sure that if a gap of time is
-                                                                        # in request the code does not miss some entries
-                                                                        # in expiration_dict
-        if date_time_to_chck <= date_time and date_time_to_chck in expiration_dict:
-            potential_expiring_sessions = sorted(expiration_dict[date_time_to_chck],
-                                                  key=lambda r: (request_dict[r][0], request_dict[r][3]))
-            for ip in potential_expiring_sessions:
-                # check if the session with ip has expired and write it to output file if so
-                if request_dict[ip][1] <= date_time_to_chck - timedelta(seconds=inactivity_interval):
-                    session_info = request_dict.pop(ip)
-                    record = [ip,
-                              session_info[0].isoformat(' '),
-                              session_info[1].isoformat(' '),
-                              str(int((session_info[1] - session_info[0]).total_seconds()) + 1),
-                              str(session_info[2])]
-                    output_handle.write(','.join(record) + '\n')
-
-            expiration_dict.pop(date_time_to_chck)
-        elif date_time_to_chck > date_time:
-            break
-        i += 1
+    write_sessions(output_handle, ((ip, session_info) for _, ip, session_info in
+                                   close_expired_sessions(date_time, inactivity_interval, request_dict,
+                                                          expiration_dict, expiration_heap)))
 
 
-def write_remaining_sessions(output_handle, request_dict, expiration_dict):
+def write_remaining_sessions(output_handle, request_dict, expiration_dict, expiration_heap=None):
     """
         Writes all the sessions in request_dict to the output file. The output is ordered first by start_time of
         sessions and if two sessions are started at the same time, the unique counter for that time is used to order
@@ -176,40 +484,39 @@ def write_remaining_sessions(output_handle, request_dict, expiration_dict):
         where date_time is written in this format: YYYY-MM-DD hh:mm:ss
 
     :param output_handle: output file handle
-    :param request_dict: a dictionary containing all the documents request seen up to now with ip as key and
-                        [start date_time of session, end date_time of session, number of docs requested,
-                        a unique counter showing order of appearance in the same start date_time] as value
-    :param expiration_dict: a dictionary containing the sessions that might get expired at a specific datetime. The key
-                            is expiration datetime and the value is a set of ip address of sessions that might get
-                            expired at the time specified by key.
+    :param request_dict: a dictionary containing all the open sessions with ip as key and a Session object (start
+                        date_time of session, end date_time of session, number of docs requested, a unique counter
+                        showing order of appearance in the same start date_time) as value
+    :param expiration_dict: a dictionary containing the sessions that might get expired at a specific time. The key
+                            is expiration time in seconds since epoch and the value is a list of ip address of
+                            sessions that might get expired at the time specified by key.
+    :param expiration_heap: a min-heap of the keys of expiration_dict, emptied along with expiration_dict if provided.
     :return: None
     """
-
-    for ip in sorted(request_dict.keys(), key=lambda r: (request_dict[r][0], request_dict[r][3])):
-        # write the sessions ordered by start_time and unique counter when start_times are equal
-        session_info = request_dict.pop(ip)
-        record = [ip,
-                  session_info[0].isoformat(' '),
-                  session_info[1].isoformat(' '),
-                  str(int((session_info[1] - session_info[0]).total_seconds()) + 1),
-                  str(session_info[2])]
-        output_handle.write(','.join(record) + '\n')
-
-    expiration_dict.clear()
+    write_sessions(output_handle, close_remaining_sessions(request_dict, expiration_dict, expiration_heap))
 
 
-def get_order_of_required_fields(input_handle):
+def get_order_of_required_fields(input_handle, extra_fields=()):
     """
         Reads the header of the input file (first line of inout file) and extract the order of required fields:
                             'ip', 'date', 'time', 'cik', 'accession', 'extention'
-    :param input_handle: file handle for the input file
+    :param input_handle: file handle for the input file (in text or binary mode)
+    :param extra_fields: names of other fields which are required, e.g. 'size' (see aggregators.SumSize), except
+                         the ones in OPTIONAL_FIELDS, which are left out of the dictionary if the header does not have
+                         them (see heavy_hitters.SIGNALS)
     :return: a dictionary with name of required fields as the key and their index of appearance in the records as value
     """
 
     first_line = input_handle.readline()
-    required_fields_names = ['ip', 'date', 'time', 'cik', 'accession', 'extention']
-    fields_order = extract_required_fields_order(first_line, required_fields_names)
-    req_fields = dict(zip(required_fields_names, fields_order))
+    if isinstance(first_line, bytes):
+        first_line = decode_block(first_line)
+    field_names = REQUIRED_FIELDS + [field for field in extra_fields if field not in OPTIONAL_FIELDS]
+    fields_order = extract_required_fields_order(first_line, field_names)
+    req_fields = dict(zip(field_names, fields_order))
+    header_fields = [field.strip() for field in first_line.split(',')]
+    for field in extra_fields:
+        if field in OPTIONAL_FIELDS and field in header_fields:
+            req_fields[field] = header_fields.index(field)
     return req_fields
 
 
@@ -229,7 +536,174 @@ def get_inactivity_interval(inactivity_handle):
     return inactivity_interval
 
 
-def process_data_stream(input_handle, inactivity_handle, output_handle):
+def get_inactivity_intervals(inactivity_handle):
+    """
+        Reads all the inactivity intervals of the inactivity input file, for a sweep over several intervals (see
+        process_data_stream_sweep). The intervals are written one per line or separated by commas, and each one is
+        checked like in get_inactivity_interval.
+
+    :param inactivity_handle: file handle for inactivity input file
+    :return: list of the distinct inactivity intervals in seconds, in the order of the file
+    """
+    inactivity_intervals = []
+    for line in inactivity_handle:
+        for value in line.split(','):
+            if not value.strip():
+                continue
+            inactivity_interval = int(value.strip())
+            if inactivity_interval < 1 or inactivity_interval > 86400:
+                raise ValueError('The provided interval should be between 1 and 86,400.')
+            if inactivity_interval not in inactivity_intervals:
+                inactivity_intervals.append(inactivity_interval)
+    if not inactivity_intervals:
+        raise ValueError('No inactivity interval is provided.')
+
+    return inactivity_intervals
+
+
+def get_sweep_output_path(output_path, inactivity_interval):
+    """
+        Returns the output path of one inactivity interval of a sweep: the interval is added to the file name before
+        its extension, e.g. sessionization_60.txt or sessionization_60.txt.gz.
+
+    :param output_path: output path given for the sweep
+    :param inactivity_interval: inactivity interval in seconds
+    :return: the output path of the interval
+    """
+    compression_extension = ''
+    if compressed_files.get_output_compression(output_path) is not None:
+        output_path, compression_extension = os.path.splitext(output_path)
+    root, extension = os.path.splitext(output_path)
+    return '%s_%d%s%s' % (root, inactivity_interval, extension, compression_extension)
+
+
+def get_session_store_size(request_dict, expiration_dict, expiration_heap):
+    """
+        Estimates the memory used by the open sessions: the dictionaries, the Session objects, the ip strings, the
+        expiration buckets and the heap. Every distinct int object is counted once, since the timestamps are shared.
+
+    :param request_dict: a dictionary of open sessions, see write_closed_sessions
+    :param expiration_dict: a dictionary of potential expiration times, see write_closed_sessions
+    :param expiration_heap: a min-heap of the keys of expiration_dict
+    :return: a tuple (size in bytes, number of open sessions)
+    """
+    size = sys.getsizeof(request_dict) + sys.getsizeof(expiration_dict) + sys.getsizeof(expiration_heap)
+    int_objects = {}
+    for ip, session_info in request_dict.items():
+        size += sys.getsizeof(ip) + sys.getsizeof(session_info)
+        for value in (session_info.start, session_info.end, session_info.count, session_info.counter):
+            int_objects[id(value)] = value
+    for exp_time, bucket in expiration_dict.items():
+        size += sys.getsizeof(bucket)
+        int_objects[id(exp_time)] = exp_time
+    size += sum(sys.getsizeof(value) for value in int_objects.values())
+
+    return size, len(request_dict)
+
+
+def read_requests(input_handle, req_fields, latest_date_time=None, counter=0, on_block=None, stats=None,
+                  value_fields=None, on_requests=None):
+    """
+        Reads the records of input_handle (after its header) and generates the valid document requests in the order of
+        the stream. Each request is accompanied by a counter which is set to zero when time changes and is increased by
+        one for every other request of the same time, so it differentiates order of appearance at a specific time.
+        The records are split and validated one block of input at a time (see read_blocks), and only the commas up to
+        the last field used are looked for. This is the only loop over the records of the streaming code: the
+        features which need more than the requests hook into it with stats, value_fields and on_requests, so they
+        can be used together.
+
+    :param input_handle: file handle for the input file (or a multi_file_input.InputFiles), positioned after the
+                         header
+    :param req_fields: a dictionary with name of required fields as the key and their index as value
+    :param latest_date_time: latest time seen before the current position of input_handle (when resuming a stream)
+    :param counter: counter of the last request seen before the current position of input_handle
+    :param on_block: an optional function which is called with the offset of the end of a block (see read_blocks)
+                     once all the requests of that block are consumed and before the next block is read
+    :param stats: an optional instrumentation.StreamStats which times the read, parse and validate stages and
+                  counts the records of each block (see StreamStats.time_reads and StreamStats.add_block)
+    :param value_fields: None, or a list of names of other fields of the records (e.g. 'size', see
+                         aggregators.SessionAggregators), in which case each request also carries the values of its
+                         record: a tuple of its cleaned cik, accession and extention followed by the stripped value of
+                         each of value_fields ('' for a field which is not in req_fields)
+    :param on_requests: an optional function which is called with the list of the requests of a block once they are
+                        all consumed, e.g. HeavyHitters.add_requests
+    :return: a generator of (ip, date_time, counter) tuples with date_time in seconds since epoch, or of (ip,
+             date_time, counter, values) tuples if value_fields is given
+    """
+    if hasattr(input_handle, 'read_requests'):
+        # several input files read as one stream, see multi_file_input.InputFiles
+        yield from input_handle.read_requests(req_fields, latest_date_time, counter, on_block, stats, value_fields,
+                                              on_requests)
+        return
+
+    indices = [req_fields[key] for key in REQUIRED_FIELDS]
+    get_required_fields = operator.itemgetter(*indices)
+    if value_fields is not None:
+        # index of each value field in a record, None for a field which is not in the header
+        value_indices = [req_fields.get(field) for field in value_fields]
+        indices += [index for index in value_indices if index is not None]
+        # the values of a header without any of the value fields are the same for all the records
+        empty_values = ('',) * len(value_fields) if len(indices) == len(REQUIRED_FIELDS) else None
+    max_split = max(indices) + 1
+
+    blocks = read_blocks(input_handle, BLOCK_SIZE)
+    if stats is not None:
+        blocks = stats.time_reads(blocks)
+    for block, offset in blocks:
+        lines = block.split('\n')
+        # the fields of each line, split by map without a Python level loop
+        split_lines = map(str.split, lines, repeat(','), repeat(max_split))
+        if stats is not None:
+            # the lines of the block are split before they are validated, so each stage is timed on its own
+            parse_start = time.perf_counter()
+            split_lines = list(split_lines)
+            validate_start = time.perf_counter()
+        # the requests of the block are collected when they are timed or handed over to on_requests
+        requests = [] if stats is not None or on_requests is not None else None
+        rejected = []
+
+        for all_fields in split_lines:
+            if len(all_fields) < max_split:
+                continue
+            ip, d, t, cik, accession, extention = get_required_fields(all_fields)
+            (is_valid, cleaned) = check_field_validity_and_cleanup(ip, d, t, cik, accession, extention,
+                                                                   latest_date_time)
+            if not is_valid:  # skip this record if any of the required fields are not valid
+                rejected.append(ip)
+                continue
+
+            date_time = cleaned[1]
+            if latest_date_time is None or date_time > latest_date_time:
+                counter = 0
+            else:
+                counter += 1
+            latest_date_time = date_time
+            if value_fields is None:
+                request = (cleaned[0], date_time, counter)
+            elif empty_values is not None:
+                request = (cleaned[0], date_time, counter, cleaned[2:] + empty_values)
+            else:
+                request = (cleaned[0], date_time, counter, cleaned[2:] + tuple(
+                    [all_fields[index].strip() if index is not None else '' for index in value_indices]))
+            if requests is None:
+                yield request
+            else:
+                requests.append(request)
+
+        if requests is not None:
+            if stats is not None:
+                stats.add_block(lines, rejected, requests, validate_start - parse_start,
+                                time.perf_counter() - validate_start)
+            yield from requests
+            if on_requests is not None:
+                on_requests(requests)
+        if on_block is not None:
+            on_block(offset)
+
+
+def process_data_stream(input_handle, inactivity_handle, output_handle, memory_stats=None, checkpoint=None,
+                        max_latency=None, stats=None, aggregators=None, session_store=None, reorder_buffer=None,
+                        heavy_hitters=None):
     """
         This function process a data_stream of EDGAR records by reading from input_handle that is formatted based on FEC
         description. It uses the inactivity interval that is supposed to be in the first line of inactivity_file and
@@ -239,82 +713,502 @@ def process_data_stream(input_handle, inactivity_handle, output_handle):
     :param input_handle: file handle for the input file.
     :param inactivity_handle: file handle for the inactivity interval file.
     :param output_handle: file handle for the output file
+    :param memory_stats: an optional dictionary which is filled with 'peak_open_sessions' and the 'open_sessions' and
+                         their estimated size in 'bytes' (see get_session_store_size) at the end of the input
+    :param checkpoint: an optional checkpoint.Checkpoint; the stream resumes from its snapshot if there is one and
+                       a new snapshot is saved whenever it is due at the end of a block of input. input_handle should
+                       be opened in binary mode (for exact offsets) and output_handle should be seekable.
+    :param max_latency: for live streams (see follow_sessionization.LogFollower), the maximum number of seconds a
+                        closed session waits before it is flushed to output_handle. At the end of every block of input
+                        the log clock is also advanced by the wall clock time passed since latest time was read, and
+                        the sessions expired by then are closed without waiting for a later record.
+    :param stats: an optional instrumentation.StreamStats which collects the time spent in each stage and counters of
+                  the records and sessions
+    :param aggregators: an optional aggregators.SessionAggregators whose aggregates of the requests of each session
+                        are written as extra columns
+    :param session_store: an optional empty dictionary-like store of the open sessions used instead of a dict, e.g. a
+                          spill_store.SpillingSessionStore which keeps a bounded number of sessions in memory. If
+                          it has a latest_date_time attribute, the latest time of the stream is kept in it (see
+                          query_server.IndexedSessionStore).
+    :param reorder_buffer: an optional reorder_buffer.ReorderBuffer which puts requests arriving out of time order
+                           back in order, within its lateness window, before they are added to the sessions
+    :param heavy_hitters: an optional heavy_hitters.HeavyHitters which reports the heaviest ips, CIKs and accessions
+                          and flags the sessions with a high request rate
     """
 
     inactivity_interval = get_inactivity_interval(inactivity_handle)
+    # the aggregates and the heavy hitters need the values of each request (see read_requests), with the fields of the
+    # aggregators first
+    value_fields = None
+    if aggregators is not None or heavy_hitters is not None:
+        value_fields = list(aggregators.fields) if aggregators is not None else []
+        if heavy_hitters is not None:
+            value_fields += heavy_hitters.fields
 
-    req_fields = get_order_of_required_fields(input_handle)
+    state = checkpoint.load() if checkpoint is not None else None
+    if state is None:
+        req_fields = get_order_of_required_fields(input_handle, value_fields or ())
+        request_dict = session_store if session_store is not None else {}
+        expiration_dict = {}
+        expiration_heap = []        # min-heap of the expiration times (keys of expiration_dict) still to be checked
+        latest_date_time = None     # latest time seen
+        counter = 0
+    else:
+        if state['inactivity_interval'] != inactivity_interval:
+            raise ValueError('The checkpoint was saved with an inactivity interval of %d seconds.' %
+                             state['inactivity_interval'])
+        req_fields = state['req_fields']
+        request_dict = state['request_dict']
+        expiration_dict = state['expiration_dict']
+        expiration_heap = state['expiration_heap']
+        latest_date_time = state['latest_date_time']
+        counter = state['counter']
+        input_handle.seek(state['input_offset'])
+        output_handle.seek(state['output_offset'])
+        output_handle.truncate()
 
-    request_dict = {}
-    expiration_dict = {}
-    latest_date_time = None     # latest time seen
-    previous_date_time = None   # previous time seen, almost always (except when reading first second) is not the same
-                                # as latest_date_time and is at least 1 second smaller than latest_date_time
-    counter = 0
-
-    for line in input_handle:
-        (ip, d, t, cik, accession, extention) = extract_required_fields(line, req_fields)
-        (is_valid, fields) = check_field_validity_and_cleanup(ip, d, t, cik, accession, extention, latest_date_time)
-        if not is_valid:  # skip this record if any of the required fields are not valid
-            continue
+    output_buffer = OutputBuffer(output_handle if stats is None else stats.time_output(output_handle))
+    if stats is not None:
+        stats.track(request_dict, expiration_dict)
+    if heavy_hitters is not None:
+        heavy_hitters.track(request_dict, value_fields)
+    if hasattr(request_dict, 'track'):
+        # a store which takes its spilled sessions out of the expiration buckets, see spill_store.SpillingSessionStore
+        request_dict.track(expiration_dict, inactivity_interval)
+    peak_open_sessions = 0
+    latest_read_at = last_flush = time.time()     # wall clock time at which latest_date_time was read, last flush
 
-        (ip, date_time, cik, accession, extention) = fields
+    def end_of_block(input_offset):
+        # called between two blocks of input, when all the requests read so far are added to the sessions
+        nonlocal last_flush
+        if max_latency is not None:
+            now = time.time()
+            if latest_date_time is not None:
+                log_time = latest_date_time + int(now - latest_read_at)
+                if log_time > latest_date_time:
+                    write_closed_sessions(output_buffer, log_time - 1, inactivity_interval,
+                                          request_dict, expiration_dict, expiration_heap)
+            if now - last_flush >= max_latency:
+                output_buffer.flush()
+                output_handle.flush()
+                last_flush = now
+        if checkpoint is None or not checkpoint.due():
+            return
+        if input_offset is None:
+            raise ValueError('Checkpoints need an input file opened in binary mode.')
+        output_buffer.flush()
+        output_handle.flush()
+        checkpoint.save({'inactivity_interval': inactivity_interval, 'req_fields': req_fields,
+                         'input_offset': input_offset, 'output_offset': output_handle.tell(),
+                         'latest_date_time': latest_date_time, 'counter': counter, 'request_dict': request_dict,
+                         'expiration_dict': expiration_dict}, output_handle)
 
+    requests = read_requests(input_handle, req_fields, latest_date_time, counter,
+                             end_of_block if checkpoint is not None or max_latency is not None else None, stats,
+                             value_fields, heavy_hitters.add_requests if heavy_hitters is not None else None)
+    if reorder_buffer is not None:
+        requests = reorder_buffer.reorder(requests)
+    track_time = hasattr(request_dict, 'latest_date_time')     # e.g. a query_server.IndexedSessionStore
+    for request in requests:
+        date_time = request[1]
         # when time changes check the potential session that might expire and write them if so
-        if previous_date_time is not None and date_time > previous_date_time:
-            write_closed_sessions(output_handle, date_time - timedelta(seconds=1), previous_date_time,
-                                  inactivity_interval, request_dict, expiration_dict)
+        if latest_date_time is None or date_time > latest_date_time:
+            if max_latency is not None:
+                latest_read_at = time.time()
+            if latest_date_time is not None:
+                if memory_stats is not None and len(request_dict) > peak_open_sessions:
+                    peak_open_sessions = len(request_dict)
+                if stats is None:
+                    write_closed_sessions(output_buffer, date_time - 1, inactivity_interval,
+                                          request_dict, expiration_dict, expiration_heap)
+                else:
+                    stats.start_expiry()
+                    write_closed_sessions(output_buffer, date_time - 1, inactivity_interval,
+                                          request_dict, expiration_dict, expiration_heap)
+                    stats.stop_expiry()
+            if track_time:
+                request_dict.latest_date_time = date_time
+        latest_date_time = date_time
+        counter = request[2]
 
-        # update a counter which is set to zero when time changes and
-        if previous_date_time is None or date_time > latest_date_time:
-            counter = 0
-        else:
-            counter += 1
-        if ip in request_dict:
-            request_dict[ip][1] = date_time  # update end date_time of session
-            request_dict[ip][2] += 1         # increase number of docs requested by one
-        else:
-            # add this ip (user) to request dictionary
-            request_dict[ip] = [date_time, date_time, 1, counter]   # [start date_time of session, end date_time of
-                                                                    #  session, number of docs requested, a unique
-                                                                    #  counter that differentiates order of appearance
-                                                                    #  at a specific time]
-        # update the expiration dictionary
-        exp_time = date_time + timedelta(seconds=inactivity_interval)
-        if exp_time in expiration_dict:
-            expiration_dict[exp_time].add(ip)
+        if aggregators is None:
+            add_request(request[0], date_time, counter, inactivity_interval, request_dict, expiration_dict,
+                        expiration_heap)
         else:
-            expiration_dict[exp_time] = {ip}
-        # update previous_date_time
-        if previous_date_time is None or date_time > latest_date_time:
-            previous_date_time = date_time
-        latest_date_time = date_time
+            aggregators.add_request(*request, inactivity_interval, request_dict, expiration_dict, expiration_heap)
+
+    if memory_stats is not None:
+        memory_stats['bytes'], memory_stats['open_sessions'] = get_session_store_size(request_dict, expiration_dict,
+                                                                                     expiration_heap)
+        memory_stats['peak_open_sessions'] = max(peak_open_sessions, len(request_dict))
 
     # since the input file end is reached, write all the remaining sessions
-    write_remaining_sessions(output_handle, request_dict, expiration_dict)
+    if stats is not None:
+        stats.start_expiry()
+    write_remaining_sessions(output_buffer, request_dict, expiration_dict, expiration_heap)
+    output_buffer.flush()
+    if stats is not None:
+        stats.stop_expiry()
+        stats.write_report()
+    if heavy_hitters is not None:
+        heavy_hitters.write_report()
+    if checkpoint is not None:
+        checkpoint.remove()
+
+
+def process_data_stream_sweep(input_handle, inactivity_intervals, output_handles, reorder_buffer=None):
+    """
+        Same as process_data_stream for several inactivity intervals at once: the input is read, validated and its
+        times converted only once, and every request is added to a separate session state per interval, whose output
+        is the same as process_data_stream with that interval.
+
+    :param input_handle: file handle for the input file.
+    :param inactivity_intervals: list of inactivity intervals in seconds
+    :param output_handles: list of file handles for the output files, one per inactivity interval
+    :param reorder_buffer: see process_data_stream
+    """
+    req_fields = get_order_of_required_fields(input_handle)
+    # for each interval: (inactivity_interval, request_dict, expiration_dict, expiration_heap, output_buffer)
+    states = [(inactivity_interval, {}, {}, [], OutputBuffer(output_handle))
+              for inactivity_interval, output_handle in zip(inactivity_intervals, output_handles)]
+    latest_date_time = None
+
+    requests = read_requests(input_handle, req_fields)
+    if reorder_buffer is not None:
+        requests = reorder_buffer.reorder(requests)
+    for ip, date_time, counter in requests:
+        if latest_date_time is not None and date_time > latest_date_time:
+            for inactivity_interval, request_dict, expiration_dict, expiration_heap, output_buffer in states:
+                write_closed_sessions(output_buffer, date_time - 1, inactivity_interval, request_dict,
+                                      expiration_dict, expiration_heap)
+        latest_date_time = date_time
+
+        for inactivity_interval, request_dict, expiration_dict, expiration_heap, _ in states:
+            add_request(ip, date_time, counter, inactivity_interval, request_dict, expiration_dict, expiration_heap)
+
+    for _, request_dict, expiration_dict, expiration_heap, output_buffer in states:
+        write_remaining_sessions(output_buffer, request_dict, expiration_dict, expiration_heap)
+        output_buffer.flush()
+
+
+def parse_arguments(argv):
+    """
+        Parses the command line arguments of the program.
+
+    :param argv: list of command line arguments (without the program name)
+    :return: an argparse.Namespace with input_paths, inactivity_path, output_path, time, workers, memory, batch,
+             checkpoint, checkpoint_interval, resume, follow, poll_interval, max_latency, idle_timeout, stats,
+             stats_interval, profile, aggregates, max_sessions and spill_dir attributes
+    """
+    parser = argparse.ArgumentParser(description='Extracts user sessions from an EDGAR log file.')
+    parser.add_argument('input_paths', nargs='+', metavar='input_path',
+                        help='EDGAR log file; several files, glob patterns or directories are read in the given '
+                             'order as one continuous stream')
+    parser.add_argument('inactivity_path', help='file containing the inactivity interval in seconds')
+    parser.add_argument('output_path', help='output file for the sessions')
+    parser.add_argument('-time', action='store_true', help='print the running time at the end of the run')
+    parser.add_argument('-workers', type=int, default=1,
+                        help='number of worker processes; sessions are sharded among them by a hash of the ip')
+    parser.add_argument('-memory', action='store_true',
+                        help='print the peak number of open sessions and their estimated bytes per open session')
+    parser.add_argument('-batch', action='store_true',
+                        help='load the whole input file and compute the sessions with NumPy (offline runs only)')
+    parser.add_argument('-checkpoint', help='snapshot file of the open sessions, saved periodically while streaming')
+    parser.add_argument('-checkpoint_interval', type=float, default=300,
+                        help='number of seconds between two snapshots (default 300)')
+    parser.add_argument('-resume', action='store_true',
+                        help='resume the stream from the -checkpoint snapshot, if there is one')
+    parser.add_argument('-follow', action='store_true',
+                        help='follow the growing input file like tail -F, including its rotation')
+    parser.add_argument('-poll_interval', type=float, default=1.0,
+                        help='number of seconds to wait for new records at the end of a followed input (default 1)')
+    parser.add_argument('-max_latency', type=float, default=1.0,
+                        help='maximum number of seconds before a closed session of a followed input is written '
+                             '(default 1)')
+    parser.add_argument('-idle_timeout', type=float,
+                        help='stop following the input after this many seconds without new records')
+    parser.add_argument('-stats', help='file the per stage timings and counters are written to as JSON lines '
+                                       '(- for the standard output)')
+    parser.add_argument('-stats_interval', type=float,
+                        help='number of seconds between two -stats lines written while streaming')
+    parser.add_argument('-profile', help='file the cProfile statistics of the run are dumped to (see pstats)')
+    parser.add_argument('-aggregates', type=lambda value: value.split(','),
+                        help='comma separated aggregates of each session written as extra output columns: '
+                             'distinct_documents, distinct_ciks, distinct_documents_hll, distinct_ciks_hll, sum_size, '
+                             'top_ciks:k')
+    parser.add_argument('-max_sessions', type=int,
+                        help='maximum number of open sessions kept in memory, the least recently active ones are '
+                             'spilled to disk')
+    parser.add_argument('-spill_dir', help='directory of the file of the sessions spilled to disk by -max_sessions')
+    parser.add_argument('-query_port', type=int,
+                        help='answer queries about the open sessions on http://127.0.0.1:PORT while the input is '
+                             'processed (0 for any free port)')
+    parser.add_argument('-lateness', type=int,
+                        help='number of seconds a record can arrive after a later record and still be put back in '
+                             'time order; older records are dropped')
+    parser.add_argument('-heavy_hitters',
+                        help='file the top ips, CIKs and accessions and the sessions with a high request rate are '
+                             "written to as JSON lines ('-' for standard output)")
+    parser.add_argument('-top_k', type=int, default=10, help='number of top values of each field in a -heavy_hitters '
+                                                             'report')
+    parser.add_argument('-rate_threshold', type=float,
+                        help='requests per second from which a session is written to -heavy_hitters as a likely '
+                             'crawler')
+    parser.add_argument('-report_interval', type=int, default=3600,
+                        help='seconds of log time between two -heavy_hitters reports')
+    parser.add_argument('-signals', action='store_true',
+                        help='also count the requests of self-declared crawlers and without a user agent (the crawler '
+                             'and noagent fields, if the log has them) in -heavy_hitters, and flag their sessions '
+                             'with -rate_threshold')
+    parser.add_argument('-pipeline', action='store_true',
+                        help='run reading, parsing, sessionization and writing as concurrent stages and print the '
+                             'throughput and queue depths of each stage')
+    parser.add_argument('-sort', action='store_true',
+                        help='sort the input by time with an external merge sort before it is sessionized')
+    parser.add_argument('-sort_workers', type=int, default=1, help='number of processes sorting the input by -sort')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('-workers should be at least 1.')
+    if args.batch and args.workers > 1:
+        parser.error('-batch and -workers can not be used together.')
+    if args.checkpoint is not None and (args.batch or args.workers > 1):
+        parser.error('-checkpoint can not be used with -batch or -workers.')
+    if args.checkpoint is not None and (compressed_files.get_output_compression(args.output_path) is not None or
+                                        session_database.is_database_path(args.output_path)):
+        parser.error('-checkpoint needs an uncompressed output file, not a compressed file or a session database.')
+    if args.resume and args.checkpoint is None:
+        parser.error('-resume needs -checkpoint.')
+    if args.follow and (args.batch or args.workers > 1 or args.checkpoint is not None):
+        parser.error('-follow can not be used with -batch, -workers or -checkpoint.')
+    if args.stats is not None and (args.batch or args.workers > 1):
+        parser.error('-stats can not be used with -batch or -workers.')
+    if args.stats_interval is not None and args.stats is None:
+        parser.error('-stats_interval needs -stats.')
+    if args.max_sessions is not None:
+        if args.max_sessions < 1:
+            parser.error('-max_sessions should be at least 1.')
+        if args.batch or args.workers > 1 or args.checkpoint is not None or args.aggregates is not None:
+            parser.error('-max_sessions can not be used with -batch, -workers, -checkpoint or -aggregates.')
+    if args.spill_dir is not None and args.max_sessions is None:
+        parser.error('-spill_dir needs -max_sessions.')
+    if args.query_port is not None and (args.batch or args.workers > 1 or args.checkpoint is not None or
+                                        args.max_sessions is not None or args.pipeline):
+        parser.error('-query_port can not be used with -batch, -workers, -checkpoint, -max_sessions or -pipeline.')
+    if args.aggregates is not None:
+        if args.batch or args.workers > 1 or args.checkpoint is not None:
+            parser.error('-aggregates can not be used with -batch, -workers or -checkpoint.')
+        from aggregators import create_aggregator
+        for spec in args.aggregates:
+            try:
+                create_aggregator(spec)
+            except ValueError as error:
+                parser.error(str(error))
+
+    if args.lateness is not None:
+        if args.lateness < 0:
+            parser.error('-lateness should not be negative.')
+        if args.batch or args.workers > 1 or args.checkpoint is not None:
+            parser.error('-lateness can not be used with -batch, -workers or -checkpoint.')
+
+    if args.heavy_hitters is not None:
+        if args.top_k < 1 or args.report_interval < 1:
+            parser.error('-top_k and -report_interval should be at least 1.')
+        if args.batch or args.workers > 1 or args.checkpoint is not None or args.pipeline:
+            parser.error('-heavy_hitters can not be used with -batch, -workers, -checkpoint or -pipeline.')
+    elif args.rate_threshold is not None or args.signals:
+        parser.error('-rate_threshold and -signals need -heavy_hitters.')
+    if args.pipeline and (args.batch or args.workers > 1 or args.checkpoint is not None or args.follow or
+                          args.stats is not None or args.aggregates is not None):
+        parser.error('-pipeline can not be used with -batch, -workers, -checkpoint, -follow, -stats or -aggregates.')
+    if args.sort:
+        if args.sort_workers < 1:
+            parser.error('-sort_workers should be at least 1.')
+        if args.follow or args.checkpoint is not None:
+            parser.error('-sort can not be used with -follow or -checkpoint.')
+
+    args.cache = False
+    if len(args.input_paths) == 1 and os.path.isdir(args.input_paths[0]):
+        from columnar_cache import is_cache
+        args.cache = is_cache(args.input_paths[0])
+    if args.cache and (args.workers > 1 or args.checkpoint is not None or args.follow or args.stats is not None or
+                       args.aggregates is not None or args.max_sessions is not None or args.lateness is not None or
+                       args.sort or args.pipeline or args.heavy_hitters is not None or args.query_port is not None):
+        parser.error('a columnar cache can not be used with -workers, -checkpoint, -follow, -stats, -aggregates, '
+                     '-max_sessions, -lateness, -sort, -pipeline, -heavy_hitters or -query_port.')
+    if args.cache:
+        return args
+
+    from multi_file_input import expand_input_paths
+    args.input_paths = expand_input_paths(args.input_paths)
+    if not args.input_paths:
+        parser.error('no input file matches the input paths.')
+    if len(args.input_paths) > 1 and (args.follow or args.checkpoint is not None):
+        parser.error('-follow and -checkpoint need a single input file.')
+
+    return args
 
 
 if __name__ == "__main__":
+    args = parse_arguments(sys.argv[1:])
+
     # if optional -time argument is entered, time the code
-    if len(sys.argv) >= 5 and sys.argv[4] == '-time':
+    if args.time:
         start_time = time.time()
 
-    # get the location of input and output file from command line
-    try:
-        input_path = sys.argv[1]
-        inactivity_path = sys.argv[2]
-        output_path = sys.argv[3]
-    except:
-        raise Exception(('You need to enter the following paths as command arguments: input_file, inactivity_file, ',
-                        'and output_file!'))
+    checkpoint = None
+    input_mode, output_mode = 'r', 'w'
+    if args.checkpoint is not None:
+        from checkpoint import Checkpoint
+        checkpoint = Checkpoint(args.checkpoint, args.checkpoint_interval)
+        if not args.resume:
+            checkpoint.remove()
+        # offsets of a binary input are exact byte positions; the output is appended to where the snapshot left it
+        input_mode = 'rb'
+        if os.path.exists(args.checkpoint):
+            output_mode = 'r+'
+
+    input_paths = args.input_paths
+    if args.cache:
+        input_handle = None
+    elif args.sort:
+        from external_sort import SortedInput
+        for input_path in input_paths:
+            if not os.path.isfile(input_path):
+                print('An error occurred while opening file: ', input_path)
+                sys.exit()
+        input_handle = SortedInput(input_paths, args.sort_workers)
+    elif args.follow:
+        from follow_sessionization import LogFollower
+        try:
+            input_handle = LogFollower(input_paths[0], args.poll_interval, args.idle_timeout)
+        except OSError:
+            print('An error occurred while opening file: ', input_paths[0])
+            sys.exit()
+    elif len(input_paths) > 1:
+        from multi_file_input import InputFiles
+        for input_path in input_paths:
+            if not os.path.isfile(input_path):
+                print('An error occurred while opening file: ', input_path)
+                sys.exit()
+        input_handle = InputFiles(input_paths)
+    else:
+        input_handle, = open_files([(input_paths[0], input_mode)])
+
+    # several inactivity intervals in the inactivity file make a sweep with one output file per interval
+    inactivity_handle, = open_files([(args.inactivity_path, 'r')])
+    inactivity_intervals = get_inactivity_intervals(inactivity_handle)
+    close_files([inactivity_handle])
+    sweep = len(inactivity_intervals) > 1
+    if sweep:
+        if (args.workers > 1 or args.checkpoint is not None or args.follow or args.stats is not None or
+                args.aggregates is not None or args.max_sessions is not None or args.pipeline or
+                args.heavy_hitters is not None or args.query_port is not None):
+            print('Several inactivity intervals can not be used with -workers, -checkpoint, -follow, -stats, '
+                  '-aggregates, -max_sessions, -pipeline, -heavy_hitters or -query_port.')
+            sys.exit()
+        inactivity_handle = output_handle = None
+        output_handles = open_files([(get_sweep_output_path(args.output_path, inactivity_interval), 'w')
+                                     for inactivity_interval in inactivity_intervals])
+    else:
+        inactivity_handle, output_handle = open_files([(args.inactivity_path, 'r'), (args.output_path, output_mode)])
+        output_handles = ()
+
+    memory_stats = {} if args.memory else None
+    stats = None
+    if args.stats is not None:
+        from instrumentation import StreamStats
+        stats_handle = sys.stdout if args.stats == '-' else open(args.stats, 'w')
+        stats = StreamStats(stats_handle, args.stats_interval)
+    session_store = None
+    if args.max_sessions is not None:
+        from spill_store import SpillingSessionStore
+        session_store = SpillingSessionStore(args.max_sessions, args.spill_dir)
+    query_server = None
+    if args.query_port is not None:
+        from query_server import IndexedSessionStore, QueryServer
+        session_store = IndexedSessionStore()
+        query_server = QueryServer(session_store, args.query_port)
+        print('--- answering queries on http://%s:%d ---' % query_server.address, flush=True)
+    aggregators = None
+    if args.aggregates is not None:
+        from aggregators import SessionAggregators
+        aggregators = SessionAggregators(args.aggregates)
+    reorder_buffer = None
+    if args.lateness is not None:
+        from reorder_buffer import ReorderBuffer
+        reorder_buffer = ReorderBuffer(args.lateness)
+    heavy_hitters = None
+    if args.heavy_hitters is not None:
+        from heavy_hitters import HeavyHitters
+        report_handle = sys.stdout if args.heavy_hitters == '-' else open(args.heavy_hitters, 'w')
+        heavy_hitters = HeavyHitters(report_handle, args.top_k, args.rate_threshold, args.report_interval,
+                                     args.signals)
+    if args.profile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    if args.cache:
+        import columnar_cache
+        columnar_cache.process_cache(input_paths[0], inactivity_intervals, output_handles if sweep else [output_handle])
+    elif sweep and args.batch:
+        import batch_sessionization
+        batch_sessionization.process_data_file_sweep(input_handle, inactivity_intervals, output_handles)
+    elif sweep:
+        process_data_stream_sweep(input_handle, inactivity_intervals, output_handles, reorder_buffer)
+    elif args.batch:
+        import batch_sessionization
+        batch_sessionization.process_data_file(input_handle, inactivity_handle, output_handle)
+    elif args.pipeline:
+        import pipelined_sessionization
+        pipeline_stats = {}
+        pipelined_sessionization.process_data_stream_pipelined(input_handle, inactivity_handle, output_handle,
+                                                               pipeline_stats, session_store, reorder_buffer)
+    elif args.workers > 1:
+        import parallel_sessionization
+        parallel_sessionization.process_data_stream_parallel(input_handle, inactivity_handle, output_handle,
+                                                             args.workers)
+    else:
+        process_data_stream(input_handle, inactivity_handle, output_handle, memory_stats, checkpoint,
+                            args.max_latency if args.follow else None, stats, aggregators, session_store,
+                            reorder_buffer, heavy_hitters)
+
+    if args.profile is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
+    close_files([handle for handle in (input_handle, inactivity_handle, output_handle) + output_handles
+                 if handle is not None])
+    if query_server is not None:
+        query_server.close()
+    elif session_store is not None:
+        session_store.close()
+    if stats is not None and stats.stats_handle is not sys.stdout:
+        stats.stats_handle.close()
+    if heavy_hitters is not None and heavy_hitters.report_handle is not sys.stdout:
+        heavy_hitters.report_handle.close()
 
-    file_handles = open_files([(input_path, 'r'), (inactivity_path, 'r'), (output_path, 'w')])
-    input_handle, inactivity_handle, output_handle = file_handles
+    # if optional -memory argument is entered, print the size of the session store
+    if args.memory and not (args.batch or args.workers > 1 or args.cache or sweep or args.pipeline):
+        print("--- peak open sessions: %d, open sessions at end of input: %d, bytes per open session: %.1f ---" %
+              (memory_stats['peak_open_sessions'], memory_stats['open_sessions'],
+               memory_stats['bytes'] / max(memory_stats['open_sessions'], 1)))
 
-    process_data_stream(input_handle, inactivity_handle, output_handle)
+    if args.pipeline:
+        for stage in pipelined_sessionization.STAGES:
+            stage_stats = pipeline_stats[stage]
+            queue_depth = ''
+            if 'peak_queue_depth' in stage_stats:
+                queue_depth = ', input queue depth mean %.1f peak %d' % (stage_stats['mean_queue_depth'],
+                                                                         stage_stats['peak_queue_depth'])
+            print("--- stage %s: %d %s, %.0f per second, waiting %.0f%% of the time%s ---" %
+                  (stage, stage_stats['items'], stage_stats['unit'], stage_stats['items_per_second'],
+                   100 * stage_stats['waiting_share'], queue_depth))
 
-    close_files([input_handle, inactivity_handle, output_handle])
+    if reorder_buffer is not None:
+        print("--- records out of order: %d, dropped too late: %d, peak buffered: %d ---" %
+              (reorder_buffer.late, reorder_buffer.dropped, reorder_buffer.peak_buffered))
 
     # if optional -time argument is entered, print the run time
-    if len(sys.argv) >= 5 and sys.argv[4] == '-time':
+    if args.time:
         print("--- running time: %s seconds ---" % (time.time() - start_time))
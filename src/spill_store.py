@@ -0,0 +1,195 @@
+import os
+import heapq
+import sqlite3
+import tempfile
+import operator
+import sessionization as sessionize
+
+
+SPILL_FRACTION = 0.25       # share of the sessions in memory which is spilled at once when the cap is reached
+
+
+class SpillingSessionStore(dict):
+    """
+        A dictionary of open sessions (ip -> Session) which keeps at most max_sessions of them in memory. When a
+        session would pass that cap, the coldest sessions, i.e. the ones with the oldest latest request, are spilled
+        to an SQLite table on disk, and a spilled session is paged back in, through the same cap, by the next request
+        of its ip (see sessionization.add_request). Since the session logic sees the same sessions as with a plain
+        dictionary, the output is exactly the same.
+
+        The entries of the spilled sessions are also taken out of the expiration buckets given to track, so a spilled
+        session costs no memory at all. Its expiration time keeps its bucket, maybe empty, and when that time is
+        checked the expired sessions on disk are found by their end in SQLite (see pop_expired), without being paged
+        in.
+    """
+
+    def __init__(self, max_sessions, spill_dir=None):
+        """
+        :param max_sessions: maximum number of sessions kept in memory
+        :param spill_dir: directory of the temporary SQLite file (the default temporary directory if None)
+        """
+        dict.__init__(self)
+        self.max_sessions = max_sessions
+        file_handle, self.path = tempfile.mkstemp(prefix='sessions_', suffix='.sqlite', dir=spill_dir)
+        os.close(file_handle)
+        self.connection = sqlite3.connect(self.path, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute('CREATE TABLE sessions (ip TEXT PRIMARY KEY, start INTEGER, end INTEGER, '
+                                'count INTEGER, counter INTEGER) WITHOUT ROWID')
+        self.connection.execute('CREATE INDEX sessions_end ON sessions (end)')
+        self.spilled = 0
+        self.spill_passes = 0
+        self.expiration_dict = None
+        self.inactivity_interval = None
+
+    def track(self, expiration_dict, inactivity_interval):
+        """
+            Keeps a reference to the expiration buckets of the sessions (see sessionization.add_request), from which
+            the spilled sessions are taken out and to which the paged in sessions are put back.
+        """
+        self.expiration_dict = expiration_dict
+        self.inactivity_interval = inactivity_interval
+
+    def spill(self):
+        """
+            Moves the coldest SPILL_FRACTION of the sessions in memory to disk.
+        """
+        get_end = operator.itemgetter(1)
+        coldest = heapq.nsmallest(max(1, int(dict.__len__(self) * SPILL_FRACTION)),
+                                  ((ip, session_info.end) for ip, session_info in dict.items(self)), key=get_end)
+        rows = []
+        for ip, _ in coldest:
+            session_info = dict.pop(self, ip)
+            rows.append((ip, session_info.start, session_info.end, session_info.count, session_info.counter))
+        self.connection.execute('BEGIN')
+        self.connection.executemany('INSERT INTO sessions VALUES (?, ?, ?, ?, ?)', rows)
+        self.connection.execute('COMMIT')
+        self.spilled += len(rows)
+        self.spill_passes += 1
+
+        if self.expiration_dict is not None:
+            # the buckets only keep the sessions in memory. A session is only in the buckets of its requests, which are
+            # at the latest the bucket of its end, so the buckets after the one of the latest end of the spilled
+            # sessions are skipped. A pass still scans every entry of the older buckets, including the stale entries
+            # of the sessions which had a later request since, so it costs more than the sessions it spills
+            spilled_ips = {ip for ip, _ in coldest}
+            last_exp_time = max(end for _, end in coldest) + self.inactivity_interval
+            for exp_time, bucket in self.expiration_dict.items():
+                if exp_time <= last_exp_time and not spilled_ips.isdisjoint(bucket):
+                    bucket[:] = [ip for ip in bucket if ip not in spilled_ips]
+
+    def page_in(self, ip):
+        """
+            Moves the session of ip from disk back to memory.
+
+        :param ip: ip of the session
+        :return: the Session object or None if ip has no spilled session
+        """
+        if not self.spilled:
+            return None
+        row = self.connection.execute('SELECT start, end, count, counter FROM sessions WHERE ip = ?',
+                                      (ip,)).fetchone()
+        if row is None:
+            return None
+        self.connection.execute('DELETE FROM sessions WHERE ip = ?', (ip,))
+        self.spilled -= 1
+        session_info = sessionize.Session(*row)
+        self[ip] = session_info
+        if self.expiration_dict is not None:
+            # the bucket of its expiration time is kept while it is on disk, and the next request of the same second
+            # does not register it again
+            self.expiration_dict[session_info.end + self.inactivity_interval].append(ip)
+        return session_info
+
+    def pop_expired(self, ips, last_active_time):
+        """
+            Removes the sessions which have expired at an expiration time (see sessionization.close_expired_sessions):
+            the ones of ips in memory whose latest request is at or before last_active_time, and the ones on disk
+            with such a latest request, which all expire at this time since the earlier expiration times are checked
+            first.
+
+        :param ips: the ips of the bucket of the expiration time
+        :param last_active_time: the expiration time minus the inactivity interval
+        :return: a list of (session_info, ip) tuples, with each ip once
+        """
+        expired_sessions = []
+        for ip in ips:
+            session_info = dict.get(self, ip)
+            if session_info is not None and session_info.end <= last_active_time:
+                dict.__delitem__(self, ip)
+                expired_sessions.append((session_info, ip))
+        if self.spilled:
+            rows = self.connection.execute('SELECT ip, start, end, count, counter FROM sessions WHERE end <= ?',
+                                           (last_active_time,)).fetchall()
+            if rows:
+                self.connection.execute('DELETE FROM sessions WHERE end <= ?', (last_active_time,))
+                self.spilled -= len(rows)
+                expired_sessions.extend((sessionize.Session(start, end, count, counter), ip)
+                                        for ip, start, end, count, counter in rows)
+        return expired_sessions
+
+    def get(self, ip, default=None):
+        session_info = dict.get(self, ip)
+        if session_info is None:
+            session_info = self.page_in(ip)
+        return default if session_info is None else session_info
+
+    def __getitem__(self, ip):
+        session_info = self.get(ip)
+        if session_info is None:
+            raise KeyError(ip)
+        return session_info
+
+    def __contains__(self, ip):
+        if dict.__contains__(self, ip):
+            return True
+        return bool(self.spilled) and self.connection.execute('SELECT 1 FROM sessions WHERE ip = ?',
+                                                              (ip,)).fetchone() is not None
+
+    def __setitem__(self, ip, session_info):
+        if not dict.__contains__(self, ip) and dict.__len__(self) >= self.max_sessions:
+            self.spill()
+        dict.__setitem__(self, ip, session_info)
+
+    def pop(self, ip, *default):
+        if self.get(ip) is None and default:
+            return default[0]
+        return dict.pop(self, ip)
+
+    def __len__(self):
+        return dict.__len__(self) + self.spilled
+
+    def close_remaining_sessions(self):
+        """
+            Removes all the sessions, in memory and on disk, and generates them ordered by their start time and then
+            by their counter (see sessionization.close_remaining_sessions). The sessions in memory are spilled first
+            and the order is left to SQLite, so this does not need memory for all the sessions either.
+
+        :return: a generator of (ip, session_info) tuples
+        """
+        rows = [(ip, s.start, s.end, s.count, s.counter) for ip, s in dict.items(self)]
+        dict.clear(self)
+        self.connection.execute('BEGIN')
+        self.connection.executemany('INSERT INTO sessions VALUES (?, ?, ?, ?, ?)', rows)
+        self.connection.execute('COMMIT')
+        self.spilled += len(rows)
+
+        cursor = self.connection.execute('SELECT ip, start, end, count, counter FROM sessions '
+                                         'ORDER BY start, counter')
+        for ip, start, end, count, counter in cursor:
+            yield ip, sessionize.Session(start, end, count, counter)
+        self.connection.execute('DELETE FROM sessions')
+        self.spilled = 0
+
+    def clear(self):
+        dict.clear(self)
+        self.connection.execute('DELETE FROM sessions')
+        self.spilled = 0
+
+    def close(self):
+        """
+            Closes and removes the SQLite file.
+        """
+        self.connection.close()
+        os.remove(self.path)
@@ -0,0 +1,101 @@
+import unittest
+import aggregators
+import reorder_buffer
+import sessionization as sessionize
+from io import StringIO
+from test_helpers import HEADER
+
+
+RECORDS = ('101.81.133.jja,2017-06-30,00:00:00,0.0,1608552.0,0001047469-17-004337,-index.htm,200.0,80251.0\n' +
+           '107.23.85.jfd,2017-06-30,00:00:00,0.0,1027281.0,0000898430-02-001167,-index.htm,200.0,2825.0\n' +
+           '107.23.85.jfd,2017-06-30,00:00:00,0.0,1136894.0,0000905148-07-003827,-index.htm,200.0,3021.0\n' +
+           '107.23.85.jfd,2017-06-30,00:00:01,0.0,1136894.0,0000905148-07-003827,-index.htm,200.0,\n' +
+           '108.91.91.hbc,2017-06-30,00:00:01,0.0,1295391.0,0001209784-17-000052,.txt,200.0,19884.0\n' +
+           '107.23.85.jfd,2017-06-30,00:00:03,0.0,1027281.0,0000842814-98-000001,-index.html,200.0,2690.0\n' +
+           '108.91.91.hbc,2017-06-30,00:00:04,0.0,1618174.0,0001140361-17-026711,.txt,301.0,674.0\n')
+
+
+class TestAggregators(unittest.TestCase):
+
+    def test_hyperloglog(self):
+        hll = aggregators.HyperLogLog()
+        for i in range(aggregators.HLL_SPARSE_LIMIT):
+            hll.add('%d' % i)
+            hll.add('%d' % i)
+        self.assertEqual(hll.count(), aggregators.HLL_SPARSE_LIMIT)
+        self.assertIsNone(hll.registers)
+
+        for n in [1000, 20000]:
+            hll = aggregators.HyperLogLog()
+            for i in range(n):
+                hll.add('0001047469-17-%06d' % i)
+            self.assertIsNone(hll.values)
+            self.assertLess(abs(hll.count() - n), 0.1 * n)
+
+    def test_create_aggregator(self):
+        self.assertEqual(aggregators.create_aggregator('top_ciks:2').k, 2)
+        self.assertEqual(aggregators.create_aggregator('sum_size').name, 'sum_size')
+        for spec in ['top_ciks:x', 'top_ciks:0', 'distinct_accessions', 'sum_size:2']:
+            self.assertRaises(ValueError, aggregators.create_aggregator, spec)
+
+    def test_top_ciks(self):
+        top_ciks = aggregators.TopCiks(2)
+        state = top_ciks.new()
+        for cik in ['3', '1', '2', '2', '1', '4']:
+            state = top_ciks.add(state, (cik, '', '', ''))
+        self.assertEqual(top_ciks.format(state), '1:2;2:2')
+
+    def test_sum_size(self):
+        sum_size = aggregators.SumSize()
+        state = sum_size.new()
+        for size in ['10.0', '', 'x', 'inf', '-inf', 'nan', '2.5']:
+            state = sum_size.add(state, ('', '', '', size))
+        self.assertEqual(sum_size.format(state), '12')
+
+        # sizes whose total would overflow to infinity are skipped
+        state = sum_size.new()
+        for size in ['1e308', '1e308', '-1e308']:
+            state = sum_size.add(state, ('', '', '', size))
+        self.assertEqual(sum_size.format(state), '0')
+        output_handle = StringIO()
+        sessionize.process_data_stream(StringIO(HEADER + ''.join(
+            'a,2017-06-30,00:00:00,0.0,1.0,a-1,.htm,200.0,1e308\n' for _ in range(2))), StringIO('2\n'),
+            output_handle, aggregators=aggregators.SessionAggregators(['sum_size']))
+        self.assertEqual(output_handle.getvalue(), 'a,2017-06-30 00:00:00,2017-06-30 00:00:00,1,2,%d\n' % 1e308)
+
+    def test_process_data_stream_with_aggregates(self):
+        session_aggregators = aggregators.SessionAggregators(['distinct_documents', 'distinct_ciks_hll', 'sum_size',
+                                                              'top_ciks:1'])
+        output_handle = StringIO()
+        sessionize.process_data_stream(StringIO(HEADER + RECORDS), StringIO('2\n'), output_handle,
+                                       aggregators=session_aggregators)
+        self.assertEqual(output_handle.getvalue(),
+                         '101.81.133.jja,2017-06-30 00:00:00,2017-06-30 00:00:00,1,1,1,1,80251,1608552.0:1\n' +
+                         '108.91.91.hbc,2017-06-30 00:00:01,2017-06-30 00:00:01,1,1,1,1,19884,1295391.0:1\n' +
+                         '107.23.85.jfd,2017-06-30 00:00:00,2017-06-30 00:00:03,4,4,3,2,8536,1027281.0:2\n' +
+                         '108.91.91.hbc,2017-06-30 00:00:04,2017-06-30 00:00:04,1,1,1,1,674,1618174.0:1\n')
+
+        # the sessions are the same as without aggregates
+        expected = StringIO()
+        sessionize.process_data_stream(StringIO(HEADER + RECORDS), StringIO('2\n'), expected)
+        self.assertListEqual([line.split(',')[:5] for line in output_handle.getvalue().splitlines()],
+                             [line.split(',') for line in expected.getvalue().splitlines()])
+
+        # the values of the requests go through a reorder buffer
+        reordered = StringIO()
+        records = RECORDS.splitlines(True)
+        sessionize.process_data_stream(StringIO(HEADER + ''.join(records[:4] + records[5:6] + records[4:5] +
+                                                                 records[6:])),
+                                       StringIO('2\n'), reordered, aggregators=session_aggregators,
+                                       reorder_buffer=reorder_buffer.ReorderBuffer(3))
+        self.assertEqual(sorted(reordered.getvalue().splitlines()), sorted(output_handle.getvalue().splitlines()))
+
+    def test_size_column_is_required(self):
+        session_aggregators = aggregators.SessionAggregators(['sum_size'])
+        with self.assertRaises(Exception):
+            sessionize.process_data_stream(StringIO(HEADER.replace('size', 'bytes') + RECORDS), StringIO('2\n'),
+                                           StringIO(), aggregators=session_aggregators)
+
+
+if __name__ == '__main__':
+    unittest.main()
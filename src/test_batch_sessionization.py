@@ -0,0 +1,95 @@
+import os
+import glob
+import unittest
+import sessionization as sessionize
+from io import StringIO
+
+try:
+    import numpy as np
+    import batch_sessionization
+except ImportError:
+    np = None
+
+
+TESTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'insight_testsuite', 'tests')
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class TestBatchSessionization(unittest.TestCase):
+
+    def setUp(self):
+        self.time0 = sessionize.parse_timestamp('2017-06-30', '00:00:00')
+
+    def test_load_requests(self):
+        log = ('c,2017-06-30,bad\n' +
+               ' ,2017-06-30,00:00:00\n' +
+               'b,2017-06-30,00:00:00\n' +
+               ' a ,2017-06-30,00:00:00\n' +
+               ' ,2017-06-30,00:00:01\n' +
+               'c\n' +
+               'b,2017-06-30,00:00:02\n' +
+               'c,2017-06-30,0:0:3\n' +
+               'a,2017-06-30,xx:00:03\n' +
+               'b,2017-06-30,00:00:03')
+        req_fields = {'ip': 0, 'date': 1, 'time': 2, 'cik': 2, 'accession': 2, 'extention': 2}
+        # the same requests whether a block holds the whole log or cuts it every one or two lines
+        for block_size in [1 << 20, 40, 1]:
+            ips, ip_ids, date_times, counters = batch_sessionization.load_requests(StringIO(log), req_fields,
+                                                                                   block_size=block_size)
+            self.assertListEqual(ips, ['b', 'a', 'c'])
+            self.assertListEqual(ip_ids.tolist(), [0, 1, 0, 2, 1, 0])
+            self.assertListEqual((date_times - self.time0).tolist(), [0, 0, 2, 3, 3, 3])
+            self.assertListEqual(counters.tolist(), [0, 1, 0, 0, 1, 2])
+
+        # the ips longer than MAX_IP_BYTES are kept whole without widening the byte strings of the others
+        long_ip = 'x' * (batch_sessionization.MAX_IP_BYTES * 100)
+        log = '%s,2017-06-30,00:00:00\na,2017-06-30,00:00:01\n %s ,2017-06-30,00:00:02\n' % (long_ip, long_ip)
+        ips, ip_ids, date_times, counters = batch_sessionization.load_requests(StringIO(log), req_fields)
+        self.assertListEqual(ips, [long_ip, 'a'])
+        self.assertListEqual(ip_ids.tolist(), [0, 1, 0])
+
+    def test_compute_sessions(self):
+        ip_ids = np.array([0, 1, 1, 1, 2, 3, 4, 1, 4, 2])
+        date_times = self.time0 + np.array([0, 0, 0, 1, 1, 2, 2, 3, 4, 4])
+        counters = np.array([0, 1, 2, 0, 1, 0, 1, 0, 0, 1])
+        session_ids, starts, ends, counts = batch_sessionization.compute_sessions(ip_ids, date_times, counters, 2)
+        self.assertListEqual(session_ids.tolist(), [0, 2, 1, 3, 4, 2])
+        self.assertListEqual((starts - self.time0).tolist(), [0, 1, 0, 2, 2, 4])
+        self.assertListEqual((ends - self.time0).tolist(), [0, 1, 3, 2, 4, 4])
+        self.assertListEqual(counts.tolist(), [1, 1, 4, 1, 2, 1])
+
+        empty = np.zeros(0, dtype=np.int64)
+        self.assertEqual(len(batch_sessionization.compute_sessions(empty, empty, empty, 2)[0]), 0)
+
+    def test_process_data_file(self):
+        test_folders = sorted(glob.glob(os.path.join(TESTS_PATH, 'test_*')))
+        self.assertTrue(test_folders)
+        for test_folder in test_folders:
+            with open(os.path.join(test_folder, 'output', 'sessionization.txt')) as expected_handle:
+                expected_output = expected_handle.read()
+            output_handle = StringIO()
+            with open(os.path.join(test_folder, 'input', 'log.csv')) as input_handle, \
+                    open(os.path.join(test_folder, 'input', 'inactivity_period.txt')) as inactivity_handle:
+                batch_sessionization.process_data_file(input_handle, inactivity_handle, output_handle)
+            self.assertEqual(output_handle.getvalue(), expected_output)
+
+        output_handle = StringIO()
+        batch_sessionization.process_data_file(StringIO('ip,date,time,zone,cik,accession,extention,code\n'),
+                                               StringIO('2\n'), output_handle)
+        self.assertEqual(output_handle.getvalue(), '')
+
+    def test_process_data_file_sweep(self):
+        test_folder = sorted(glob.glob(os.path.join(TESTS_PATH, 'test_*')))[0]
+        with open(os.path.join(test_folder, 'input', 'log.csv')) as input_handle:
+            log = input_handle.read()
+        intervals = [1, 2, 10]
+        output_handles = [StringIO() for _ in intervals]
+        batch_sessionization.process_data_file_sweep(StringIO(log), intervals, output_handles)
+        for interval, output_handle in zip(intervals, output_handles):
+            expected = StringIO()
+            sessionize.process_data_stream(StringIO(log), StringIO('%d\n' % interval), expected)
+            self.assertEqual(output_handle.getvalue(), expected.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import tempfile
+import unittest
+import benchmark
+import sessionization as sessionize
+from io import StringIO
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_get_column_order(self):
+        self.assertListEqual(benchmark.get_column_order('standard'), benchmark.EDGAR_FIELDS)
+        shuffled = benchmark.get_column_order('shuffled', 3)
+        self.assertListEqual(sorted(shuffled), sorted(benchmark.EDGAR_FIELDS))
+        self.assertListEqual(shuffled, benchmark.get_column_order('shuffled', 3))
+        order = list(reversed(benchmark.EDGAR_FIELDS))
+        self.assertListEqual(benchmark.get_column_order(','.join(order)), order)
+        with self.assertRaises(ValueError):
+            benchmark.get_column_order('ip,date,time')
+
+    def test_generate_log(self):
+        log_handle = StringIO()
+        benchmark.generate_log(log_handle, 2000, distinct_ips=50, gap_rate=0.01, max_gap=100, malformed_rate=0.05,
+                               column_order='shuffled', seed=7)
+        same_log_handle = StringIO()
+        benchmark.generate_log(same_log_handle, 2000, distinct_ips=50, gap_rate=0.01, max_gap=100,
+                               malformed_rate=0.05, column_order='shuffled', seed=7)
+        self.assertEqual(log_handle.getvalue(), same_log_handle.getvalue())
+
+        lines = log_handle.getvalue().splitlines()
+        self.assertEqual(len(lines), 2001)
+        self.assertListEqual(lines[0].split(','), benchmark.get_column_order('shuffled', 7))
+
+        log_handle.seek(0)
+        req_fields = sessionize.get_order_of_required_fields(log_handle)
+        requests = list(sessionize.read_requests(log_handle, req_fields))
+        self.assertTrue(1800 < len(requests) < 2000)
+        self.assertLessEqual(len(set(request[0] for request in requests)), 50)
+        date_times = [request[1] for request in requests]
+        self.assertListEqual(date_times, sorted(date_times))
+
+    def test_run_engine(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_path = os.path.join(temp_dir, 'log.csv')
+            output_path = os.path.join(temp_dir, 'sessionization.txt')
+            with open(input_path, 'w') as log_handle:
+                benchmark.generate_log(log_handle, 500, distinct_ips=20, seed=1)
+            stream_result = benchmark.run_engine('stream', input_path, 5, output_path, 2)
+            parallel_result = benchmark.run_engine('parallel', input_path, 5, output_path, 2)
+            # the batch and cache engines need NumPy
+            engines = ['pipeline'] + (['batch', 'cache'] if np is not None else [])
+            other_results = {engine: benchmark.run_engine(engine, input_path, 5, output_path, 2) for engine in engines}
+            with self.assertRaises(ValueError):
+                benchmark.run_engine('unknown', input_path, 5, output_path, 2)
+        self.assertEqual(stream_result['output_sha1'], parallel_result['output_sha1'])
+        for result in other_results.values():
+            self.assertEqual(result['output_sha1'], stream_result['output_sha1'])
+        if np is not None:
+            self.assertGreater(other_results['cache']['cache_seconds'], 0)
+        self.assertGreater(stream_result['seconds'], 0)
+        self.assertGreater(stream_result['parse_seconds'], 0)
+
+    def test_wait_for_result(self):
+        context = benchmark.multiprocessing.get_context('spawn')
+        # a child which dies without a result
+        result_queue = context.Queue()
+        process = context.Process(target=os._exit, args=(3,))
+        process.start()
+        result = benchmark.wait_for_result(result_queue, process, poll_interval=0.1)
+        process.join()
+        self.assertIn('code 3', result['error'])
+        # a child which runs for too long
+        process = context.Process(target=time.sleep, args=(30,))
+        process.start()
+        result = benchmark.wait_for_result(result_queue, process, timeout=0.2, poll_interval=0.1)
+        self.assertIn('no result', result['error'])
+        self.assertFalse(process.is_alive())
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            results_path = os.path.join(temp_dir, 'results.json')
+            benchmark.main([results_path, '-lines', '300', '-ips', '10', '-inactivity', '1,3', '-engines', 'stream'])
+            with open(results_path) as results_handle:
+                report = json.load(results_handle)
+        self.assertEqual(report['config']['lines'], 300)
+        self.assertListEqual([(result['engine'], result['inactivity_interval']) for result in report['results']],
+                             [('stream', 1), ('stream', 3)])
+        for result in report['results']:
+            self.assertEqual(result['lines'], 300)
+            self.assertGreater(result['lines_per_second'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import benchmark
+import checkpoint
+import sessionization as sessionize
+from io import StringIO
+
+
+class InterruptingCheckpoint(checkpoint.Checkpoint):
+    """
+        A checkpoint which saves a snapshot at the end of every block and stops the stream after saves snapshots.
+    """
+
+    def __init__(self, path, saves):
+        checkpoint.Checkpoint.__init__(self, path, 0)
+        self.saves = saves
+
+    def save(self, state, output_handle=None):
+        checkpoint.Checkpoint.save(self, state, output_handle)
+        self.saves -= 1
+        if self.saves == 0:
+            raise KeyboardInterrupt
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.temp_dir.name, 'snapshot.bin')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_save_and_load(self):
+        req_fields = dict(zip(sessionize.REQUIRED_FIELDS, [0, 1, 2, 4, 5, 6]))
+        request_dict = {'101.81.133.jja': sessionize.Session(10, 12, 3, 0),
+                        '107.23.85.jfd': sessionize.Session(11, 11, 1, 2)}
+        expiration_dict = {12: ['101.81.133.jja', '107.23.85.jfd'], 14: ['101.81.133.jja'], 13: ['108.91.91.hbc']}
+        state = {'inactivity_interval': 2, 'req_fields': req_fields, 'input_offset': 1234, 'output_offset': 56,
+                 'latest_date_time': 12, 'counter': 7, 'request_dict': request_dict,
+                 'expiration_dict': expiration_dict}
+        snapshot = checkpoint.Checkpoint(self.snapshot_path)
+        self.assertIsNone(snapshot.load())
+        snapshot.save(state)
+
+        loaded = snapshot.load()
+        self.assertListEqual(sorted(loaded.pop('expiration_heap')), [12, 13, 14])
+        # the ip without an open session is dropped from its bucket
+        expiration_dict[13] = []
+        self.assertDictEqual(loaded, state)
+
+        state['request_dict'], state['expiration_dict'], state['latest_date_time'] = {}, {}, None
+        snapshot.save(state)
+        loaded = snapshot.load()
+        self.assertListEqual(loaded.pop('expiration_heap'), [])
+        self.assertDictEqual(loaded, state)
+
+        snapshot.remove()
+        self.assertFalse(os.path.exists(self.snapshot_path))
+
+    def test_resume(self):
+        input_path = os.path.join(self.temp_dir.name, 'log.csv')
+        with open(input_path, 'w') as input_handle:
+            benchmark.generate_log(input_handle, 5000, distinct_ips=300, gap_rate=0.01, max_gap=20,
+                                   malformed_rate=0.01, seed=3)
+        expected = StringIO()
+        with open(input_path, 'r') as input_handle:
+            sessionize.process_data_stream(input_handle, StringIO('5\n'), expected)
+
+        read_blocks = sessionize.read_blocks
+        output_path = os.path.join(self.temp_dir.name, 'sessions.txt')
+        with mock.patch.object(sessionize, 'read_blocks', lambda handle, size: read_blocks(handle, 4096)):
+            with open(input_path, 'rb') as input_handle, open(output_path, 'w') as output_handle:
+                with self.assertRaises(KeyboardInterrupt):
+                    sessionize.process_data_stream(input_handle, StringIO('5\n'), output_handle, None,
+                                                   InterruptingCheckpoint(self.snapshot_path, 20))
+                output_handle.write('lines written after the snapshot are discarded\n')
+            self.assertTrue(os.path.exists(self.snapshot_path))
+
+            with open(input_path, 'rb') as input_handle, open(output_path, 'r+') as output_handle:
+                with self.assertRaises(ValueError):
+                    sessionize.process_data_stream(input_handle, StringIO('6\n'), output_handle, None,
+                                                   checkpoint.Checkpoint(self.snapshot_path))
+                sessionize.process_data_stream(input_handle, StringIO('5\n'), output_handle, None,
+                                               checkpoint.Checkpoint(self.snapshot_path))
+
+        with open(output_path, 'r') as output_handle:
+            self.assertEqual(output_handle.read(), expected.getvalue())
+        self.assertFalse(os.path.exists(self.snapshot_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+import benchmark
+import sessionization as sessionize
+from io import StringIO
+from test_helpers import HEADER
+
+try:
+    import numpy as np
+    import batch_sessionization
+    import columnar_cache
+except ImportError:
+    np = None
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class TestColumnarCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = os.path.join(tempfile.mkdtemp(), 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.cache_dir))
+
+    def test_write_and_load(self):
+        log = (HEADER +
+               'b,2017-06-30,00:00:00,0.0,1.0,x,.txt,200.0,1.0\n' +
+               'a,2017-06-30,00:00:00,0.0,2.0,y,.txt,200.0,1.0\n' +
+               ' ,2017-06-30,00:00:01,0.0,3.0,z,.txt,200.0,1.0\n' +
+               'b,2017-06-30,00:00:02,0.0,2.0,x,.txt,200.0,1.0\n' +
+               'a,2017-06-30,00:00:01,0.0,2.0,x,.txt,200.0,1.0\n' +
+               'a,2017-06-30,00:00:01,0.0,1.0,x,.txt,200.0,1.0\n')
+        self.assertFalse(columnar_cache.is_cache(self.cache_dir))
+        self.assertEqual(columnar_cache.write_cache(StringIO(log), self.cache_dir, ['cik']), 5)
+        self.assertTrue(columnar_cache.is_cache(self.cache_dir))
+
+        ips, ip_ids, date_times, counters = columnar_cache.load_cache(self.cache_dir)
+        self.assertIsInstance(ip_ids, np.memmap)
+        self.assertEqual(date_times.dtype, np.int32)
+        expected = batch_sessionization.load_requests(StringIO(log[len(HEADER):]),
+                                                      sessionize.get_order_of_required_fields(StringIO(HEADER)))
+        self.assertListEqual(ips, expected[0])
+        for column, expected_column in zip([ip_ids, date_times, counters], expected[1:]):
+            self.assertListEqual(column.tolist(), expected_column.tolist())
+        self.assertListEqual(np.load(os.path.join(self.cache_dir, 'cik_ids.npy')).tolist(), [0, 1, 1, 1, 0])
+        self.assertListEqual(columnar_cache.read_values(os.path.join(self.cache_dir, 'ciks.txt')), ['1.0', '2.0'])
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'accession_ids.npy')))
+
+        self.assertRaises(ValueError, columnar_cache.write_cache, StringIO(log), self.cache_dir, ['size'])
+
+    def test_same_output_as_stream(self):
+        log_handle = StringIO()
+        benchmark.generate_log(log_handle, 5000, distinct_ips=300, gap_rate=0.01, max_gap=30, malformed_rate=0.01,
+                               seed=6)
+        columnar_cache.write_cache(StringIO(log_handle.getvalue()), self.cache_dir)
+        intervals = [1, 2, 10, 60]
+        output_handles = [StringIO() for _ in intervals]
+        columnar_cache.process_cache(self.cache_dir, intervals, output_handles)
+        for interval, output_handle in zip(intervals, output_handles):
+            expected = StringIO()
+            sessionize.process_data_stream(StringIO(log_handle.getvalue()), StringIO('%d\n' % interval), expected)
+            self.assertEqual(output_handle.getvalue(), expected.getvalue())
+
+    def test_empty_log(self):
+        columnar_cache.write_cache(StringIO(HEADER), self.cache_dir)
+        output_handle = StringIO()
+        columnar_cache.process_cache(self.cache_dir, [2], [output_handle])
+        self.assertEqual(output_handle.getvalue(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
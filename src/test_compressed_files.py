@@ -0,0 +1,91 @@
+import os
+import gzip
+import zipfile
+import tempfile
+import unittest
+import compressed_files
+import sessionization as sessionize
+from io import StringIO
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+TESTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'insight_testsuite', 'tests')
+
+
+class TestCompressedFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(TESTS_PATH, 'test_1', 'input', 'log.csv'), 'rb') as log_handle:
+            self.log = log_handle.read()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.temp_dir.name, name)
+
+    def write_compressed_logs(self):
+        with gzip.open(self.path('log.csv.gz'), 'wb') as log_handle:
+            log_handle.write(self.log)
+        with zipfile.ZipFile(self.path('log.zip'), 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('README.txt', 'not a log')
+            archive.writestr('log20170630.csv', self.log)
+        with open(self.path('log.csv'), 'wb') as log_handle:
+            log_handle.write(self.log)
+        paths = {'gzip': self.path('log.csv.gz'), 'zip': self.path('log.zip'), None: self.path('log.csv')}
+        if zstandard is not None:
+            with open(self.path('log.csv.zst'), 'wb') as log_handle:
+                log_handle.write(zstandard.ZstdCompressor().compress(self.log))
+            paths['zstd'] = self.path('log.csv.zst')
+        return paths
+
+    def test_detect_compression(self):
+        for compression, path in self.write_compressed_logs().items():
+            self.assertEqual(compressed_files.detect_compression(path), compression)
+        self.assertEqual(compressed_files.get_output_compression('sessions.txt.gz'), 'gzip')
+        self.assertEqual(compressed_files.get_output_compression('sessions.txt.zst'), 'zstd')
+        self.assertIsNone(compressed_files.get_output_compression('sessions.txt'))
+
+    def test_decompressing_reader(self):
+        paths = self.write_compressed_logs()
+        del paths[None]
+        for path in paths.values():
+            reader = compressed_files.open_input(path)
+            self.assertEqual(reader.read(0), b'')
+            self.assertEqual(reader.readline(), self.log[:self.log.find(b'\n') + 1])
+            self.assertEqual(reader.seek(100), 100)
+            self.assertEqual(reader.read(10), self.log[100:110])
+            self.assertEqual(reader.tell(), 110)
+            self.assertRaises(ValueError, reader.seek, 50)
+            self.assertEqual(reader.read(), self.log[110:])
+            self.assertEqual(reader.read(10), b'')
+            reader.close()
+
+        # a small chunk size makes lines span several chunks
+        reader = compressed_files.DecompressingReader(paths['gzip'], 'gzip', chunk_size=7, queue_size=2)
+        self.assertEqual(b''.join(iter(reader.readline, b'')), self.log)
+        reader.close()
+
+        # the reader can be closed while the decompression thread waits for a full queue
+        reader = compressed_files.DecompressingReader(paths['gzip'], 'gzip', chunk_size=7, queue_size=1)
+        reader.close()
+        self.assertFalse(reader.thread.is_alive())
+
+    def test_process_compressed_stream(self):
+        with open(os.path.join(TESTS_PATH, 'test_1', 'output', 'sessionization.txt'), 'r') as expected_handle:
+            expected = expected_handle.read()
+        for path in self.write_compressed_logs().values():
+            input_handle, output_handle = sessionize.open_files([(path, 'r'), (self.path('sessions.txt.gz'), 'w')])
+            sessionize.process_data_stream(input_handle, StringIO('2\n'), output_handle)
+            sessionize.close_files([input_handle, output_handle])
+            with gzip.open(self.path('sessions.txt.gz'), 'rt') as output_handle:
+                self.assertEqual(output_handle.read(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
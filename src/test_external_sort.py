@@ -0,0 +1,113 @@
+import os
+import gzip
+import random
+import shutil
+import tempfile
+import unittest
+import benchmark
+import external_sort
+import sessionization as sessionize
+from io import StringIO
+
+
+def shuffle_seconds(log, seed):
+    """
+        Shuffles the seconds of a chronological log, keeping the order of the records of each second (a malformed
+        record stays with the second before it).
+    """
+    header, _, records = log.partition('\n')
+    seconds = []
+    last_date_time = None
+    for line in records.splitlines(True):
+        fields = line.split(',')
+        try:
+            date_time = sessionize.parse_timestamp(fields[1], fields[2])
+        except (ValueError, IndexError):
+            date_time = last_date_time
+        if not seconds or date_time != last_date_time:
+            seconds.append([])
+        seconds[-1].append(line)
+        last_date_time = date_time
+    random.Random(seed).shuffle(seconds)
+    return header + '\n' + ''.join(line for second in seconds for line in second)
+
+
+class TestExternalSort(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_file(self, name, text):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as file_handle:
+            file_handle.write(text)
+        return path
+
+    def test_sort_chunk(self):
+        run_path = os.path.join(self.temp_dir, 'run.txt')
+        text = ('a,2017-06-30,00:00:05\n' +
+                'b,2017-06-30,00:00:02\n' +
+                ' ,2017-06-30,00:00:01\n' +
+                'c,2017-06-30,bad\n' +
+                'd,2017-06-30,00:00:02\n' +
+                'short\n')
+        leading_records, last_date_time = external_sort.sort_chunk('x,bad,bad\n' + text, 10, (0, 1, 2), run_path)
+        self.assertListEqual(leading_records, [(10, 'x,bad,bad')])
+        self.assertEqual(last_date_time, sessionize.parse_timestamp('2017-06-30', '00:00:02'))
+        with open(run_path) as run_handle:
+            lines = [line.split(',', 2)[2] for line in run_handle]
+        self.assertListEqual(lines, ['b,2017-06-30,00:00:02\n', 'c,2017-06-30,bad\n', 'd,2017-06-30,00:00:02\n',
+                                     'a,2017-06-30,00:00:05\n'])
+
+    def test_same_output_as_sorted_input(self):
+        log_handle = StringIO()
+        benchmark.generate_log(log_handle, 5000, distinct_ips=300, gap_rate=0.01, max_gap=30, malformed_rate=0.01,
+                               seed=4)
+        expected = StringIO()
+        sessionize.process_data_stream(StringIO(log_handle.getvalue()), StringIO('3\n'), expected)
+
+        shuffled = shuffle_seconds(log_handle.getvalue(), 4)
+        self.assertNotEqual(shuffled, log_handle.getvalue())
+        header, _, records = shuffled.partition('\n')
+        middle = records.index('\n', len(records) // 2) + 1
+        paths = [self.write_file('log1.csv', header + '\n' + records[:middle]),
+                 self.write_file('log2.csv', header + '\n' + records[middle:])]
+        for workers in [1, 2]:
+            sorted_input = external_sort.SortedInput(paths, workers, chunk_size=20000, temp_dir=self.temp_dir)
+            output_handle = StringIO()
+            sessionize.process_data_stream(sorted_input, StringIO('3\n'), output_handle)
+            self.assertGreater(len(sorted_input.run_paths), 4)
+            sorted_input.close()
+            self.assertFalse(os.path.exists(sorted_input.temp_dir))
+            self.assertEqual(output_handle.getvalue(), expected.getvalue())
+
+    def test_compressed_input(self):
+        log_handle = StringIO()
+        benchmark.generate_log(log_handle, 2000, distinct_ips=100, gap_rate=0.01, max_gap=30, seed=5)
+        expected = StringIO()
+        sessionize.process_data_stream(StringIO(log_handle.getvalue()), StringIO('3\n'), expected)
+
+        path = os.path.join(self.temp_dir, 'log.csv.gz')
+        with gzip.open(path, 'wt') as compressed_handle:
+            compressed_handle.write(shuffle_seconds(log_handle.getvalue(), 5))
+        sorted_input = external_sort.SortedInput([path], chunk_size=20000, temp_dir=self.temp_dir)
+        output_handle = StringIO()
+        sessionize.process_data_stream(sorted_input, StringIO('3\n'), output_handle)
+        sorted_input.close()
+        self.assertEqual(output_handle.getvalue(), expected.getvalue())
+
+    def test_different_headers(self):
+        paths = [self.write_file('log1.csv', 'ip,date,time,cik,accession,extention\n'),
+                 self.write_file('log2.csv', 'date,ip,time,cik,accession,extention\n')]
+        sorted_input = external_sort.SortedInput(paths, temp_dir=self.temp_dir)
+        sorted_input.readline()
+        with self.assertRaises(ValueError):
+            list(sorted_input.read_blocks())
+        sorted_input.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import follow_sessionization
+import sessionization as sessionize
+from io import StringIO
+from test_helpers import HEADER
+
+
+def record(ip, t):
+    return '%s,2017-06-30,%s,0.0,1608552.0,0001047469-17-004337,-index.htm,200.0,80251.0\n' % (ip, t)
+
+
+class FakeClock(object):
+    """
+        A clock which only moves when sleep is called, and runs the next scripted action after each sleep.
+    """
+
+    def __init__(self, actions):
+        self.now = 0.0
+        self.actions = list(actions)
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        if self.actions:
+            self.actions.pop(0)()
+
+
+class TestFollowSessionization(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.temp_dir.name, 'log.csv')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def append(self, text):
+        with open(self.log_path, 'a') as log_handle:
+            log_handle.write(text)
+
+    def rotate(self, text):
+        os.rename(self.log_path, self.log_path + '.1')
+        with open(self.log_path, 'w') as log_handle:
+            log_handle.write(text)
+
+    def test_follow_rotated_log(self):
+        records = [record('101.81.133.jja', '00:00:00'), record('107.23.85.jfd', '00:00:00'),
+                   record('101.81.133.jja', '00:00:01'), record('108.91.91.hbc', '00:00:05'),
+                   record('107.23.85.jfd', '00:00:06'), record('101.81.133.jja', '00:00:09')]
+        expected = StringIO()
+        sessionize.process_data_stream(StringIO(HEADER + ''.join(records)), StringIO('2\n'), expected)
+
+        self.append(HEADER + records[0] + records[1] + records[2][:10])
+        clock = FakeClock([lambda: self.append(records[2][10:] + records[3]),
+                           lambda: None,
+                           lambda: self.rotate(HEADER + records[4] + records[5])])
+        follower = follow_sessionization.LogFollower(self.log_path, 1.0, 3.0, clock.time, clock.sleep)
+        output_handle = StringIO()
+        try:
+            sessionize.process_data_stream(follower, StringIO('2\n'), output_handle)
+        finally:
+            follower.close()
+        self.assertEqual(output_handle.getvalue(), expected.getvalue())
+
+    def test_wall_clock_expiration(self):
+        self.append(HEADER + record('101.81.133.jja', '00:00:00') + record('107.23.85.jfd', '00:00:00'))
+        output_handle = StringIO()
+        written = []
+        clock = FakeClock([lambda: None, lambda: None, lambda: None,
+                           lambda: written.append(output_handle.getvalue()),
+                           lambda: self.append(record('108.91.91.hbc', '00:00:10'))])
+        follower = follow_sessionization.LogFollower(self.log_path, 1.0, 5.0, clock.time, clock.sleep)
+        with mock.patch.object(sessionize, 'time', clock):
+            sessionize.process_data_stream(follower, StringIO('2\n'), output_handle, max_latency=0)
+        follower.close()
+
+        # the sessions expire once the wall clock moves the log clock past their expiration time
+        sessions = ('101.81.133.jja,2017-06-30 00:00:00,2017-06-30 00:00:00,1,1\n' +
+                    '107.23.85.jfd,2017-06-30 00:00:00,2017-06-30 00:00:00,1,1\n')
+        self.assertListEqual(written, [sessions])
+        self.assertEqual(output_handle.getvalue(),
+                         sessions + '108.91.91.hbc,2017-06-30 00:00:10,2017-06-30 00:00:10,1,1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import json
+import random
+import unittest
+import heavy_hitters
+import sessionization as sessionize
+from collections import Counter
+from io import StringIO
+from test_helpers import HEADER, make_record
+
+
+class TestHeavyHitters(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(1)
+        self.values = ['v%d' % min(int(rng.paretovariate(1.2)), 5000) for _ in range(20000)]
+        self.counts = Counter(self.values)
+
+    def test_count_min_sketch(self):
+        sketch = heavy_hitters.CountMinSketch(width=256, depth=4)
+        for value in self.values:
+            sketch.add(value)
+        self.assertEqual(sketch.total, len(self.values))
+        for value, count in self.counts.items():
+            self.assertGreaterEqual(sketch.estimate(value), count)
+        self.assertEqual(sketch.add('v1', 0), sketch.estimate('v1'))
+
+        # the counts of blocks are pending until they are hashed
+        blocks = heavy_hitters.CountMinSketch(width=256, depth=4)
+        for start in range(0, len(self.values), 1000):
+            blocks.add_counts(Counter(self.values[start:start + 1000]))
+        self.assertEqual(blocks.total, len(self.values))
+        pending = {value: blocks.estimate(value) for value in self.counts}
+        blocks.flush()
+        self.assertEqual(len(blocks.pending), 0)
+        for value, count in self.counts.items():
+            self.assertGreaterEqual(pending[value], count)
+            self.assertEqual(blocks.estimate(value), sketch.estimate(value))
+
+    def test_space_saving(self):
+        summary = heavy_hitters.SpaceSaving(50)
+        for value in self.values:
+            summary.add(value)
+        self.assertEqual(len(summary.counts), 50)
+        top = summary.top(5)
+        self.assertListEqual([value for value, _, _ in top], [value for value, _ in self.counts.most_common(5)])
+        for value, count, error in top:
+            self.assertGreaterEqual(count, self.counts[value])
+            self.assertLessEqual(count - error, self.counts[value])
+
+        weighted = heavy_hitters.SpaceSaving(50)
+        for value, count in Counter(self.values).items():
+            weighted.add(value, count)
+        self.assertEqual(weighted.top(1)[0][:2], [self.counts.most_common(1)[0][0], self.counts.most_common(1)[0][1]])
+
+        # a block at a time, the values which can not be frequent enough are not admitted
+        blocks = heavy_hitters.SpaceSaving(50)
+        for start in range(0, len(self.values), 1000):
+            blocks.add_counts(Counter(self.values[start:start + 1000]))
+        self.assertEqual(len(blocks.counts), 50)
+        self.assertListEqual([value for value, _, _ in blocks.top(5)],
+                             [value for value, _ in self.counts.most_common(5)])
+        smallest = blocks.smallest()
+        for value, count in self.counts.items():
+            if value in blocks.counts:
+                self.assertGreaterEqual(blocks.counts[value][0], count)
+                self.assertLessEqual(blocks.counts[value][0] - blocks.counts[value][1], count)
+            else:
+                self.assertLessEqual(count, smallest)
+
+    def test_process_data_stream(self):
+        # a crawler making 5 requests per second next to a slow user
+        log = HEADER
+        for second in range(100):
+            for i in range(5):
+                log += make_record('crawler', second, cik='%d.0' % (i % 2), accession='x%d' % second)
+            if second % 10 == 0:
+                log += make_record('user', second, cik='7.0', accession='y')
+        expected = StringIO()
+        sessionize.process_data_stream(StringIO(log), StringIO('60\n'), expected)
+
+        report_handle = StringIO()
+        hitters = heavy_hitters.HeavyHitters(report_handle, k=2, rate_threshold=2.0, report_interval=None)
+        output_handle = StringIO()
+        sessionize.process_data_stream(StringIO(log), StringIO('60\n'), output_handle, heavy_hitters=hitters)
+        self.assertEqual(output_handle.getvalue(), expected.getvalue())
+
+        lines = [json.loads(line) for line in report_handle.getvalue().splitlines()]
+        self.assertEqual(len(lines), 2)
+        flagged = lines[0]['flagged_session']
+        self.assertEqual(flagged['ip'], 'crawler')
+        self.assertEqual(flagged['requests'], 500)
+        self.assertEqual(flagged['ip_requests'], 500)
+        report = lines[1]
+        self.assertEqual(report['requests'], 510)
+        self.assertEqual(report['flagged_sessions'], 1)
+        self.assertListEqual(report['top_ips'], [['crawler', 500, 0], ['user', 10, 0]])
+        self.assertListEqual(report['top_ciks'], [['0.0', 300, 0], ['1.0', 200, 0]])
+        # no accession is frequent enough to be found for sure, but the counts are bounded by their errors
+        for accession, count, error in report['top_accessions']:
+            self.assertLessEqual(count - error, 10 if accession == 'y' else 5)
+
+    def test_signals(self):
+        # a slow self-declared crawler next to a user, in a log without the noagent field
+        log = HEADER.replace('size', 'size,crawler')
+        for second in range(0, 60, 2):
+            log += make_record('bot', second)[:-1] + ',1.0\n'
+            log += make_record('user', second)[:-1] + ',0.0\n'
+        report_handle = StringIO()
+        hitters = heavy_hitters.HeavyHitters(report_handle, k=2, rate_threshold=2.0, report_interval=None,
+                                             signals=True)
+        sessionize.process_data_stream(StringIO(log), StringIO('60\n'), StringIO(), heavy_hitters=hitters)
+        lines = [json.loads(line) for line in report_handle.getvalue().splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['flagged_session']['ip'], 'bot')
+        self.assertListEqual(lines[0]['flagged_session']['reasons'], ['crawler'])
+        self.assertEqual(lines[1]['crawler_requests'], 30)
+        self.assertEqual(lines[1]['noagent_requests'], 0)
+
+        # without signals the field is not read
+        report_handle = StringIO()
+        hitters = heavy_hitters.HeavyHitters(report_handle, k=2, rate_threshold=2.0, report_interval=None)
+        sessionize.process_data_stream(StringIO(log), StringIO('60\n'), StringIO(), heavy_hitters=hitters)
+        report = json.loads(report_handle.getvalue())
+        self.assertEqual(report['flagged_sessions'], 0)
+        self.assertEqual(report['crawler_requests'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
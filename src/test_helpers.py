@@ -0,0 +1,15 @@
+HEADER = 'ip,date,time,zone,cik,accession,extention,code,size\n'
+
+
+def make_record(ip, seconds, cik='1.0', accession='a'):
+    """
+        Returns a record of the log of 2017-06-30 with the header HEADER.
+
+    :param ip: ip of the request
+    :param seconds: time of the request in seconds since the start of the day
+    :param cik: cik of the request
+    :param accession: accession of the request
+    :return: a line of the log
+    """
+    return '%s,2017-06-30,%02d:%02d:%02d,0.0,%s,%s,.txt,200.0,1.0\n' % (ip, seconds // 3600, seconds // 60 % 60,
+                                                                       seconds % 60, cik, accession)
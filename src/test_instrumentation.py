@@ -0,0 +1,76 @@
+import json
+import unittest
+import aggregators
+import heavy_hitters
+import instrumentation
+import sessionization as sessionize
+from io import StringIO
+from test_helpers import HEADER
+
+
+RECORDS = ('bad date,2017-13-30,00:00:00,0.0,1608552.0,0001047469-17-004337,-index.htm,200.0,80251.0\n' +
+           '101.81.133.jja,2017-06-30,00:00:00,0.0,1608552.0,0001047469-17-004337,-index.htm,200.0,80251.0\n' +
+           '107.23.85.jfd,2017-06-30,00:00:00,0.0,1027281.0\n' +
+           '\n' +
+           ' ,2017-06-30,00:00:01,0.0,1136894.0,0000905148-07-003827,-index.htm,200.0,3021.0\n' +
+           '108.91.91.hbc,2017-06-30,00:00:01,0.0,1295391.0,0001209784-17-000052,.txt,200.0,19884.0\n' +
+           '107.23.85.jfd,2017-06-30,00:00:04,0.0,841535.0,0000841535-98-000002,-index.html,200.0,2699.0\n' +
+           '108.91.91.hbc,2017-06-30,0:0:4,0.0,1295391.0,0001209784-17-000052,.txt,200.0,19884.0\n')
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_process_data_stream_with_stats(self):
+        expected = StringIO()
+        sessionize.process_data_stream(StringIO(HEADER + RECORDS), StringIO('2\n'), expected)
+
+        stats_handle = StringIO()
+        stats = instrumentation.StreamStats(stats_handle)
+        output_handle = StringIO()
+        sessionize.process_data_stream(StringIO(HEADER + RECORDS), StringIO('2\n'), output_handle, stats=stats)
+        self.assertEqual(output_handle.getvalue(), expected.getvalue())
+
+        report = json.loads(stats_handle.getvalue())
+        self.assertEqual(report['lines_read'], 7)
+        self.assertEqual(report['requests'], 4)
+        self.assertDictEqual(report['rejected'], {'short_record': 1, 'empty_ip': 1, 'bad_date_time': 1})
+        self.assertEqual(report['sessions_written'], 4)
+        self.assertEqual(report['peak_open_sessions'], 2)
+        self.assertEqual(report['open_sessions'], 0)
+        self.assertEqual(report['expiration_buckets'], 0)
+        self.assertListEqual(sorted(report['seconds']), sorted(instrumentation.STAGES))
+        for seconds in report['seconds'].values():
+            self.assertGreaterEqual(seconds, 0)
+
+    def test_combined_features(self):
+        # the stats, the aggregates and the heavy hitters hook into the same reader
+        expected = StringIO()
+        sessionize.process_data_stream(StringIO(HEADER + RECORDS), StringIO('2\n'), expected,
+                                       aggregators=aggregators.SessionAggregators(['sum_size']))
+        stats_handle, report_handle, output_handle = StringIO(), StringIO(), StringIO()
+        sessionize.process_data_stream(StringIO(HEADER + RECORDS), StringIO('2\n'), output_handle,
+                                       stats=instrumentation.StreamStats(stats_handle),
+                                       aggregators=aggregators.SessionAggregators(['sum_size']),
+                                       heavy_hitters=heavy_hitters.HeavyHitters(report_handle, report_interval=None))
+        self.assertEqual(output_handle.getvalue(), expected.getvalue())
+        self.assertEqual(json.loads(stats_handle.getvalue())['requests'], 4)
+        self.assertEqual(json.loads(report_handle.getvalue())['requests'], 4)
+
+        args = sessionize.parse_arguments(['log.csv', 'inactivity_period.txt', 'output.txt', '-stats', '-',
+                                           '-aggregates', 'sum_size', '-heavy_hitters', '-', '-lateness', '2'])
+        self.assertEqual((args.stats, args.aggregates, args.heavy_hitters), ('-', ['sum_size'], '-'))
+
+    def test_periodic_reports(self):
+        stats_handle = StringIO()
+        stats = instrumentation.StreamStats(stats_handle, interval=0)
+        requests = list(sessionize.read_requests(StringIO(RECORDS), sessionize.get_order_of_required_fields(
+            StringIO(HEADER)), stats=stats))
+        self.assertListEqual([r[1:] for r in requests], [(1498780800, 0), (1498780801, 0), (1498780804, 0),
+                                                         (1498780804, 1)])
+        # one line after the only block of input
+        self.assertEqual(len(stats_handle.getvalue().splitlines()), 1)
+        self.assertEqual(json.loads(stats_handle.getvalue())['requests'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import gzip
+import tempfile
+import unittest
+import multi_file_input
+import parallel_sessionization
+import pipelined_sessionization
+import sessionization as sessionize
+from io import StringIO
+from test_helpers import HEADER
+
+
+RECORDS = ['101.81.133.jja,2017-06-30,23:59:58,0.0,1608552.0,0001047469-17-004337,-index.htm,200.0,80251.0\n',
+           '107.23.85.jfd,2017-06-30,23:59:59,0.0,1027281.0,0000898430-02-001167,-index.htm,200.0,2825.0\n',
+           '101.81.133.jja,2017-07-01,00:00:00,0.0,1136894.0,0000905148-07-003827,-index.htm,200.0,3021.0\n',
+           '108.91.91.hbc,2017-07-01,00:00:01,0.0,1295391.0,0001209784-17-000052,.txt,200.0,19884.0\n',
+           '107.23.85.jfd,2017-07-01,00:00:05,0.0,841535.0,0000841535-98-000002,-index.html,200.0,2699.0\n',
+           '101.81.133.jja,2017-07-01,00:00:05,0.0,842814.0,0000842814-98-000001,-index.html,200.0,2690.0\n']
+
+
+def reorder_columns(text, order):
+    return ''.join(','.join(line.split(',')[i] for i in order) + '\n' for line in text.splitlines())
+
+
+class TestMultiFileInput(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.paths = [os.path.join(self.temp_dir.name, 'log2017063%d.csv' % i) for i in range(3)]
+        # the second file has another order of columns and is compressed, sessions span the files
+        with open(self.paths[0], 'w') as log_handle:
+            log_handle.write(HEADER + ''.join(RECORDS[:2]))
+        self.paths[1] += '.gz'
+        with gzip.open(self.paths[1], 'wt') as log_handle:
+            log_handle.write(reorder_columns(HEADER + ''.join(RECORDS[2:4]), [8, 7, 6, 5, 4, 3, 2, 1, 0]))
+        with open(self.paths[2], 'w') as log_handle:
+            log_handle.write(HEADER + ''.join(RECORDS[4:]))
+
+        self.expected = StringIO()
+        sessionize.process_data_stream(StringIO(HEADER + ''.join(RECORDS)), StringIO('2\n'), self.expected)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_expand_input_paths(self):
+        pattern = os.path.join(self.temp_dir.name, 'log*.csv*')
+        self.assertListEqual(multi_file_input.expand_input_paths([pattern]), self.paths)
+        self.assertListEqual(multi_file_input.expand_input_paths([self.temp_dir.name]), self.paths)
+        self.assertListEqual(multi_file_input.expand_input_paths([self.paths[2], self.paths[0]]),
+                             [self.paths[2], self.paths[0]])
+
+    def test_process_input_files(self):
+        input_files = multi_file_input.InputFiles(self.paths)
+        output_handle = StringIO()
+        sessionize.process_data_stream(input_files, StringIO('2\n'), output_handle)
+        input_files.close()
+        self.assertEqual(output_handle.getvalue(), self.expected.getvalue())
+
+        input_files = multi_file_input.InputFiles(self.paths)
+        output_handle = StringIO()
+        parallel_sessionization.process_data_stream_parallel(input_files, StringIO('2\n'), output_handle, 2)
+        input_files.close()
+        self.assertEqual(output_handle.getvalue(), self.expected.getvalue())
+
+        input_files = multi_file_input.InputFiles(self.paths)
+        output_handle = StringIO()
+        pipelined_sessionization.process_data_stream_pipelined(input_files, StringIO('2\n'), output_handle)
+        input_files.close()
+        self.assertEqual(output_handle.getvalue(), self.expected.getvalue())
+
+    def test_close_before_reading(self):
+        input_files = multi_file_input.InputFiles(self.paths)
+        self.assertEqual(input_files.readline(), HEADER)
+        input_files.close()
+        self.assertIsNone(input_files.input_handle)
+
+    def test_parse_arguments(self):
+        args = sessionize.parse_arguments([os.path.join(self.temp_dir.name, '*.csv*'), 'inactivity_period.txt',
+                                           'sessionization.txt'])
+        self.assertListEqual(args.input_paths, self.paths)
+        self.assertEqual(args.output_path, 'sessionization.txt')
+
+
+if __name__ == '__main__':
+    unittest.main()
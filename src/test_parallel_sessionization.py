@@ -0,0 +1,94 @@
+import os
+import glob
+import tempfile
+import unittest
+import sessionization as sessionize
+import parallel_sessionization
+from io import StringIO
+
+
+TESTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'insight_testsuite', 'tests')
+
+
+class TestParallelSessionization(unittest.TestCase):
+
+    def test_shard_line_key(self):
+        line = '1498780802,1498780800,3,101.81.133.jja,2017-06-30 00:00:00,2017-06-30 00:00:00,1,1\n'
+        self.assertTupleEqual(parallel_sessionization.shard_line_key(line), (1498780802, 1498780800, 3))
+
+    def test_merge_shard_files(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shard_paths = [os.path.join(temp_dir, 'shard_0.txt'), os.path.join(temp_dir, 'shard_1.txt')]
+            with open(shard_paths[0], 'w') as shard_handle:
+                shard_handle.write('2,0,1,a\n3,1,0,c\n%d,1,2,e\n' % parallel_sessionization.NEVER_EXPIRED)
+            with open(shard_paths[1], 'w') as shard_handle:
+                shard_handle.write('2,0,2,b\n%d,1,1,d\n' % parallel_sessionization.NEVER_EXPIRED)
+            output_handle = StringIO()
+            parallel_sessionization.merge_shard_files(shard_paths, output_handle)
+        self.assertEqual(output_handle.getvalue(), 'a\nb\nc\nd\ne\n')
+
+    def test_process_data_stream_parallel(self):
+        test_folders = sorted(glob.glob(os.path.join(TESTS_PATH, 'test_*')))
+        self.assertTrue(test_folders)
+        for test_folder in test_folders:
+            with open(os.path.join(test_folder, 'output', 'sessionization.txt')) as expected_handle:
+                expected_output = expected_handle.read()
+            for workers in [1, 2, 3]:
+                output_handle = StringIO()
+                with open(os.path.join(test_folder, 'input', 'log.csv')) as input_handle, \
+                        open(os.path.join(test_folder, 'input', 'inactivity_period.txt')) as inactivity_handle:
+                    parallel_sessionization.process_data_stream_parallel(input_handle, inactivity_handle,
+                                                                         output_handle, workers)
+                self.assertEqual(output_handle.getvalue(), expected_output)
+
+    def test_process_data_stream_parallel_time_gap(self):
+        input_text = ('ip,date,time,zone,cik,accession,extention,code,size,idx,norefer,noagent,find,crawler,browser\n' +
+                      'a,2017-06-30,00:00:00,0.0,1.0,a-1,.htm,200.0,1.0,1.0,0.0,0.0,9.0,0.0,\n' +
+                      'b,2017-06-30,00:00:00,0.0,1.0,a-1,.htm,200.0,1.0,1.0,0.0,0.0,9.0,0.0,\n' +
+                      'c,2017-06-30,00:00:01,0.0,1.0,a-1,.htm,200.0,1.0,1.0,0.0,0.0,9.0,0.0,\n' +
+                      'a,2017-06-30,00:00:02,0.0,1.0,a-1,.htm,200.0,1.0,1.0,0.0,0.0,9.0,0.0,\n' +
+                      'd,2017-06-30,00:00:02,0.0,1.0,a-1,.htm,200.0,1.0,1.0,0.0,0.0,9.0,0.0,\n' +
+                      'e,2017-06-30,00:00:03,0.0,1.0,a-1,.htm,200.0,1.0,1.0,0.0,0.0,9.0,0.0,\n' +
+                      'b,2017-07-01,08:00:00,0.0,1.0,a-1,.htm,200.0,1.0,1.0,0.0,0.0,9.0,0.0,\n' +
+                      'c,2017-07-01,08:00:00,0.0,1.0,a-1,.htm,200.0,1.0,1.0,0.0,0.0,9.0,0.0,\n' +
+                      'f,2017-07-01,08:00:01,0.0,1.0,a-1,.htm,200.0,1.0,1.0,0.0,0.0,9.0,0.0,\n')
+        for inactivity_interval in ['1\n', '2\n', '5\n']:
+            expected_output = StringIO()
+            sessionize.process_data_stream(StringIO(input_text), StringIO(inactivity_interval), expected_output)
+            for workers in [2, 4]:
+                output_handle = StringIO()
+                parallel_sessionization.process_data_stream_parallel(StringIO(input_text),
+                                                                     StringIO(inactivity_interval),
+                                                                     output_handle, workers)
+                self.assertEqual(output_handle.getvalue(), expected_output.getvalue())
+
+    def test_process_data_stream_parallel_chunks(self):
+        # malformed times at the start of a chunk take the time of the chunks before it, the first ones are dropped
+        # and the sessions starting in the same second keep the order of the input whatever their shard
+        input_text = ('ip,date,time,zone,cik,accession,extention,code,size\n' +
+                      'a,2017-06-30,xx:00:00,0.0,1.0,a-1,.htm,200.0,1.0\n' +
+                      'b,2017-06-30,00:00:00,0.0,1.0,a-1,.htm,200.0,1.0\n' +
+                      'c,2017-06-30,00:00:00,0.0,1.0,a-1,.htm,200.0,1.0\n' +
+                      'd,2017-06-30,00:00:01,0.0,1.0,a-1,.htm,200.0,1.0\n' +
+                      'e,2017-06-30,xx:00:01,0.0,1.0,a-1,.htm,200.0,1.0\n' +
+                      'b,2017-06-30,,0.0,1.0,a-1,.htm,200.0,1.0\n' +
+                      ',2017-06-30,00:00:02,0.0,1.0,a-1,.htm,200.0,1.0\n' +
+                      'f,2017-06-30,00:00:04,0.0,1.0,a-1\n' +
+                      'g,2017-06-30,00:00:04,0.0,1.0,a-1,.htm,200.0,1.0\n' +
+                      'a,2017-06-30,00:00:04,0.0,1.0,a-1,.htm,200.0,1.0\n' +
+                      'h,2017-06-30,bad,0.0,1.0,a-1,.htm,200.0,1.0\n' +
+                      'c,2017-06-30,00:00:09,0.0,1.0,a-1,.htm,200.0,1.0\n')
+        for inactivity_interval in ['1\n', '3\n']:
+            expected_output = StringIO()
+            sessionize.process_data_stream(StringIO(input_text), StringIO(inactivity_interval), expected_output)
+            for workers in [1, 3]:
+                for chunk_size in [1, 100]:
+                    output_handle = StringIO()
+                    parallel_sessionization.process_data_stream_parallel(StringIO(input_text),
+                                                                         StringIO(inactivity_interval),
+                                                                         output_handle, workers, chunk_size)
+                    self.assertEqual(output_handle.getvalue(), expected_output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
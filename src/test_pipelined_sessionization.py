@@ -0,0 +1,65 @@
+import unittest
+import benchmark
+import pipelined_sessionization
+import sessionization as sessionize
+from io import StringIO
+
+
+class FailingInput(StringIO):
+    """
+        An input handle whose reads fail after the first block.
+    """
+
+    def __init__(self, text):
+        StringIO.__init__(self, text)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        if self.reads > 2:
+            raise OSError('read failed')
+        return StringIO.read(self, size)
+
+
+class FailingOutput(StringIO):
+
+    def write(self, text):
+        raise OSError('write failed')
+
+
+class TestPipelinedSessionization(unittest.TestCase):
+
+    def setUp(self):
+        log_handle = StringIO()
+        benchmark.generate_log(log_handle, 20000, distinct_ips=500, gap_rate=0.01, max_gap=30, malformed_rate=0.01,
+                               seed=2)
+        self.log = log_handle.getvalue()
+
+    def test_same_output_as_stream(self):
+        for interval, queue_size in [(1, 1), (5, 2), (60, 8)]:
+            expected = StringIO()
+            sessionize.process_data_stream(StringIO(self.log), StringIO('%d\n' % interval), expected)
+            output_handle = StringIO()
+            pipeline_stats = {}
+            pipelined_sessionization.process_data_stream_pipelined(StringIO(self.log), StringIO('%d\n' % interval),
+                                                                   output_handle, pipeline_stats,
+                                                                   queue_size=queue_size)
+            self.assertEqual(output_handle.getvalue(), expected.getvalue())
+
+            self.assertListEqual(sorted(pipeline_stats), sorted(pipelined_sessionization.STAGES))
+            self.assertEqual(pipeline_stats['read']['items'], len(self.log) - len(self.log.split('\n', 1)[0]) - 1)
+            self.assertEqual(pipeline_stats['parse']['items'], pipeline_stats['session']['items'])
+            self.assertEqual(pipeline_stats['write']['items'], len(expected.getvalue().splitlines()))
+            self.assertLessEqual(pipeline_stats['parse']['peak_queue_depth'], queue_size)
+
+    def test_errors(self):
+        with self.assertRaises(OSError):
+            pipelined_sessionization.process_data_stream_pipelined(FailingInput(self.log), StringIO('2\n'),
+                                                                   StringIO(), queue_size=1)
+        with self.assertRaises(OSError):
+            pipelined_sessionization.process_data_stream_pipelined(StringIO(self.log), StringIO('2\n'),
+                                                                   FailingOutput(), queue_size=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
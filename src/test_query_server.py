@@ -0,0 +1,85 @@
+import json
+import unittest
+from urllib.request import urlopen
+from urllib.error import HTTPError
+import query_server
+import sessionization as sessionize
+from io import StringIO
+from test_helpers import HEADER, make_record
+
+
+class TestQueryServer(unittest.TestCase):
+
+    def test_index(self):
+        store = query_server.IndexedSessionStore()
+        expiration_dict, expiration_heap = {}, []
+        for ip, date_time in [('a', 10), ('b', 10), ('c', 20), ('a', 25), ('d', 30)]:
+            sessionize.add_request(ip, date_time, 0, 100, store, expiration_dict, expiration_heap)
+        store.latest_date_time = 30
+        self.assertDictEqual({start: ips for start, ips in store.starts.items()}, {10: {'a', 'b'}, 20: {'c'},
+                                                                                   30: {'d'}})
+        self.assertListEqual([ip for ip, _ in store.open_longer_than(5)], ['a', 'b', 'c'])
+        self.assertListEqual([ip for ip, _ in store.open_longer_than(15)], ['a', 'b'])
+        self.assertListEqual([ip for ip, _ in store.open_longer_than(5, limit=1)], ['a'])
+        self.assertEqual(store.open_longer_than(5)[0][1].end, 25)
+
+        store.pop('a')
+        self.assertIsNone(store.pop('a', None))
+        self.assertDictEqual(store.starts, {10: {'b'}, 20: {'c'}, 30: {'d'}})
+        store.pop('b')
+        self.assertNotIn(10, store.starts)
+        self.assertListEqual([ip for ip, _ in store.open_longer_than(5)], ['c'])
+        with self.assertRaises(KeyError):
+            store.pop('b')
+
+        # a start time out of order is put at its place
+        sessionize.add_request('e', 15, 0, 100, store, expiration_dict, expiration_heap)
+        self.assertListEqual(store.start_times, [15, 20, 30])
+        self.assertListEqual([ip for ip, _ in store.open_longer_than(5)], ['e', 'c'])
+        store.pop('c')
+        self.assertListEqual(store.start_times, [15, 30])
+
+    def test_process_data_stream(self):
+        # the sessions and the output are the same as with a dict
+        log = HEADER + ''.join(make_record('ip%d' % (second % 7), second) for second in range(0, 300, 3))
+        expected = StringIO()
+        sessionize.process_data_stream(StringIO(log), StringIO('10\n'), expected)
+        store = query_server.IndexedSessionStore()
+        output = StringIO()
+        sessionize.process_data_stream(StringIO(log), StringIO('10\n'), output, session_store=store)
+        self.assertEqual(output.getvalue(), expected.getvalue())
+        self.assertEqual(len(store), 0)
+        self.assertDictEqual(store.starts, {})
+        self.assertEqual(store.latest_date_time, sessionize.parse_timestamp('2017-06-30', '00:04:57'))
+
+    def test_queries(self):
+        store = query_server.IndexedSessionStore()
+        expiration_dict, expiration_heap = {}, []
+        start = sessionize.parse_timestamp('2017-06-30', '00:00:00')
+        for ip, seconds in [('1.2.3.4', 0), ('1.2.3.4', 4), ('5.6.7.8', 60)]:
+            sessionize.add_request(ip, start + seconds, 0, 100, store, expiration_dict, expiration_heap)
+        store.latest_date_time = start + 60
+        server = query_server.QueryServer(store)
+        url = 'http://%s:%d' % server.address
+        try:
+            with urlopen(url + '/count') as response:
+                self.assertDictEqual(json.loads(response.read().decode('utf-8')),
+                                     {'now': '2017-06-30 00:01:00', 'open_sessions': 2})
+            with urlopen(url + '/session?ip=1.2.3.4') as response:
+                self.assertDictEqual(json.loads(response.read().decode('utf-8'))['session'],
+                                     {'ip': '1.2.3.4', 'start': '2017-06-30 00:00:00', 'end': '2017-06-30 00:00:04',
+                                      'duration': 5, 'requests': 2})
+            with urlopen(url + '/sessions?open_longer_than=30') as response:
+                self.assertListEqual([session['ip'] for session in json.loads(response.read().decode('utf-8'))
+                                      ['sessions']], ['1.2.3.4'])
+            for query, status in [('/session?ip=9.9.9.9', 404), ('/sessions?open_longer_than=x', 400), ('/x', 404)]:
+                with self.assertRaises(HTTPError) as context:
+                    urlopen(url + query)
+                self.assertEqual(context.exception.code, status)
+                context.exception.close()
+        finally:
+            server.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import random
+import unittest
+import benchmark
+import reorder_buffer
+import sessionization as sessionize
+from io import StringIO
+from test_helpers import HEADER, make_record
+
+
+class TestReorderBuffer(unittest.TestCase):
+
+    def test_reorder(self):
+        requests = [('a', 10, 0), ('b', 12, 0), ('c', 11, 1), ('d', 12, 2), ('e', 15, 0), ('f', 10, 1),
+                    ('g', 14, 2), ('h', 16, 0)]
+        buffer = reorder_buffer.ReorderBuffer(2)
+        self.assertListEqual(list(buffer.reorder(requests)),
+                             [('a', 10, 0), ('c', 11, 0), ('b', 12, 0), ('d', 12, 1), ('g', 14, 0), ('e', 15, 0),
+                              ('h', 16, 0)])
+        self.assertEqual(buffer.late, 3)
+        self.assertEqual(buffer.dropped, 1)     # f is older than c, released when e arrived
+        self.assertEqual(buffer.peak_buffered, 4)
+
+        # the values of a request are released along with it
+        buffer = reorder_buffer.ReorderBuffer(1)
+        self.assertListEqual(list(buffer.reorder([('a', 11, 0, ('x',)), ('b', 10, 0, ('y',))])),
+                             [('b', 10, 0, ('y',)), ('a', 11, 0, ('x',))])
+
+    def test_chronological_input_is_unchanged(self):
+        log_handle = StringIO()
+        benchmark.generate_log(log_handle, 3000, distinct_ips=200, gap_rate=0.01, max_gap=30, seed=3)
+        expected = StringIO()
+        sessionize.process_data_stream(StringIO(log_handle.getvalue()), StringIO('5\n'), expected)
+        for lateness in [0, 10]:
+            buffer = reorder_buffer.ReorderBuffer(lateness)
+            output_handle = StringIO()
+            sessionize.process_data_stream(StringIO(log_handle.getvalue()), StringIO('5\n'), output_handle,
+                                           reorder_buffer=buffer)
+            self.assertEqual(output_handle.getvalue(), expected.getvalue())
+            self.assertEqual(buffer.late, 0)
+
+    def test_shuffled_input(self):
+        rng = random.Random(7)
+        records = [(rng.choice('abcdefgh'), second) for second in range(300) for _ in range(rng.randint(0, 3))]
+        expected = StringIO()
+        sessionize.process_data_stream(StringIO(HEADER + ''.join(make_record(*r) for r in records)),
+                                       StringIO('4\n'), expected)
+
+        # every record is delayed by at most 5 seconds
+        shuffled = sorted(records, key=lambda r: r[1] + rng.randint(0, 5))
+        buffer = reorder_buffer.ReorderBuffer(5)
+        output_handle = StringIO()
+        sessionize.process_data_stream(StringIO(HEADER + ''.join(make_record(*r) for r in shuffled)),
+                                       StringIO('4\n'), output_handle, reorder_buffer=buffer)
+        self.assertGreater(buffer.late, 0)
+        self.assertEqual(buffer.dropped, 0)
+        # the sessions are the same, only the order of the requests of the same second may differ
+        self.assertEqual(sorted(output_handle.getvalue().splitlines()), sorted(expected.getvalue().splitlines()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+import benchmark
+import aggregators
+import session_database
+import sessionization as sessionize
+from io import StringIO
+
+
+class TestSessionDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'sessions.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_same_sessions_as_output_file(self):
+        log_handle = StringIO()
+        benchmark.generate_log(log_handle, 5000, distinct_ips=300, gap_rate=0.01, max_gap=30, seed=3)
+        expected = StringIO()
+        sessionize.process_data_stream(StringIO(log_handle.getvalue()), StringIO('5\n'), expected)
+        output_handle, = sessionize.open_files([(self.path, 'w')])
+        self.assertIsInstance(output_handle, session_database.SessionDatabase)
+        sessionize.process_data_stream(StringIO(log_handle.getvalue()), StringIO('5\n'), output_handle)
+        output_handle.close()
+
+        expected_lines = expected.getvalue().splitlines(True)
+        rows = session_database.query_sessions(self.path)
+        self.assertListEqual(sorted(session_database.format_row(row) for row in rows), sorted(expected_lines))
+        self.assertListEqual([row[1] for row in rows], sorted(row[1] for row in rows))
+
+        ip = expected_lines[0].split(',')[0]
+        self.assertListEqual([session_database.format_row(row) for row in session_database.query_sessions(
+                             self.path, ip=ip)], sorted((line for line in expected_lines if line.startswith(ip + ',')),
+                                                        key=lambda line: line.split(',')[1]))
+        start_from, start_to = rows[10][1], rows[20][1][:16]
+        self.assertListEqual(session_database.query_sessions(self.path, start_from=start_from, start_to=start_to),
+                             [row for row in rows if start_from <= row[1] < start_to])
+        self.assertEqual(len(session_database.query_sessions(self.path, limit=3)), 3)
+
+        # the output replaces an existing database
+        output_handle, = sessionize.open_files([(self.path, 'w')])
+        output_handle.close()
+        self.assertListEqual(session_database.query_sessions(self.path), [])
+
+    def test_write(self):
+        database = session_database.SessionDatabase(self.path)
+        database.write('a,2017-06-30 00:00:00,2017-06-30 00:00:01,2,3\nb,2017-06-30 00:00:00,2017-06-')
+        database.write('30 00:00:00,1,1\nc,2017-06-30 00:00:02,2017-06-30 00:00:02,1,1')
+        database.flush()
+        self.assertEqual(len(session_database.query_sessions(self.path)), 2)
+        database.close()
+        self.assertListEqual(session_database.query_sessions(self.path),
+                             [('a', '2017-06-30 00:00:00', '2017-06-30 00:00:01', 2, 3, None),
+                              ('b', '2017-06-30 00:00:00', '2017-06-30 00:00:00', 1, 1, None),
+                              ('c', '2017-06-30 00:00:02', '2017-06-30 00:00:02', 1, 1, None)])
+        self.assertRaises(ValueError, session_database.query_sessions, os.path.join(self.temp_dir, 'missing.db'))
+
+    def test_aggregates(self):
+        log = ('ip,date,time,zone,cik,accession,extention,code,size\n'
+               'a,2017-06-30,00:00:00,0.0,1.0,x,.txt,200.0,10.0\n'
+               'a,2017-06-30,00:00:01,0.0,1.0,y,.txt,200.0,5.0\n')
+        expected = StringIO()
+        sessionize.process_data_stream(StringIO(log), StringIO('2\n'), expected,
+                                       aggregators=aggregators.SessionAggregators(['sum_size']))
+        database = session_database.SessionDatabase(self.path)
+        sessionize.process_data_stream(StringIO(log), StringIO('2\n'), database,
+                                       aggregators=aggregators.SessionAggregators(['sum_size']))
+        database.close()
+        rows = session_database.query_sessions(self.path)
+        self.assertIsNotNone(rows[0][5])
+        self.assertEqual(''.join(session_database.format_row(row) for row in rows), expected.getvalue())
+
+    def test_parse_arguments(self):
+        with self.assertRaises(SystemExit):
+            sessionize.parse_arguments(['log.csv', 'inactivity_period.txt', self.path, '-checkpoint', 'state'])
+        args = session_database.parse_arguments([self.path, '-ip', 'a', '-start_from', '2017-06-30'])
+        self.assertEqual((args.ip, args.start_from, args.start_to), ('a', '2017-06-30', None))
+
+
+if __name__ == '__main__':
+    unittest.main()
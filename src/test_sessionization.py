@@ -1,20 +1,21 @@
+import sys
 import unittest
 import sessionization as sessionize
 from datetime import datetime
-from datetime import timedelta
+from io import BytesIO
 from io import StringIO
 
 
 class TestSerialization(unittest.TestCase):
 
     def setUp(self):
-        self.time0 = datetime.strptime('2017-06-30 00:00:00', '%Y-%m-%d %H:%M:%S')
-        self.time1 = datetime.strptime('2017-06-30 00:00:01', '%Y-%m-%d %H:%M:%S')
-        self.time2 = datetime.strptime('2017-06-30 00:00:02', '%Y-%m-%d %H:%M:%S')
-        self.time3 = datetime.strptime('2017-06-30 00:00:03', '%Y-%m-%d %H:%M:%S')
-        self.time4 = datetime.strptime('2017-06-30 00:00:04', '%Y-%m-%d %H:%M:%S')
-        self.time5 = datetime.strptime('2017-06-30 00:00:05', '%Y-%m-%d %H:%M:%S')
-        self.time6 = datetime.strptime('2017-06-30 00:00:06', '%Y-%m-%d %H:%M:%S')
+        self.time0 = sessionize.parse_timestamp('2017-06-30', '00:00:00')
+        self.time1 = sessionize.parse_timestamp('2017-06-30', '00:00:01')
+        self.time2 = sessionize.parse_timestamp('2017-06-30', '00:00:02')
+        self.time3 = sessionize.parse_timestamp('2017-06-30', '00:00:03')
+        self.time4 = sessionize.parse_timestamp('2017-06-30', '00:00:04')
+        self.time5 = sessionize.parse_timestamp('2017-06-30', '00:00:05')
+        self.time6 = sessionize.parse_timestamp('2017-06-30', '00:00:06')
 
     def test_extract_required_fields_order(self):
         self.assertEqual(sessionize.extract_required_fields_order(
@@ -29,6 +30,53 @@ class TestSerialization(unittest.TestCase):
                 'ip,date,time,zone,cik,accession,extention,code,size,idx,norefer,noagent,find,crawler,browser',
                 ['ip', 'date', 't', 'cik', 'accession'])
 
+    def test_parse_timestamp(self):
+        self.assertEqual(sessionize.parse_timestamp('1970-01-01', '00:00:00'), 0)
+        self.assertEqual(sessionize.parse_timestamp('2017-06-30', '00:00:00'), 1498780800)
+        self.assertEqual(sessionize.parse_timestamp('2017-06-30', '00:00:00'), 1498780800)  # cached
+        self.assertEqual(sessionize.parse_timestamp('2017-06-30', '23:59:59'), 1498867199)
+        self.assertEqual(sessionize.parse_timestamp('2016-02-29', '12:30:05'), 1456749005)
+        # forms which strptime accepts are still accepted by the slow path
+        self.assertEqual(sessionize.parse_timestamp('2017-6-30', '1:05:12'), 1498784712)
+        for d, t in [('2017-06--28', '00:00:00'), ('2017-02-29', '00:00:00'), ('2017-13-01', '00:00:00'),
+                     ('2017-06-30', '24:00:00'), ('2017-06-30', '00:60:00'), ('2017-06-30', '00:00:60'),
+                     (' 2017-06-30 ', '2:00:00 '), ('2017-06-30', 'xx:yy:zz'), ('', '')]:
+            with self.assertRaises(ValueError):
+                sessionize.parse_timestamp(d, t)
+
+    def test_format_timestamp(self):
+        self.assertEqual(sessionize.format_timestamp(0), '1970-01-01 00:00:00')
+        self.assertEqual(sessionize.format_timestamp(1498867199), '2017-06-30 23:59:59')
+        for d, t in [('2017-06-30', '00:00:00'), ('2016-02-29', '12:30:05'), ('1999-12-31', '23:59:59')]:
+            self.assertEqual(sessionize.format_timestamp(sessionize.parse_timestamp(d, t)), d + ' ' + t)
+        self.assertEqual(sessionize.format_timestamp(sessionize.parse_timestamp('2017-06-30', '00:00:00') + 86400),
+                         datetime(2017, 7, 1).isoformat(' '))
+
+    def test_format_timestamp_cache(self):
+        cache_size = sessionize.TIMESTAMP_CACHE_SIZE
+        sessionize.TIMESTAMP_CACHE_SIZE = 3
+        sessionize._timestamp_strings.clear()
+        try:
+            for seconds in range(self.time0, self.time0 + 10):
+                self.assertEqual(sessionize.format_timestamp(seconds), sessionize.format_timestamp(seconds))
+                self.assertLessEqual(len(sessionize._timestamp_strings), 3)
+            self.assertEqual(sessionize.format_timestamp(self.time6), '2017-06-30 00:00:06')
+        finally:
+            sessionize.TIMESTAMP_CACHE_SIZE = cache_size
+
+    def test_output_buffer(self):
+        output_handle = StringIO()
+        output_buffer = sessionize.OutputBuffer(output_handle, buffer_size=3)
+        output_buffer.write('a\n')
+        output_buffer.write('b\n')
+        self.assertEqual(output_handle.getvalue(), '')
+        output_buffer.write('c\n')
+        self.assertEqual(output_handle.getvalue(), 'a\nb\nc\n')
+        output_buffer.write('d\n')
+        output_buffer.flush()
+        output_buffer.flush()
+        self.assertEqual(output_handle.getvalue(), 'a\nb\nc\nd\n')
+
     def test_check_field_validity_and_cleanup(self):
         ip, d, t, cik, accession, extention, last_date_time = (
             '121.40.65.ebc', '2017-06--28', '00:00:00', '1592016.0', '0000899243-17-017281', '-index.htm', None)
@@ -45,7 +93,7 @@ class TestSerialization(unittest.TestCase):
         chk = sessionize.check_field_validity_and_cleanup(ip, d, t, cik, accession, extention, last_date_time)
         self.assertFalse(chk[0])
 
-        tmp_datetime = datetime(2017, 6, 28)
+        tmp_datetime = sessionize.parse_timestamp('2017-06-28', '00:00:00')
         ip, d, t, cik, accession, extention, last_date_time = (
             '121.40.65.ebc', '2017-06-28', '00:00:00', '1592016.0', '0000899243-17-017281', '-index.htm', None)
         chk = sessionize.check_field_validity_and_cleanup(ip, d, t, cik, accession, extention, last_date_time)
@@ -53,7 +101,7 @@ class TestSerialization(unittest.TestCase):
         self.assertTupleEqual(chk[1],
                               ('121.40.65.ebc', tmp_datetime, '1592016.0', '0000899243-17-017281', '-index.htm'))
 
-        tmp_datetime = datetime(2017, 6, 28)
+        tmp_datetime = sessionize.parse_timestamp('2017-06-28', '00:00:00')
         ip, d, t, cik, accession, extention, last_date_time = (
             ' 121.40.65.ebc ', ' 2017-06-28 ', '2:00:00 ', '   1592016.0', '0000899243-17-017281  ', ' -index.htm',
             tmp_datetime)
@@ -79,6 +127,42 @@ class TestSerialization(unittest.TestCase):
                               ('121.40.65.ebc', '2017-06-28', '00:00:00', '1592016.0', '0000899243-17-017281',
                                '-index.htm'))
 
+        self.assertTupleEqual(sessionize.extract_required_fields('121.40.65.ebc,2017-06-28', req_fields),
+                              ('', '', '', '', '', ''))
+
+    def test_read_blocks(self):
+        records = 'ab,c\nde\r\nf\ngh'
+        for block_size in [1, 3, 1 << 20]:
+            self.assertListEqual(''.join(b for b, _ in sessionize.read_blocks(StringIO(records), block_size)).split('\n'),
+                                 ['ab,c', 'de\r', 'f', 'gh'])
+            blocks = list(sessionize.read_blocks(BytesIO(records.encode('utf-8')), block_size))
+            self.assertEqual(''.join(b for b, _ in blocks), 'ab,c\nde\nf\ngh')
+            for block, offset in blocks:
+                self.assertIn(offset, [5, 9, 11, 13])
+            self.assertEqual(blocks[-1][1], 13)
+
+    def test_read_requests(self):
+        req_fields = {'ip': 0, 'date': 1, 'time': 2, 'cik': 4, 'accession': 5, 'extention': 6, 'size': 8}
+        records = ('a,2017-06-30,00:00:00,0.0,1.0,x ,.txt,200.0, 10.0\n' +
+                   'b,2017-06-30,00:00:00,0.0,2.0,y,.txt\n' +
+                   ' ,2017-06-30,00:00:01,0.0,3.0,z,.txt,200.0,3.0\n' +
+                   'b,2017-06-30,bad,0.0,2.0,y,.txt,200.0,4.0\n')
+        self.assertListEqual(list(sessionize.read_requests(StringIO(records), req_fields)),
+                             [('a', self.time0, 0), ('b', self.time0, 1), ('b', self.time0, 2)])
+        self.assertListEqual(list(sessionize.read_requests(StringIO(records), req_fields, value_fields=[]))[:2],
+                             [('a', self.time0, 0, ('1.0', 'x', '.txt')), ('b', self.time0, 1, ('2.0', 'y', '.txt'))])
+        # a record without a value field is too short, a value field missing from the header is empty
+        self.assertListEqual(list(sessionize.read_requests(StringIO(records), req_fields,
+                                                           value_fields=['crawler', 'size'])),
+                             [('a', self.time0, 0, ('1.0', 'x', '.txt', '', '10.0')),
+                              ('b', self.time0, 1, ('2.0', 'y', '.txt', '', '4.0'))])
+
+        # only the fields up to the last required one are split, in any order of the header
+        req_fields = {'ip': 6, 'date': 1, 'time': 0, 'cik': 3, 'accession': 4, 'extention': 2}
+        records = '00:00:00,2017-06-30,-index.htm,1592016.0,0000899243-17-017281,301.0,121.40.65.ebc,1,2\n'
+        self.assertListEqual(list(sessionize.read_requests(StringIO(records), req_fields, value_fields=[])),
+                             [('121.40.65.ebc', self.time0, 0, ('1592016.0', '0000899243-17-017281', '-index.htm'))])
+
     def test_get_order_of_required_fields(self):
         input_handle = StringIO(
             'ip,date,time,zone,cik,accession,extention,code,size,idx,norefer,noagent,find,crawler,browser\n' +
@@ -95,68 +179,125 @@ class TestSerialization(unittest.TestCase):
                              dict(zip(['ip', 'date', 'time', 'cik', 'accession', 'extention'],
                                       [0, 9, 5, 2, 3, 4])))
 
+        input_handle = StringIO('zone,cik,accession,time,date,ip,extention\n')
+        self.assertDictEqual(sessionize.get_order_of_required_fields(input_handle),
+                             dict(zip(['ip', 'date', 'time', 'cik', 'accession', 'extention'],
+                                      [5, 4, 3, 1, 2, 6])))
+
+        # an optional field is only in the dictionary if the header has it
+        self.assertDictEqual(sessionize.get_order_of_required_fields(StringIO('zone,cik,accession,time,date,ip,'
+                                                                              'extention,crawler\n'),
+                                                                     ['crawler', 'noagent']),
+                             dict(zip(['ip', 'date', 'time', 'cik', 'accession', 'extention', 'crawler'],
+                                      [5, 4, 3, 1, 2, 6, 7])))
+
     def test_write_closed_sessions(self):
         inactivity_interval = 2
 
-        request_dict = {'101.81.133.jja': [self.time0, self.time0, 1, 1],
-                        '107.23.85.jfd': [self.time0, self.time0, 2, 2]}
+        request_dict = {'101.81.133.jja': sessionize.Session(self.time0, self.time0, 1, 1),
+                        '107.23.85.jfd': sessionize.Session(self.time0, self.time0, 2, 2)}
         expiration_dict = {self.time2: ['101.81.133.jja', '107.23.85.jfd']}
         output_handle = StringIO()
-        sessionize.write_closed_sessions(output_handle, self.time0, self.time0 - timedelta(seconds=1),
-                                         inactivity_interval, request_dict, expiration_dict)
+        sessionize.write_closed_sessions(output_handle, self.time0, inactivity_interval, request_dict,
+                                         expiration_dict, sorted(expiration_dict))
         self.assertEqual(output_handle.getvalue(), '')
 
-        request_dict = {'101.81.133.jja': [self.time0, self.time0, 1, 1],
-                        '107.23.85.jfd': [self.time0, self.time1, 3, 2],
-                        '108.91.91.hbc': [self.time1, self.time1, 1, 1]}
+        request_dict = {'101.81.133.jja': sessionize.Session(self.time0, self.time0, 1, 1),
+                        '107.23.85.jfd': sessionize.Session(self.time0, self.time1, 3, 2),
+                        '108.91.91.hbc': sessionize.Session(self.time1, self.time1, 1, 1)}
         expiration_dict = {self.time2: ['101.81.133.jja', '107.23.85.jfd'],
                            self.time3: ['107.23.85.jfd', '108.91.91.hbc']}
         output_handle = StringIO()
-        sessionize.write_closed_sessions(output_handle, self.time1, self.time1 - timedelta(seconds=1),
-                                         inactivity_interval, request_dict, expiration_dict)
+        sessionize.write_closed_sessions(output_handle, self.time1, inactivity_interval, request_dict,
+                                         expiration_dict, sorted(expiration_dict))
         self.assertEqual(output_handle.getvalue(), '')
 
-        request_dict = {'101.81.133.jja': [self.time0, self.time0, 1, 1],
-                        '107.23.85.jfd': [self.time0, self.time1, 3, 2],
-                        '108.91.91.hbc': [self.time1, self.time1, 1, 1],
-                        '106.120.173.jie': [self.time2, self.time2, 1, 1],
-                        '107.178.195.aag': [self.time2, self.time2, 1, 2]}
+        request_dict = {'101.81.133.jja': sessionize.Session(self.time0, self.time0, 1, 1),
+                        '107.23.85.jfd': sessionize.Session(self.time0, self.time1, 3, 2),
+                        '108.91.91.hbc': sessionize.Session(self.time1, self.time1, 1, 1),
+                        '106.120.173.jie': sessionize.Session(self.time2, self.time2, 1, 1),
+                        '107.178.195.aag': sessionize.Session(self.time2, self.time2, 1, 2)}
         expiration_dict = {self.time2: ['101.81.133.jja', '107.23.85.jfd'],
                            self.time3: ['107.23.85.jfd', '108.91.91.hbc'],
                            self.time4: ['106.120.173.jie', '107.178.195.aag']}
         output_handle = StringIO()
-        sessionize.write_closed_sessions(output_handle, self.time2, self.time2 - timedelta(seconds=1),
-                                         inactivity_interval, request_dict, expiration_dict)
+        sessionize.write_closed_sessions(output_handle, self.time2, inactivity_interval, request_dict,
+                                         expiration_dict, sorted(expiration_dict))
         self.assertEqual(output_handle.getvalue(), '101.81.133.jja,2017-06-30 00:00:00,2017-06-30 00:00:00,1,1\n')
-        self.assertDictEqual(request_dict, {'107.23.85.jfd': [self.time0, self.time1, 3, 2],
-                                            '108.91.91.hbc': [self.time1, self.time1, 1, 1],
-                                            '106.120.173.jie': [self.time2, self.time2, 1, 1],
-                                            '107.178.195.aag': [self.time2, self.time2, 1, 2]})
+        self.assertDictEqual(request_dict, {'107.23.85.jfd': sessionize.Session(self.time0, self.time1, 3, 2),
+                                            '108.91.91.hbc': sessionize.Session(self.time1, self.time1, 1, 1),
+                                            '106.120.173.jie': sessionize.Session(self.time2, self.time2, 1, 1),
+                                            '107.178.195.aag': sessionize.Session(self.time2, self.time2, 1, 2)})
         self.assertDictEqual(expiration_dict, {self.time3: ['107.23.85.jfd', '108.91.91.hbc'],
                                                self.time4: ['106.120.173.jie', '107.178.195.aag']})
 
-        request_dict = {'107.23.85.jfd': [self.time0, self.time3, 4, 2],
-                        '108.91.91.hbc': [self.time1, self.time1, 1, 1],
-                        '106.120.173.jie': [self.time2, self.time2, 1, 1],
-                        '107.178.195.aag': [self.time2, self.time2, 1, 2]}
+        request_dict = {'107.23.85.jfd': sessionize.Session(self.time0, self.time3, 4, 2),
+                        '108.91.91.hbc': sessionize.Session(self.time1, self.time1, 1, 1),
+                        '106.120.173.jie': sessionize.Session(self.time2, self.time2, 1, 1),
+                        '107.178.195.aag': sessionize.Session(self.time2, self.time2, 1, 2)}
         expiration_dict = {self.time3: ['107.23.85.jfd', '108.91.91.hbc'],
                            self.time4: ['106.120.173.jie', '107.178.195.aag'],
                            self.time5: ['107.23.85.jfd']}
         output_handle = StringIO()
-        sessionize.write_closed_sessions(output_handle, self.time3, self.time3 - timedelta(seconds=1),
-                                         inactivity_interval, request_dict, expiration_dict)
+        sessionize.write_closed_sessions(output_handle, self.time3, inactivity_interval, request_dict,
+                                         expiration_dict, sorted(expiration_dict))
         self.assertEqual(output_handle.getvalue(), '108.91.91.hbc,2017-06-30 00:00:01,2017-06-30 00:00:01,1,1\n')
-        self.assertDictEqual(request_dict, {'107.23.85.jfd': [self.time0, self.time3, 4, 2],
-                                            '106.120.173.jie': [self.time2, self.time2, 1, 1],
-                                            '107.178.195.aag': [self.time2, self.time2, 1, 2]})
+        self.assertDictEqual(request_dict, {'107.23.85.jfd': sessionize.Session(self.time0, self.time3, 4, 2),
+                                            '106.120.173.jie': sessionize.Session(self.time2, self.time2, 1, 1),
+                                            '107.178.195.aag': sessionize.Session(self.time2, self.time2, 1, 2)})
         self.assertDictEqual(expiration_dict, {self.time4: ['106.120.173.jie', '107.178.195.aag'],
                                                self.time5: ['107.23.85.jfd']})
 
+    def test_write_closed_sessions_with_time_gap(self):
+        inactivity_interval = 2
+        request_dict = {'101.81.133.jja': sessionize.Session(self.time0, self.time0, 1, 1),
+                        '107.23.85.jfd': sessionize.Session(self.time0, self.time1, 3, 2),
+                        '108.91.91.hbc': sessionize.Session(self.time1, self.time1, 1, 1)}
+        expiration_dict = {self.time2: ['101.81.133.jja', '107.23.85.jfd'],
+                           self.time3: ['107.23.85.jfd', '108.91.91.hbc']}
+        expiration_heap = [self.time2, self.time3, self.time6]  # time6 has no entry in expiration_dict anymore
+        output_handle = StringIO()
+        sessionize.write_closed_sessions(output_handle, self.time0 + 86400, inactivity_interval,
+                                         request_dict, expiration_dict, expiration_heap)
+        self.assertEqual(output_handle.getvalue(), '101.81.133.jja,2017-06-30 00:00:00,2017-06-30 00:00:00,1,1\n' +
+                                                   '107.23.85.jfd,2017-06-30 00:00:00,2017-06-30 00:00:01,2,3\n' +
+                                                   '108.91.91.hbc,2017-06-30 00:00:01,2017-06-30 00:00:01,1,1\n')
+        self.assertDictEqual(request_dict, {})
+        self.assertDictEqual(expiration_dict, {})
+        self.assertListEqual(expiration_heap, [])
+
+    def test_add_request(self):
+        inactivity_interval = 2
+        request_dict = {}
+        expiration_dict = {}
+        expiration_heap = []
+        for ip, date_time, counter in [('101.81.133.jja', self.time0, 0), ('107.23.85.jfd', self.time0, 1),
+                                       ('107.23.85.jfd', self.time0, 2), ('107.23.85.jfd', self.time1, 0)]:
+            sessionize.add_request(ip, date_time, counter, inactivity_interval, request_dict, expiration_dict,
+                                   expiration_heap)
+        self.assertDictEqual(request_dict, {'101.81.133.jja': sessionize.Session(self.time0, self.time0, 1, 0),
+                                            '107.23.85.jfd': sessionize.Session(self.time0, self.time1, 3, 1)})
+        # a second request of the same ip in the same second does not add the ip to a bucket again
+        self.assertDictEqual(expiration_dict, {self.time2: ['101.81.133.jja', '107.23.85.jfd'],
+                                               self.time3: ['107.23.85.jfd']})
+        self.assertListEqual(expiration_heap, [self.time2, self.time3])
+
+    def test_get_session_store_size(self):
+        request_dict = {'101.81.133.jja': sessionize.Session(self.time0, self.time0, 1, 1),
+                        '107.23.85.jfd': sessionize.Session(self.time0, self.time1, 3, 2)}
+        expiration_dict = {self.time2: ['101.81.133.jja', '107.23.85.jfd'],
+                           self.time3: ['107.23.85.jfd']}
+        size, open_sessions = sessionize.get_session_store_size(request_dict, expiration_dict, [self.time2, self.time3])
+        self.assertEqual(open_sessions, 2)
+        self.assertGreater(size, 2 * sys.getsizeof(request_dict['107.23.85.jfd']))
+        self.assertEqual(sessionize.get_session_store_size({}, {}, []),
+                         (sys.getsizeof({}) * 2 + sys.getsizeof([]), 0))
+
     def test_write_remaining_sessions(self):
-        request_dict = {'107.23.85.jfd': [self.time0, self.time3, 4, 2],
-                        '106.120.173.jie': [self.time2, self.time2, 1, 1],
-                        '107.178.195.aag': [self.time2, self.time4, 2, 2],
-                        '108.91.91.hbc': [self.time4, self.time4, 1, 1]}
+        request_dict = {'107.23.85.jfd': sessionize.Session(self.time0, self.time3, 4, 2),
+                        '106.120.173.jie': sessionize.Session(self.time2, self.time2, 1, 1),
+                        '107.178.195.aag': sessionize.Session(self.time2, self.time4, 2, 2),
+                        '108.91.91.hbc': sessionize.Session(self.time4, self.time4, 1, 1)}
         expiration_dict = {self.time4: ['106.120.173.jie', '107.178.195.aag'],
                            self.time5: ['107.23.85.jfd'],
                            self.time6: ['107.178.195.aag']}
@@ -186,7 +327,11 @@ class TestSerialization(unittest.TestCase):
 
         inactivity_handle = StringIO('2\n')
 
-        sessionize.process_data_stream(input_handle, inactivity_handle, output_handle)
+        memory_stats = {}
+        sessionize.process_data_stream(input_handle, inactivity_handle, output_handle, memory_stats)
+        self.assertEqual(memory_stats['peak_open_sessions'], 5)
+        self.assertEqual(memory_stats['open_sessions'], 4)
+        self.assertGreater(memory_stats['bytes'], 0)
         self.assertEqual(output_handle.getvalue(), '101.81.133.jja,2017-06-30 00:00:00,2017-06-30 00:00:00,1,1\n' +
                                                    '108.91.91.hbc,2017-06-30 00:00:01,2017-06-30 00:00:01,1,1\n' +
                                                    '107.23.85.jfd,2017-06-30 00:00:00,2017-06-30 00:00:03,4,4\n' +
@@ -256,6 +401,38 @@ class TestSerialization(unittest.TestCase):
         inactivity_handle = StringIO('86400\n')
         self.assertEqual(sessionize.get_inactivity_interval(inactivity_handle), 86400)
 
+    def test_get_inactivity_intervals(self):
+        self.assertListEqual(sessionize.get_inactivity_intervals(StringIO('2\n')), [2])
+        self.assertListEqual(sessionize.get_inactivity_intervals(StringIO('2\n60, 600\n\n2\n3600')),
+                             [2, 60, 600, 3600])
+        for text in ['', '2\n0\n', '2,86401\n', '2,x\n']:
+            with self.assertRaises(ValueError):
+                sessionize.get_inactivity_intervals(StringIO(text))
+
+    def test_get_sweep_output_path(self):
+        self.assertEqual(sessionize.get_sweep_output_path('output/sessionization.txt', 60),
+                         'output/sessionization_60.txt')
+        self.assertEqual(sessionize.get_sweep_output_path('sessionization.txt.gz', 2), 'sessionization_2.txt.gz')
+        self.assertEqual(sessionize.get_sweep_output_path('sessionization', 2), 'sessionization_2')
+
+    def test_process_data_stream_sweep(self):
+        log = ('ip,date,time,zone,cik,accession,extention,code,size\n' +
+               '101.81.133.jja,2017-06-30,00:00:00,0.0,1608552.0,0001047469-17-004337,-index.htm,200.0,80251.0\n' +
+               '107.23.85.jfd,2017-06-30,00:00:00,0.0,1027281.0,0000898430-02-001167,-index.htm,200.0,2825.0\n' +
+               '107.23.85.jfd,2017-06-30,00:00:01,0.0,841535.0,0000841535-98-000002,-index.html,200.0,2699.0\n' +
+               '108.91.91.hbc,2017-06-30,00:00:01,0.0,1295391.0,0001209784-17-000052,.txt,200.0,19884.0\n' +
+               '101.81.133.jja,2017-06-30,00:00:03,0.0,1608552.0,0001047469-17-004337,-index.htm,200.0,80251.0\n' +
+               '107.23.85.jfd,2017-06-30,bad,0.0,842814.0,0000842814-98-000001,-index.html,200.0,2690.0\n' +
+               '108.91.91.hbc,2017-06-30,00:00:06,0.0,1618174.0,0001140361-17-026711,.txt,301.0,674.0\n')
+        intervals = [1, 2, 5]
+        output_handles = [StringIO() for _ in intervals]
+        sessionize.process_data_stream_sweep(StringIO(log), intervals, output_handles)
+        for interval, output_handle in zip(intervals, output_handles):
+            expected = StringIO()
+            sessionize.process_data_stream(StringIO(log), StringIO('%d\n' % interval), expected)
+            self.assertEqual(output_handle.getvalue(), expected.getvalue())
+        self.assertNotEqual(output_handles[0].getvalue(), output_handles[2].getvalue())
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)
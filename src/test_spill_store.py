@@ -0,0 +1,83 @@
+import os
+import unittest
+import benchmark
+import spill_store
+import sessionization as sessionize
+from io import StringIO
+
+
+class TestSpillStore(unittest.TestCase):
+
+    def test_store(self):
+        store = spill_store.SpillingSessionStore(4)
+        try:
+            for i in range(10):
+                store['ip%d' % i] = sessionize.Session(i, i + (i % 3), 1, 0)
+            self.assertEqual(len(store), 10)
+            self.assertLessEqual(dict.__len__(store), 4)
+            self.assertGreater(store.spilled, 0)
+
+            # a spilled session is paged back in when it is looked up, within the cap
+            self.assertIn('ip0', store)
+            self.assertFalse(dict.__contains__(store, 'ip0'))
+            self.assertEqual(store['ip0'], sessionize.Session(0, 0, 1, 0))
+            self.assertTrue(dict.__contains__(store, 'ip0'))
+            self.assertEqual(store['ip1'], sessionize.Session(1, 2, 1, 0))
+            self.assertLessEqual(dict.__len__(store), 4)
+            self.assertEqual(store.pop('ip2'), sessionize.Session(2, 4, 1, 0))
+            self.assertIsNone(store.pop('ip2', None))
+            self.assertNotIn('ip2', store)
+            self.assertRaises(KeyError, store.__getitem__, 'ip2')
+            self.assertEqual(len(store), 9)
+
+            remaining = list(store.close_remaining_sessions())
+            self.assertListEqual([ip for ip, _ in remaining], ['ip%d' % i for i in range(10) if i != 2])
+            self.assertEqual(len(store), 0)
+        finally:
+            store.close()
+        self.assertFalse(os.path.exists(store.path))
+
+    def test_expiration_buckets(self):
+        store = spill_store.SpillingSessionStore(2)
+        expiration_dict, expiration_heap = {}, []
+        store.track(expiration_dict, 10)
+        try:
+            for ip, date_time in [('a', 0), ('a', 1), ('b', 2), ('c', 3)]:
+                sessionize.add_request(ip, date_time, 0, 10, store, expiration_dict, expiration_heap)
+            # the spilled session is out of the buckets, but its expiration time is kept
+            self.assertEqual(store.spilled, 1)
+            self.assertDictEqual(expiration_dict, {10: [], 11: [], 12: ['b'], 13: ['c']})
+
+            # its expiration is found on disk
+            self.assertListEqual([(date_time, ip) for date_time, ip, _ in sessionize.close_expired_sessions(
+                12, 10, store, expiration_dict, expiration_heap)], [(11, 'a'), (12, 'b')])
+            self.assertEqual(len(store), 1)
+
+            # a paged in session is put back in the bucket of its expiration time
+            sessionize.add_request('d', 4, 0, 10, store, expiration_dict, expiration_heap)
+            sessionize.add_request('e', 4, 1, 10, store, expiration_dict, expiration_heap)
+            self.assertEqual(store.spilled, 1)
+            sessionize.add_request('c', 3, 1, 10, store, expiration_dict, expiration_heap)
+            self.assertListEqual(expiration_dict[13], ['c'])
+            self.assertEqual(store['c'].count, 2)
+        finally:
+            store.close()
+
+    def test_same_output_as_in_memory(self):
+        log_handle = StringIO()
+        benchmark.generate_log(log_handle, 5000, distinct_ips=400, gap_rate=0.01, max_gap=30, malformed_rate=0.01,
+                               seed=5)
+        for interval in [1, 5, 60]:
+            expected = StringIO()
+            sessionize.process_data_stream(StringIO(log_handle.getvalue()), StringIO('%d\n' % interval), expected)
+            store = spill_store.SpillingSessionStore(10)
+            output_handle = StringIO()
+            sessionize.process_data_stream(StringIO(log_handle.getvalue()), StringIO('%d\n' % interval),
+                                           output_handle, session_store=store)
+            self.assertGreater(store.spill_passes, 0)
+            store.close()
+            self.assertEqual(output_handle.getvalue(), expected.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()